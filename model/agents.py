@@ -1,14 +1,14 @@
 # Importing necessary libraries
-import random
-import rasterio as rs
+import numpy as np
 from mesa import Agent
 from shapely.geometry import Point
 from shapely import contains_xy
 
 # Import functions from functions.py
-from functions import get_flood_map_data
-from functions import generate_random_location_within_map_domain, get_flood_depth, calculate_basic_flood_damage
-from functions import floodplain_multipolygon
+from functions import generate_random_location_within_map_domain, calculate_flood_damage
+from functions import geodata
+from flood_maps import get_flood_map
+from rng import draw_household_attributes
 
 
 # Define the Households agent class
@@ -19,70 +19,82 @@ class Households(Agent):
     In a real scenario, this would be based on actual geographical data or more complex logic.
     """
 
-    def __init__(self, unique_id, model, fine=0, discount_rate=0.99, max_trust_value=0.1, elevation_costs_per_square_metre=290):
+    def __init__(self, unique_id, model, fine=0, discount_rate=0.99, max_trust_value=0.1, elevation_costs_per_square_metre=290,
+                 location=None, in_floodplain=None, flood_depth_estimated=None, flood_depth_Harvey=None, attributes=None):
         super().__init__(unique_id, model)
         self.is_adapted = False  # Initial adaptation status set to False
 
         # getting flood map values
-        # Get a random location on the map
-        loc_x, loc_y = generate_random_location_within_map_domain()
-        self.location = Point(loc_x, loc_y)
+        # The location, floodplain check and flood depths can be given by the batch initialization of the model.
+        # Otherwise they are computed here for this household only.
+        if location is None:
+            # Get a random location on the map
+            loc_x, loc_y = generate_random_location_within_map_domain(model.streams.placement)
+            location = Point(loc_x, loc_y)
+        self.location = location
 
         # Check whether the location is within floodplain
-        self.in_floodplain = False
-        if contains_xy(geom=floodplain_multipolygon, x=self.location.x, y=self.location.y):
-            self.in_floodplain = True
+        if in_floodplain is None:
+            in_floodplain = bool(contains_xy(geom=geodata.floodplain_multipolygon, x=self.location.x, y=self.location.y))
+        self.in_floodplain = in_floodplain
 
         # Get the estimated flood depth at those coordinates. 
         # the estimated flood depth is calculated based on the flood map (i.e., past data) so this is not the
         # actual flood depth
         # Flood depth can be negative if the location is at a high elevation
-        self.flood_depth_estimated = get_flood_depth(corresponding_map=model.flood_map, location=self.location,
-                                                     band=model.band_flood_img)
-
-        flood_map_paths = {'harvey': r'../input_data/floodmaps/Harvey_depth_meters.tif',}
-        flood_map_path = flood_map_paths['harvey']
-        self.flood_map = rs.open(flood_map_path)
-        self.band_flood_img, self.bound_left, self.bound_right, self.bound_top, self.bound_bottom = get_flood_map_data(
-            self.flood_map)
-
-        self.flood_depth_Harvey = get_flood_depth(corresponding_map=self.flood_map, location=self.location,
-                                                     band=self.band_flood_img)
+        if flood_depth_estimated is None:
+            flood_depth_estimated = model.shared_flood_map.get_depth(self.location)
+        self.flood_depth_estimated = flood_depth_estimated
+
+        # the Harvey flood map is shared between all agents and is only opened once
+        if flood_depth_Harvey is None:
+            flood_depth_Harvey = get_flood_map('harvey', in_memory=model.flood_maps_in_memory).get_depth(self.location)
+        self.flood_depth_Harvey = flood_depth_Harvey
         # handle negative values of flood depth
         if self.flood_depth_estimated < 0:
             self.flood_depth_estimated = 0
 
         # calculate the estimated flood damage given the estimated flood depth. Flood damage is a factor between 0 and 1
-        self.flood_damage_estimated = calculate_basic_flood_damage(flood_depth=get_flood_depth(corresponding_map=model.flood_map, location=self.location,
-                                                     band=model.band_flood_img))
+        self.flood_damage_estimated = calculate_flood_damage(flood_depth_estimated, model.depth_damage_curve)
 
         # Add an attribute for the actual flood depth. This is set to zero at the beginning of the simulation since there is not flood yet
         # and will update its value when there is a shock (i.e., actual flood). Shock happens at some point during the simulation
         self.flood_depth_actual = 0
 
         # calculate the actual flood damage given the actual flood depth. Flood damage is a factor between 0 and 1
-        self.flood_damage_actual = calculate_basic_flood_damage(flood_depth=self.flood_depth_actual)
+        self.flood_damage_actual = calculate_flood_damage(self.flood_depth_actual, model.depth_damage_curve)
         self.flood_damage_final = 0
         self.whatif_damage = 0
         self.discount_rate = discount_rate
         self.elevation_costs_per_square_metre = elevation_costs_per_square_metre
         self.max_damage_dol_per_sqm = 1216.65  # extracted from model file
 
+        # The household attributes are drawn for all households at once by the model (see rng.draw_household_attributes).
+        # Otherwise they are drawn here from the attributes stream of the model
+        if attributes is None:
+            attributes = {name: values[0] for name, values in
+                          draw_household_attributes(1, max_trust_value, model.streams.attributes).items()}
         # range around average house size (159.14 square meters)
-        self.size_of_house = random.randrange(120, 200)
+        self.size_of_house = int(attributes['size_of_house'])
         # range around average quarterly income (17078)
-        self.income = random.randrange(13000, 22000)
+        self.income = int(attributes['income'])
         # start value of saved money (we could also randomize the 1.8)
         self.money_saved = self.income * 1.8
 
-        self.trust_factor = random.uniform(0,max_trust_value)
+        self.trust_factor = float(attributes['trust_factor'])
         self.fine = fine
-        self.taken_measures = random.triangular(0,0.8,0.1)
-        self.perceived_flood_probability = random.random()
+        self.taken_measures = float(attributes['taken_measures'])
+        self.perceived_flood_probability = float(attributes['perceived_flood_probability'])
         self.perceived_costs_of_measures = self.elevation_costs_per_square_metre * self.size_of_house
         self.perceived_flood_damage = None
         self.perceived_effectiveness_of_measures = None
         self.desire_to_take_measures = False
+        # number of friends in the social network, set when the household is placed on the network
+        self.friends_count = None
+
+        # add this household to the aggregates of the model
+        model.money_saved_total += self.money_saved
+        model.perceived_flood_probability_total += self.perceived_flood_probability
 
     # Function to count friends who can be influential.
     def count_friends(self, radius):
@@ -92,8 +104,10 @@ class Households(Agent):
 
     def save_money(self):
         self.money_saved += self.income * 0.05
+        self.model.money_saved_total += self.income * 0.05
 
     def construct_perceived_flood_probability(self):
+        perceived_flood_probability_before = self.perceived_flood_probability
         neighbors = self.model.grid.get_neighbors(self.pos, include_center=False)
         self.perceived_flood_probability = self.discount_rate * self.perceived_flood_probability
         for neighbor in neighbors:
@@ -101,6 +115,7 @@ class Households(Agent):
                 self.perceived_flood_probability = (
                     self.perceived_flood_probability * (1 - neighbor.trust_factor) +
                     neighbor.trust_factor * neighbor.perceived_flood_probability)
+        self.model.perceived_flood_probability_total += self.perceived_flood_probability - perceived_flood_probability_before
 
     def construct_perceived_flood_damage(self):
         self.perceived_flood_damage = self.size_of_house * self.max_damage_dol_per_sqm * self.flood_damage_estimated
@@ -137,9 +152,12 @@ class Households(Agent):
             if money_to_spend_on_measures >= elevation_costs:
                 self.taken_measures = 1
                 self.money_saved -= elevation_costs
+                self.model.money_saved_total -= elevation_costs
+                self.model.government.register_measures_change(self)
             elif 1.000 < money_to_spend_on_measures < elevation_costs:
                 # adds a ratio of the complete elevation to the level of adaption, based on how much someone is able to spend
                 self.taken_measures += (money_to_spend_on_measures / elevation_costs)
+                self.model.government.register_measures_change(self)
             else:
                 return
         else:
@@ -154,8 +172,9 @@ class Households(Agent):
         self.reconsider_adaptation_measures()
         self.take_adaptation_measures()
 
-        if self.taken_measures > 0.8:
+        if self.taken_measures > 0.8 and not self.is_adapted:
             self.is_adapted = True
+            self.model.adapted_households_count += 1
 
 # Define the Government agent class
 class Government(Agent):
@@ -168,45 +187,131 @@ class Government(Agent):
 
         self.flood_warning = "Medium"
         self.regulations = 0.2
-        loc_x, loc_y = generate_random_location_within_map_domain()
+        loc_x, loc_y = generate_random_location_within_map_domain(model.streams.placement)
         self.location = Point(loc_x, loc_y)
         self.fine = fine
         self.flood_warning = flood_warning
+        # zone (a Shapely polygon) the flood warnings are given in, None to warn all households
+        self.warning_zone = None
         self.household_list= []
-        self.fined_household_list= []
+        # the household arrays when the model uses the array engine, None otherwise
+        self.household_state = None
+
+        # Compliance index, set up at the first inspection. The baseline damage of the Harvey flood does not change,
+        # so it is only calculated once. After that, only households whose taken measures changed are checked again.
+        self.households = None
+        self.household_index = None
+        self.baseline_damage = None
+        self.complies = None
+        self.inspected_regulations = None
+        # unique ids of the households (agents engine) whose taken measures changed since the last inspection
+        self.changed_households = set()
+
+        # fine records: how often each household was fined, the number of fines and the total amount of fines
+        self.fine_counts = None
+        self.fined_households_count = 0
         self.fined_total = 0
         self.step_counter = 0
+        self.friends_count = None
     def warn_households(self, schedule_of_households): #gebruik een list van de households, schedule voor volgorde.
+        warned = None
+        if self.warning_zone is not None:
+            warned = self.model.spatial_index.within_polygon(self.warning_zone)
+        if self.household_state is not None:
+            # the last axis holds the households, also with the replications of an ensemble
+            warned = slice(None) if warned is None else warned
+            self.household_state.perceived_flood_probability[..., warned] = (
+                self.household_state.perceived_flood_probability[..., warned] * (1 - self.flood_warning) +
+                self.flood_warning)
+            return
+        if warned is not None:
+            schedule_of_households = [self.model.household_agents[i] for i in warned]
         for agent in schedule_of_households:
             if isinstance(agent, Households):
+                perceived_flood_probability_before = agent.perceived_flood_probability
                 agent.perceived_flood_probability = (
                     agent.perceived_flood_probability * (1 - self.flood_warning) +
                     self.flood_warning)
+                self.model.perceived_flood_probability_total += agent.perceived_flood_probability - perceived_flood_probability_before
 
     def count_friends(self, radius):
         #to fix the reporting
         return None
     #you are certified if you have a lower flood damage than the regulation. The harvey flood is used as a baseline.
     def complies_with_certification(self, household):
-        if calculate_basic_flood_damage(flood_depth= household.flood_depth_Harvey) - household.taken_measures <= self.regulations:
+        if calculate_flood_damage(household.flood_depth_Harvey, self.model.depth_damage_curve) - household.taken_measures <= self.regulations:
             return True
         else:
             return False
 
     def fine_household(self, household):
         household.money_saved -= self.fine
-        self.fined_household_list.append(household)
+        self.model.money_saved_total -= self.fine
+        self.fine_counts[self.household_index[household.unique_id]] += 1
+        self.fined_households_count += 1
         self.fined_total += self.fine
 
     def check_certification(self, household):
         if not self.complies_with_certification(household):
             self.fine_household(household)
 
+    def register_measures_change(self, household):
+        """Called by a household whose taken measures changed, so it is checked again at the next inspection."""
+        self.changed_households.add(household.unique_id)
+
+    def initialize_compliance_index(self):
+        """Calculate the baseline damage of every household once and check the compliance of all households."""
+        if self.household_state is not None:
+            self.baseline_damage = calculate_flood_damage(self.household_state.flood_depth_Harvey, self.model.depth_damage_curve)
+            taken_measures = self.household_state.taken_measures
+            self.household_state.measures_changed[:] = False
+        else:
+            self.households = sorted([household for household in self.household_list if isinstance(household, Households)],
+                                     key=lambda household: household.unique_id)
+            self.household_index = {household.unique_id: i for i, household in enumerate(self.households)}
+            self.baseline_damage = np.array([calculate_flood_damage(household.flood_depth_Harvey, self.model.depth_damage_curve)
+                                             for household in self.households])
+            taken_measures = np.array([household.taken_measures for household in self.households])
+            self.changed_households.clear()
+
+        #you are certified if you have a lower flood damage than the regulation. The harvey flood is used as a baseline.
+        self.complies = self.baseline_damage - taken_measures <= self.regulations
+        self.inspected_regulations = self.regulations
+        if self.fine_counts is None:
+            self.fine_counts = np.zeros(self.complies.shape, dtype=np.int64)
+
+    def update_compliance_index(self):
+        """Check the compliance again of the households whose taken measures changed since the last inspection."""
+        if self.household_state is not None:
+            # the arrays can have a row per replication of an ensemble, so the changed households are a boolean mask
+            changed = self.household_state.measures_changed.copy()
+            self.household_state.measures_changed[:] = False
+            taken_measures = self.household_state.taken_measures[changed]
+            baseline_damage = np.broadcast_to(self.baseline_damage, changed.shape)[changed]
+        else:
+            changed = np.array([self.household_index[unique_id] for unique_id in self.changed_households], dtype=np.int64)
+            self.changed_households.clear()
+            taken_measures = np.array([self.households[i].taken_measures for i in changed])
+            baseline_damage = self.baseline_damage[changed]
+        self.complies[changed] = baseline_damage - taken_measures <= self.regulations
+
     def check_all_households(self):
-        #There is a chance for every household that they are checked.
-        for household in self.household_list:
-            if isinstance(household, Households):
-                self.check_certification(household)
+        """Inspect all households and fine the ones that do not comply with the regulations."""
+        if self.complies is None or self.regulations != self.inspected_regulations:
+            self.initialize_compliance_index()
+        else:
+            self.update_compliance_index()
+
+        if self.household_state is not None:
+            not_complying = ~self.complies
+            number_not_complying = int(not_complying.sum())
+            self.household_state.money_saved[not_complying] -= self.fine
+            self.fine_counts[not_complying] += 1
+            self.fined_households_count += number_not_complying
+            self.fined_total += self.fine * number_not_complying
+        else:
+            for i in np.flatnonzero(~self.complies):
+                self.fine_household(self.households[i])
 
     def step(self):
         self.step_counter += 1
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel batch runner for parameter sweeps and replications of the AdaptationModel.
+
+The runs of a sweep are spread over a pool of worker processes. Every run gets its own seed, derived from
+the seed of the sweep and the number of the run, so the results do not depend on the number of workers.
+Each worker loads the shapefiles and flood maps once and reuses them for all the runs it does.
+The model level results are written to a CSV file as soon as a run finishes.
+"""
+import csv
+import itertools
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from model import AdaptationModel
+from columnar_datacollector import ColumnarDataCollector
+import flood_maps
+from flood_maps import get_flood_map, use_flood_map_cache
+from flood_map_cache import CachedFloodMap
+
+
+def make_parameter_combinations(parameter_grid):
+    """
+    Make all combinations of the parameter values in the parameter grid.
+
+    Parameters
+    ----------
+    parameter_grid: dictionary with AdaptationModel parameters as keys and a value or a list of values for each
+
+    Returns
+    -------
+    parameter_combinations: list of dictionaries with one value for each parameter
+    """
+    names = list(parameter_grid.keys())
+    values = [value if isinstance(value, (list, tuple, range, np.ndarray)) else [value]
+              for value in parameter_grid.values()]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def make_run_seeds(seed, number_of_runs):
+    """
+    Derive an independent seed for every run from the seed of the sweep.
+
+    Parameters
+    ----------
+    seed: seed of the sweep
+    number_of_runs: number of runs in the sweep
+
+    Returns
+    -------
+    run_seeds: list with one integer seed per run
+    """
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(number_of_runs)]
+
+
+def run_model(run_id, replication, parameters, seed, max_steps):
+    """
+    Run one AdaptationModel and return its model level results.
+
+    Parameters
+    ----------
+    run_id: number of the run within the sweep
+    replication: number of the replication of this parameter combination
+    parameters: dictionary with the parameters of the AdaptationModel
+    seed: seed of the run
+    max_steps: number of steps to run
+
+    Returns
+    -------
+    rows: list with one dictionary per step, holding the run information, the parameters and the model reporters
+    """
+    model = AdaptationModel(seed=seed, **parameters)
+    for _ in range(max_steps):
+        model.step()
+
+    model_vars = model.datacollector.get_model_vars_dataframe()
+    if isinstance(model.datacollector, ColumnarDataCollector):
+        model.datacollector.remove_temporary_directory()
+    rows = []
+    for step, reporters in enumerate(model_vars.to_dict(orient='records')):
+        rows.append({'RunId': run_id, 'iteration': replication, 'Step': step, 'seed': seed,
+                     **parameters, **reporters})
+    return rows
+
+
+def _run_model(task):
+    return run_model(*task)
+
+
+def _initialize_worker(flood_map_choices, flood_maps_in_memory, flood_map_cache_path=None):
+    """
+    Load the flood maps once in a worker, so the runs of this worker share them.
+    The worker uses the flood map cache at flood_map_cache_path, if given, like the process that started it.
+    """
+    if flood_map_cache_path != flood_maps.flood_map_cache_path:
+        use_flood_map_cache(flood_map_cache_path)
+    for flood_map_choice in flood_map_choices:
+        flood_map = get_flood_map(flood_map_choice, in_memory=flood_maps_in_memory)
+        if flood_maps_in_memory and not isinstance(flood_map, CachedFloodMap):
+            # read the band now instead of in the first run
+            flood_map.band
+
+
+def run_batch(parameter_grid, replications=1, max_steps=50, seed=0, processes=None, output_path=None):
+    """
+    Run the AdaptationModel for every combination of parameter values in the grid, replications times each,
+    spread over a pool of processes.
+
+    Parameters
+    ----------
+    parameter_grid: dictionary with AdaptationModel parameters as keys and a value or a list of values for each
+    replications: number of runs for every parameter combination
+    max_steps: number of steps of each run
+    seed: seed of the sweep, from which the seed of every run is derived
+    processes: number of worker processes, by default the number of cores
+    output_path: path of the CSV file the results are written to as runs finish. Not written if None.
+
+    Returns
+    -------
+    results: DataFrame with the model level results of every step of every run, sorted by run and step
+    """
+    parameter_combinations = make_parameter_combinations(parameter_grid)
+    runs = [(parameters, replication) for parameters in parameter_combinations for replication in range(replications)]
+    run_seeds = make_run_seeds(seed, len(runs))
+    tasks = [(run_id, replication, parameters, run_seeds[run_id], max_steps)
+             for run_id, (parameters, replication) in enumerate(runs)]
+
+    # flood maps the workers need, the harvey map is always used by the households
+    flood_map_choices = {'harvey'}
+    flood_maps_in_memory = True
+    for parameters in parameter_combinations:
+        flood_map_choices.add(parameters.get('flood_map_choice', 'harvey'))
+        flood_maps_in_memory = flood_maps_in_memory and parameters.get('flood_maps_in_memory', True)
+
+    all_rows = []
+    output_file = open(output_path, 'w', newline='') if output_path is not None else None
+    writer = None
+    try:
+        with multiprocessing.Pool(processes=processes, initializer=_initialize_worker,
+                                  initargs=(sorted(flood_map_choices), flood_maps_in_memory,
+                                            flood_maps.flood_map_cache_path)) as pool:
+            for rows in pool.imap_unordered(_run_model, tasks):
+                all_rows.extend(rows)
+                if output_file is not None and rows:
+                    if writer is None:
+                        writer = csv.DictWriter(output_file, fieldnames=list(rows[0].keys()))
+                        writer.writeheader()
+                    writer.writerows(rows)
+                    output_file.flush()
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+    results = pd.DataFrame(all_rows)
+    if len(results) > 0:
+        results = results.sort_values(['RunId', 'Step']).reset_index(drop=True)
+    return results
+
+
+if __name__ == '__main__':
+    # the discount rate study of Output/output_sensitivity_discount_rate.xlsx
+    results = run_batch(parameter_grid={'discount_rate': [0.9, 0.97, 0.975, 0.98, 0.985, 0.99, 0.995]},
+                        replications=15, max_steps=50,
+                        output_path='../Output/output_sensitivity_discount_rate.csv')
+    print(results.groupby(['discount_rate', 'Step'])['total_adapted_households'].mean())
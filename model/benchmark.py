@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the Flood Adaptation Model.
+
+Times the construction of the AdaptationModel, its steps, the steps of the households, the inspection of the
+government and the data collection, for a sweep of household counts, network types and engines. The time per
+agent-step and the peak memory are reported, and the results are saved as JSON so runs on different commits
+can be compared with compare_benchmarks.
+
+The benchmarks run on a synthetic landscape (a round model domain, a floodplain along a river and three smooth
+flood maps), so they do not need the shapefiles and flood maps of input_data.
+
+Usage, from the model directory:
+    python benchmark.py --households 25 1000 100000 --output benchmark_results.json
+    python benchmark.py --households 100000 1000000 --engines arrays --network-backend csr
+    python benchmark.py --compare old_results.json new_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import rasterio as rs
+from rasterio.transform import from_origin
+from shapely.geometry import Point, LineString
+
+from functions import geodata
+from flood_maps import flood_map_paths, close_flood_maps
+from model import AdaptationModel
+
+
+# networks that NetworkX generates with a loop over all pairs of nodes, with the largest household count they are run
+# for with the networkx backend (the csr backend generates them quickly)
+slow_networks = {'erdos_renyi': 5000}
+
+
+def make_synthetic_landscape(directory, radius=10000, resolution=30, seed=0):
+    """
+    Write three synthetic flood maps and make the model domain and floodplain geometries.
+    The coordinates are in the projection of the model (EPSG:26915), around Houston.
+
+    Parameters
+    ----------
+    directory: directory the flood maps are written to
+    radius: radius of the round model domain in metres
+    resolution: cell size of the flood maps in metres
+    seed: seed of the random flood depth field
+
+    Returns
+    -------
+    paths: dictionary with the path of the flood map of every scenario
+    map_domain_polygon, floodplain_multipolygon: geometries of the model domain and floodplain
+    """
+    centre_x, centre_y = 270000, 3290000
+    map_domain_polygon = Point(centre_x, centre_y).buffer(radius)
+    river = LineString([(centre_x - 2 * radius, centre_y - radius / 2), (centre_x + 2 * radius, centre_y + radius / 3)])
+    floodplain_multipolygon = river.buffer(radius / 5).intersection(map_domain_polygon)
+
+    # the flood maps cover the domain with a margin of a few cells, as depths are read from the cell left of and above
+    size = int(np.ceil(2 * radius / resolution)) + 4
+    left, top = centre_x - radius - 2 * resolution, centre_y + radius + 2 * resolution
+    transform = from_origin(left, top, resolution, resolution)
+    cols, rows = np.meshgrid(np.arange(size), np.arange(size))
+    x = left + (cols + 0.5) * resolution
+    y = top - (rows + 0.5) * resolution
+
+    # depth decreases with the distance to the river, with some smooth random bumps
+    rng = np.random.default_rng(seed)
+    distance_to_river = np.abs((river.coords[1][1] - river.coords[0][1]) * x - (river.coords[1][0] - river.coords[0][0]) * y +
+                               river.coords[1][0] * river.coords[0][1] - river.coords[1][1] * river.coords[0][0]) / river.length
+    depth = 3 * np.exp(-distance_to_river / (radius / 4)) - 0.5
+    for _ in range(20):
+        bump_x, bump_y = rng.uniform(centre_x - radius, centre_x + radius, size=2)
+        depth += rng.uniform(-1, 1) * np.exp(-((x - bump_x) ** 2 + (y - bump_y) ** 2) / (2 * (radius / 10) ** 2))
+
+    paths = {}
+    for flood_map_choice, factor in [('harvey', 1.0), ('100yr', 0.8), ('500yr', 1.3)]:
+        path = os.path.join(directory, f'synthetic_{flood_map_choice}.tif')
+        with rs.open(path, 'w', driver='GTiff', height=size, width=size, count=1, dtype='float32',
+                     crs='EPSG:26915', transform=transform, nodata=-9999) as dataset:
+            dataset.write((depth * factor).astype(np.float32), 1)
+        paths[flood_map_choice] = path
+    return paths, map_domain_polygon, floodplain_multipolygon
+
+
+def use_synthetic_landscape(directory, **landscape_parameters):
+    """Make the synthetic landscape and let all models of this process use it."""
+    paths, map_domain_polygon, floodplain_multipolygon = make_synthetic_landscape(directory, **landscape_parameters)
+    close_flood_maps()
+    flood_map_paths.update(paths)
+    geodata.use_geometries(map_domain_polygon, floodplain_multipolygon)
+
+
+def _time(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def benchmark_model(number_of_households, network, engine='agents', steps=5, measure_memory=True, seed=0,
+                    **model_parameters):
+    """
+    Benchmark one model configuration.
+
+    Parameters
+    ----------
+    number_of_households: number of households of the model
+    network: network type of the model
+    engine: "agents" or "arrays"
+    steps: number of model steps that are timed
+    measure_memory: whether the peak memory of construction and one step is measured (in a separate run,
+                    as tracing the memory slows the model down)
+    seed: seed of the model
+    model_parameters: other parameters of the AdaptationModel
+
+    Returns
+    -------
+    result: dictionary with the configuration and the timings in seconds
+    """
+    parameters = dict(seed=seed, number_of_households=number_of_households, network=network, engine=engine,
+                      **model_parameters)
+    result = {'number_of_households': number_of_households, 'network': network, 'engine': engine, 'steps': steps}
+
+    result['init_time'], model = _time(AdaptationModel, **parameters)
+    step_times = [_time(model.step)[0] for _ in range(steps)]
+    result['step_time'] = float(np.mean(step_times))
+    result['step_time_min'] = float(np.min(step_times))
+    result['time_per_agent_step'] = result['step_time'] / number_of_households
+
+    # the parts of a step, timed on their own after the model steps
+    if model.household_state is not None:
+        activation_order = model.streams.behaviour.permutation(number_of_households)
+        result['households_step_time'] = _time(model.household_state.step, activation_order)[0]
+    else:
+        start = time.perf_counter()
+        for household in model.household_agents:
+            household.step()
+        result['households_step_time'] = time.perf_counter() - start
+    result['check_all_households_time'] = _time(model.government.check_all_households)[0]
+    result['collect_time'] = _time(model.datacollector.collect, model)[0]
+
+    if measure_memory:
+        tracemalloc.start()
+        model = AdaptationModel(**parameters)
+        model.step()
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run_benchmarks(household_counts=(25, 100, 1000, 10000, 100000),
+                   networks=('erdos_renyi', 'barabasi_albert', 'watts_strogatz', 'no_network'),
+                   engines=('agents', 'arrays'), steps=5, measure_memory=True, output_path=None, **model_parameters):
+    """
+    Run the benchmarks for every combination of household count, network type and engine,
+    on the synthetic landscape.
+
+    Parameters
+    ----------
+    household_counts: household counts to benchmark
+    networks: network types to benchmark, see AdaptationModel.initialize_network
+    engines: engines to benchmark
+    steps: number of model steps that are timed per configuration
+    measure_memory: whether the peak memory is measured
+    output_path: path of the JSON file the results are written to. Not written if None.
+    model_parameters: other parameters of the AdaptationModel
+
+    Returns
+    -------
+    benchmarks: dictionary with information on the run ("metadata") and a list with the result of every configuration
+    """
+    results = []
+    # the landscape of this process is set back afterwards
+    previous_flood_map_paths = dict(flood_map_paths)
+    previous_geometries = geodata._map_domain_polygon, geodata._floodplain_multipolygon
+    with tempfile.TemporaryDirectory() as directory:
+        use_synthetic_landscape(directory)
+        try:
+            for number_of_households in household_counts:
+                for network in networks:
+                    for engine in engines:
+                        if model_parameters.get('network_backend', 'networkx') == 'networkx' and \
+                                number_of_households > slow_networks.get(network, number_of_households):
+                            results.append({'number_of_households': number_of_households, 'network': network,
+                                            'engine': engine, 'skipped': 'network generation too slow'})
+                            continue
+                        result = benchmark_model(number_of_households, network, engine=engine, steps=steps,
+                                                 measure_memory=measure_memory, **model_parameters)
+                        print(f"{number_of_households:>7} {network:<16} {engine:<7} "
+                              f"init {result['init_time']:8.3f}s  step {result['step_time']:8.4f}s  "
+                              f"{result['time_per_agent_step'] * 1e6:8.2f} us/agent-step")
+                        results.append(result)
+        finally:
+            close_flood_maps()
+            flood_map_paths.update(previous_flood_map_paths)
+            geodata._map_domain_polygon, geodata._floodplain_multipolygon = previous_geometries
+
+    benchmarks = {'metadata': _metadata(), 'results': results}
+    if output_path is not None:
+        with open(output_path, 'w') as output_file:
+            json.dump(benchmarks, output_file, indent=2)
+    return benchmarks
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor()}
+
+
+def compare_benchmarks(old_path, new_path):
+    """
+    Compare two benchmark result files, e.g. of two commits.
+
+    Returns
+    -------
+    comparison: DataFrame with the old and new time per agent-step of every configuration and their ratio
+                (above 1 means the new commit is slower)
+    """
+    tables = []
+    for path in [old_path, new_path]:
+        with open(path) as input_file:
+            results = pd.DataFrame(json.load(input_file)['results'])
+        if 'skipped' in results:
+            results = results[results['skipped'].isna()]
+        tables.append(results.set_index(['number_of_households', 'network', 'engine'])['time_per_agent_step'])
+    comparison = pd.concat(tables, axis=1, keys=['old', 'new']).dropna()
+    comparison['ratio'] = comparison['new'] / comparison['old']
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the Flood Adaptation Model')
+    parser.add_argument('--households', type=int, nargs='+', default=[25, 100, 1000, 10000, 100000])
+    parser.add_argument('--networks', nargs='+', default=['erdos_renyi', 'barabasi_albert', 'watts_strogatz', 'no_network'])
+    parser.add_argument('--engines', nargs='+', default=['agents', 'arrays'])
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--network-backend', default='networkx', choices=['networkx', 'csr'])
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files instead')
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        print(compare_benchmarks(*arguments.compare).to_string())
+    else:
+        run_benchmarks(household_counts=arguments.households, networks=arguments.networks, engines=arguments.engines,
+                       steps=arguments.steps, measure_memory=not arguments.no_memory, output_path=arguments.output,
+                       network_backend=arguments.network_backend)
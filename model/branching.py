@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Warm-start branching of the AdaptationModel for policy comparisons.
+
+Policy variants (different fine, flood_warning or regulations) often share their first steps. The model is run
+up to the branch step once, a snapshot of it is taken (see checkpoint.py), and every variant continues from a copy
+of that snapshot with its own policy. The branches run in a pool of processes; each worker receives the snapshot
+only once. By default the branches keep the random streams of the shared run, so the differences between the
+branches come from the policy and not from the random numbers. With the columnar data collector every branch
+writes to its own output path, the output path of the shared run followed by "_branch_<number>".
+"""
+import multiprocessing
+
+import pandas as pd
+
+from model import AdaptationModel
+from checkpoint import snapshot, restore
+from columnar_datacollector import ColumnarDataCollector
+
+# snapshot of the shared run, set once in every worker
+_branch_snapshot = None
+
+
+def _initialize_worker(model_snapshot):
+    global _branch_snapshot
+    _branch_snapshot = model_snapshot
+
+
+def run_branch(branch_id, policy, max_steps, model_snapshot=None, reseed_streams=None):
+    """
+    Restore the shared run, set the policy of the branch and run it to the end.
+
+    Parameters
+    ----------
+    branch_id: number of the branch
+    policy: dictionary with the parameters of AdaptationModel.set_policy
+    max_steps: total number of steps of the run, including the shared steps
+    model_snapshot: snapshot of the shared run. If None, the snapshot given to the worker is used.
+    reseed_streams: RandomStreams for this branch, or None to keep the random streams of the shared run
+
+    Returns
+    -------
+    rows: list with one dictionary per step, holding the branch, its policy and the model reporters
+    """
+    model = restore(model_snapshot if model_snapshot is not None else _branch_snapshot)
+    if reseed_streams is not None:
+        model.streams = reseed_streams
+        model.random.seed(int(reseed_streams.behaviour.integers(2**63)))
+    if isinstance(model.datacollector, ColumnarDataCollector):
+        # the branches would otherwise write their chunks over each other
+        model.datacollector.copy_to(f'{model.datacollector.output_path}_branch_{branch_id}')
+    model.set_policy(**policy)
+    while model.schedule.steps < max_steps:
+        model.step()
+
+    model_vars = model.datacollector.get_model_vars_dataframe()
+    if isinstance(model.datacollector, ColumnarDataCollector):
+        model.datacollector.remove_temporary_directory()
+    rows = []
+    for step, reporters in enumerate(model_vars.to_dict(orient='records')):
+        rows.append({'branch': branch_id, 'Step': step, **policy, **reporters})
+    return rows
+
+
+def _run_branch(task):
+    return run_branch(*task)
+
+
+def run_branches(model, branch_step, policies, max_steps, processes=None, reseed=False):
+    """
+    Run a model up to the branch step once and continue it with every policy.
+
+    Parameters
+    ----------
+    model: an AdaptationModel, or a dictionary with the parameters to make one
+    branch_step: step at which the run branches into the policies
+    policies: list of dictionaries with the parameters of AdaptationModel.set_policy, one per branch
+    max_steps: total number of steps of every branch, including the shared steps
+    processes: number of worker processes, by default the number of cores. With 1 the branches run in this process.
+    reseed: whether every branch gets its own random streams instead of those of the shared run
+
+    Returns
+    -------
+    results: DataFrame with the model reporters of every step of every branch, sorted by branch and step
+    """
+    if isinstance(model, dict):
+        model = AdaptationModel(**model)
+    while model.schedule.steps < branch_step:
+        model.step()
+
+    model_snapshot = snapshot(model)
+    branch_streams = model.streams.spawn(len(policies)) if reseed else [None] * len(policies)
+    tasks = [(branch_id, policy, max_steps, None, branch_streams[branch_id]) for branch_id, policy in enumerate(policies)]
+
+    if processes == 1:
+        _initialize_worker(model_snapshot)
+        all_rows = [row for task in tasks for row in _run_branch(task)]
+    else:
+        all_rows = []
+        with multiprocessing.Pool(processes=processes, initializer=_initialize_worker,
+                                  initargs=(model_snapshot,)) as pool:
+            for rows in pool.imap_unordered(_run_branch, tasks):
+                all_rows.extend(rows)
+
+    # sorted before the DataFrame is made, so the order of the columns does not depend on which branch finished first
+    all_rows.sort(key=lambda row: (row['branch'], row['Step']))
+    return pd.DataFrame(all_rows)
+
+
+if __name__ == '__main__':
+    # compare fines after a shared run up to the flood at step 5
+    results = run_branches({'seed': 0, 'number_of_households': 1000}, branch_step=5,
+                           policies=[{'fine': fine} for fine in [0, 500, 1000, 2000, 5000]], max_steps=50)
+    print(results.groupby(['fine', 'Step'])['total_adapted_households'].mean().unstack(0).tail())
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of the AdaptationModel.
+
+A checkpoint holds the dynamic state of a model: the agents or household arrays, the schedule, the network,
+the government's fine records, the collected data and the state of all random generators. The flood maps are
+not stored; they are opened again from the flood map registry (see flood_maps.py) when the model is restored.
+A restored model continues exactly as the original would have.
+
+Checkpoints can be written to disk to resume a run later, or kept in memory to fork a run, e.g. at the flood
+step, into many what-if continuations.
+"""
+import pickle
+
+
+def snapshot(model):
+    """
+    Take a snapshot of the state of a model.
+
+    Parameters
+    ----------
+    model: the AdaptationModel
+
+    Returns
+    -------
+    snapshot: the state of the model as bytes
+    """
+    return pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def restore(model_snapshot):
+    """
+    Restore a model from a snapshot taken with snapshot.
+
+    Parameters
+    ----------
+    model_snapshot: the state of the model as bytes
+
+    Returns
+    -------
+    model: the restored AdaptationModel
+    """
+    return pickle.loads(model_snapshot)
+
+
+def save_checkpoint(model, path):
+    """
+    Write a checkpoint of a model to disk.
+
+    Parameters
+    ----------
+    model: the AdaptationModel
+    path: path of the checkpoint file
+    """
+    with open(path, 'wb') as checkpoint_file:
+        pickle.dump(model, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint written with save_checkpoint and restore the model.
+
+    Parameters
+    ----------
+    path: path of the checkpoint file
+
+    Returns
+    -------
+    model: the restored AdaptationModel, which continues at the step the checkpoint was taken
+    """
+    with open(path, 'rb') as checkpoint_file:
+        return pickle.load(checkpoint_file)
+
+
+def fork_model(model, number_of_forks, reseed=True):
+    """
+    Make copies of a model that continue from its current step.
+    With the columnar data collector and an explicit output path, give every fork its own datacollector.output_path
+    before stepping it; without an output path every fork gets a new temporary directory.
+
+    Parameters
+    ----------
+    model: the AdaptationModel to fork
+    number_of_forks: number of copies
+    reseed: if True, every fork gets its own random streams (derived from those of the model), so the forks are
+            different what-if continuations. If False, all forks continue exactly as the model would.
+
+    Returns
+    -------
+    forks: list of AdaptationModels
+    """
+    model_snapshot = snapshot(model)
+    streams = model.streams.spawn(number_of_forks) if reseed else None
+    forks = []
+    for i in range(number_of_forks):
+        fork = restore(model_snapshot)
+        if reseed:
+            fork.streams = streams[i]
+            # the agents engine activates the agents with Mesa's random generator
+            fork.random.seed(int(streams[i].behaviour.integers(2**63)))
+        forks.append(fork)
+    return forks
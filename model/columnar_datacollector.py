@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar, streaming data collector for the Flood Adaptation Model.
+
+The ColumnarDataCollector has the same reporters and methods as Mesa's DataCollector, but instead of keeping every
+collected value in Python lists until the end of the run, it writes the collected data to disk every flush_every steps.
+The data is stored in typed columns, as Parquet files (needs pyarrow) or as compressed NumPy .npz files,
+one file per chunk, so the memory use stays flat regardless of the length of the run.
+Every run needs its own output path: without one, the chunks are written to a new temporary directory, and the
+chunks of another run at the same output path are only replaced with overwrite=True. A temporary directory is removed
+with the collector that made it (or at the end of the process), so read the data back before the collector is gone.
+
+With the array engine the agent reporters are read directly from the arrays of model.household_state, so they have
+to be names of attributes.
+"""
+import glob
+import os
+import shutil
+import tempfile
+import types
+import weakref
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+
+
+def _to_columns(name, values):
+    """
+    Turn the collected values of one reporter into one or more typed columns.
+    Missing values become NaN and Shapely Points are split into an x and a y column.
+
+    Parameters
+    ----------
+    name: name of the reporter
+    values: list or array with the collected values
+
+    Returns
+    -------
+    columns: dictionary with the column name(s) and array(s)
+    """
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        return {name: values}
+    if any(isinstance(value, Point) for value in values):
+        return {f'{name}_x': np.array([np.nan if value is None else value.x for value in values]),
+                f'{name}_y': np.array([np.nan if value is None else value.y for value in values])}
+    column = np.asarray([np.nan if value is None else value for value in values])
+    if column.dtype == object:
+        column = column.astype(str)
+    return {name: column}
+
+
+class ColumnarDataCollector:
+    """
+    A data collector that writes model and agent reporters to disk in chunks of typed columns.
+    """
+
+    def __init__(self, model_reporters=None, agent_reporters=None, output_path=None, flush_every=10,
+                 file_format='parquet', overwrite=False):
+        """
+        Parameters
+        ----------
+        model_reporters: dictionary of model reporters, as for Mesa's DataCollector
+        agent_reporters: dictionary of agent reporters, as for Mesa's DataCollector
+        output_path: path and start of the file names the data is written to. If None, the data is written to a new
+                     temporary directory, so runs in parallel never share their files. This directory is removed when
+                     the collector is garbage collected, and a copy of the collector (e.g. from a checkpoint) gets a
+                     temporary directory of its own.
+        flush_every: number of collected steps after which the data is written to disk
+        file_format: "parquet" or "npz"
+        overwrite: whether the chunks of an earlier run at the same output path may be deleted
+        """
+        if file_format not in ['parquet', 'npz']:
+            raise ValueError(f"Unknown file format: '{file_format}'. "
+                             f"Currently implemented file formats are: 'parquet' and 'npz'")
+        if file_format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("The parquet file format needs pyarrow; install it or use file_format='npz'")
+            self._pyarrow = pyarrow
+
+        self.model_reporters = model_reporters if model_reporters is not None else {}
+        self.agent_reporters = agent_reporters if agent_reporters is not None else {}
+        self._temporary_directory = None
+        if output_path is None:
+            output_path = self._make_temporary_output_path()
+        self.output_path = output_path
+        self.flush_every = flush_every
+        self.file_format = file_format
+        self.overwrite = overwrite
+
+        self._model_records = []
+        self._agent_records = []
+        self._steps_buffered = 0
+        self._chunks_written = 0
+        self._schemas = {}
+
+        self._remove_earlier_chunks()
+
+    def __getstate__(self):
+        # pyarrow is imported again when the collector is restored from a checkpoint
+        state = self.__dict__.copy()
+        state.pop('_pyarrow', None)
+        state.pop('_finalizer', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.file_format == 'parquet':
+            import pyarrow
+            import pyarrow.parquet
+            self._pyarrow = pyarrow
+        if self._temporary_directory is not None:
+            # the temporary directory belongs to the original collector and is removed with it, so a copy continues
+            # in a temporary directory of its own (with the chunks that are still there)
+            self.copy_to(None)
+
+    def _make_temporary_output_path(self):
+        # the directory is removed when the collector is garbage collected or at the end of the process
+        self._temporary_directory = tempfile.mkdtemp(prefix='model_output_')
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self._temporary_directory, ignore_errors=True)
+        return os.path.join(self._temporary_directory, 'model_output')
+
+    def _remove_earlier_chunks(self):
+        # chunks of an earlier run with the same output path would be read back as part of this run
+        earlier_chunks = self._chunk_paths('model') + self._chunk_paths('agents')
+        if earlier_chunks and not getattr(self, 'overwrite', False):
+            raise ValueError(f"The output path '{self.output_path}' already holds the data of another run. "
+                             f"Give every run its own output path, or use overwrite=True (overwrite_output=True of the "
+                             f"AdaptationModel) to replace the data")
+        for path in earlier_chunks:
+            os.remove(path)
+
+    def copy_to(self, output_path):
+        """
+        Continue collecting at another output path, e.g. for a branch or fork of a run: the chunks written so far
+        are copied there, and the data of this collector at the old output path is left as it is.
+
+        Parameters
+        ----------
+        output_path: the new path and start of the file names, or None for a new temporary directory
+        """
+        # the buffered records stay in memory and are written to the new output path only
+        written_chunks = {table_name: self._chunk_paths(table_name) for table_name in ['model', 'agents']}
+        old_output_path = self.output_path
+        if output_path is None:
+            output_path = self._make_temporary_output_path()
+        elif self._temporary_directory is not None and \
+                not os.path.abspath(output_path).startswith(self._temporary_directory + os.sep):
+            # the data is kept outside the temporary directory from now on, so a copy may continue there as well
+            self._temporary_directory = None
+        self.output_path = output_path
+        self._remove_earlier_chunks()
+        for table_name, paths in written_chunks.items():
+            for path in paths:
+                shutil.copyfile(path, output_path + path[len(old_output_path):])
+
+    def _collect_model_reporters(self, model):
+        record = {'Step': model.schedule.steps}
+        for name, reporter in self.model_reporters.items():
+            if isinstance(reporter, (types.LambdaType, partial)):
+                record[name] = reporter(model)
+            elif isinstance(reporter, str):
+                record[name] = getattr(model, reporter, None)
+            elif isinstance(reporter, list):
+                record[name] = reporter[0](*reporter[1])
+            else:
+                record[name] = reporter()
+        return record
+
+    def _collect_agent_reporters(self, model):
+        state = getattr(model, 'household_state', None)
+        if state is not None:
+            # array engine: every reporter is an attribute of the household arrays
+            columns = {'Step': np.full(state.number_of_households, model.schedule.steps, dtype=np.int64),
+                       'AgentID': np.arange(state.number_of_households, dtype=np.int64)}
+            for name, reporter in self.agent_reporters.items():
+                if reporter == 'location':
+                    columns[f'{name}_x'] = state.x.copy()
+                    columns[f'{name}_y'] = state.y.copy()
+                elif isinstance(reporter, str):
+                    values = getattr(state, reporter, None)
+                    if values is None:
+                        values = np.full(state.number_of_households, np.nan)
+                    columns[name] = np.array(values, copy=True)
+                else:
+                    raise ValueError(f"Unknown agent reporter for the array engine: '{name}'. With the array engine "
+                                     f"the agent reporters have to be names of attributes of the household state")
+            return columns
+
+        agents = list(model.schedule.agents)
+        columns = {'Step': np.full(len(agents), model.schedule.steps, dtype=np.int64),
+                   'AgentID': np.array([agent.unique_id for agent in agents], dtype=np.int64)}
+        for name, reporter in self.agent_reporters.items():
+            if isinstance(reporter, str):
+                values = [getattr(agent, reporter, None) for agent in agents]
+            else:
+                values = [reporter(agent) for agent in agents]
+            columns.update(_to_columns(name, values))
+        return columns
+
+    def collect(self, model):
+        """Collect the data of the given model and write it to disk every flush_every steps."""
+        if self.model_reporters:
+            self._model_records.append(self._collect_model_reporters(model))
+        if self.agent_reporters:
+            self._agent_records.append(self._collect_agent_reporters(model))
+        self._steps_buffered += 1
+        if self._steps_buffered >= self.flush_every:
+            self.flush()
+
+    def _chunk_paths(self, table_name):
+        extension = 'npz' if self.file_format == 'npz' else 'parquet'
+        return sorted(glob.glob(f'{self.output_path}_{table_name}_[0-9][0-9][0-9][0-9][0-9].{extension}'))
+
+    def _write(self, table_name, columns):
+        if self.file_format == 'npz':
+            np.savez_compressed(f'{self.output_path}_{table_name}_{self._chunks_written:05d}.npz', **columns)
+            return
+
+        pyarrow = self._pyarrow
+        table = pyarrow.Table.from_pydict(columns)
+        # later chunks get the column types of the first chunk
+        if table_name not in self._schemas:
+            self._schemas[table_name] = table.schema
+        table = table.cast(self._schemas[table_name], safe=False)
+        pyarrow.parquet.write_table(table, f'{self.output_path}_{table_name}_{self._chunks_written:05d}.parquet',
+                                    compression='zstd')
+
+    def flush(self):
+        """Write the buffered data to disk."""
+        if self._model_records:
+            model_columns = {}
+            for name in self._model_records[0].keys():
+                model_columns.update(_to_columns(name, [record[name] for record in self._model_records]))
+            self._write('model', model_columns)
+        if self._agent_records:
+            agent_columns = {name: np.concatenate([record[name] for record in self._agent_records])
+                             for name in self._agent_records[0].keys()}
+            self._write('agents', agent_columns)
+        if self._model_records or self._agent_records:
+            self._chunks_written += 1
+        self._model_records = []
+        self._agent_records = []
+        self._steps_buffered = 0
+
+    def close(self):
+        """Write the remaining data to disk."""
+        self.flush()
+
+    def remove_temporary_directory(self):
+        """
+        Remove the temporary directory of a collector without output path, once its data has been read back.
+        Otherwise it is only removed when the collector is garbage collected, which a worker process that exits may
+        never do.
+        """
+        if self._temporary_directory is not None:
+            self._finalizer()
+
+    def _read(self, table_name):
+        self.flush()
+        chunks = []
+        for path in self._chunk_paths(table_name):
+            if self.file_format == 'npz':
+                with np.load(path) as chunk:
+                    chunks.append(pd.DataFrame({name: chunk[name] for name in chunk.files}))
+            else:
+                chunks.append(self._pyarrow.parquet.read_table(path).to_pandas())
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+    def get_model_vars_dataframe(self):
+        """Read the collected model reporters back from disk, with one row per step."""
+        model_vars = self._read('model')
+        if 'Step' in model_vars:
+            model_vars = model_vars.set_index('Step')
+        return model_vars
+
+    def get_agent_vars_dataframe(self):
+        """Read the collected agent reporters back from disk, indexed by step and agent id like Mesa's DataCollector."""
+        agent_vars = self._read('agents')
+        if 'Step' in agent_vars:
+            agent_vars = agent_vars.set_index(['Step', 'AgentID'])
+        return agent_vars
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Compact social network backend for very large numbers of households.
+
+The network is stored as compressed sparse rows: the neighbours of node i are indices[indptr[i]:indptr[i+1]].
+The Erdős-Rényi, Barabási-Albert and Watts-Strogatz networks are generated directly as edge arrays, without a
+NetworkX graph, so a network of a million households takes some tens of MB and a few seconds to build.
+CSRGraph has the few NetworkX graph methods the model uses and CSRNetworkGrid the methods of Mesa's NetworkGrid,
+so the agents can use it in the same way.
+
+The generators give networks with the same structure as the NetworkX generators, but not the same networks for
+the same seed, and the neighbours of a node are in increasing order.
+"""
+import numpy as np
+
+
+class CSRGraph:
+    """
+    An undirected graph stored as compressed sparse rows.
+    """
+
+    def __init__(self, number_of_nodes, indptr, indices):
+        self._number_of_nodes = number_of_nodes
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_edges(cls, number_of_nodes, sources, targets):
+        """
+        Make the graph from arrays with the two nodes of every edge. Self-loops and duplicate edges are removed.
+
+        Parameters
+        ----------
+        number_of_nodes: number of nodes of the graph
+        sources, targets: arrays with the nodes of the edges
+
+        Returns
+        -------
+        graph: the CSRGraph
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        keep = sources != targets
+        low = np.minimum(sources[keep], targets[keep])
+        high = np.maximum(sources[keep], targets[keep])
+        low, high = np.divmod(_sorted_unique(low * number_of_nodes + high), number_of_nodes)
+
+        # every edge is stored in the rows of both its nodes, sorted by row and then by column
+        entry_keys = np.sort(np.concatenate([low * number_of_nodes + high, high * number_of_nodes + low]))
+        rows, cols = np.divmod(entry_keys, number_of_nodes)
+        indptr = np.zeros(number_of_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=number_of_nodes), out=indptr[1:])
+        index_dtype = np.int32 if number_of_nodes < 2**31 else np.int64
+        return cls(number_of_nodes, indptr, cols.astype(index_dtype))
+
+    def nodes(self):
+        return range(self._number_of_nodes)
+
+    def number_of_nodes(self):
+        return self._number_of_nodes
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]].tolist()
+
+    def degree(self, node):
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+    def to_networkx(self):
+        """Make a NetworkX graph of the network, e.g. for plotting or analysis."""
+        import networkx as nx
+        G = nx.Graph()
+        G.add_nodes_from(range(self._number_of_nodes))
+        rows = np.repeat(np.arange(self._number_of_nodes), np.diff(self.indptr))
+        upper = rows < self.indices
+        G.add_edges_from(zip(rows[upper].tolist(), self.indices[upper].tolist()))
+        return G
+
+
+def _sorted_unique(values):
+    # np.unique, but always by sorting, which is much faster than hashing for arrays of millions of integers
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    return values[np.concatenate([[True], values[1:] != values[:-1]])]
+
+
+def _contains_sorted(sorted_values, values):
+    # for every value, whether it is in the sorted array
+    if len(sorted_values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[positions] == values
+
+
+def erdos_renyi_graph(number_of_nodes, probability, rng):
+    """
+    Erdős-Rényi network in which every pair of nodes is connected with the given probability.
+    The number of edges is drawn first, then that many different pairs are drawn, so the time grows with the
+    number of edges instead of the number of pairs.
+
+    Parameters
+    ----------
+    number_of_nodes: number of nodes
+    probability: probability of an edge between two nodes
+    rng: numpy random Generator
+
+    Returns
+    -------
+    graph: the CSRGraph
+    """
+    number_of_pairs = number_of_nodes * (number_of_nodes - 1) // 2
+    number_of_edges = rng.binomial(number_of_pairs, probability) if number_of_pairs > 0 else 0
+    pair_keys = np.zeros(0, dtype=np.int64)
+    while len(pair_keys) < number_of_edges:
+        new_keys = rng.integers(0, number_of_pairs, size=number_of_edges - len(pair_keys))
+        pair_keys = _sorted_unique(np.concatenate([pair_keys, new_keys]))
+
+    # pair k is the pair (low, high) with high * (high - 1) / 2 + low = k
+    high = ((1 + np.sqrt(1 + 8 * pair_keys.astype(float))) // 2).astype(np.int64)
+    high -= high * (high - 1) // 2 > pair_keys
+    high += (high + 1) * high // 2 <= pair_keys
+    low = pair_keys - high * (high - 1) // 2
+    return CSRGraph.from_edges(number_of_nodes, low, high)
+
+
+def barabasi_albert_graph(number_of_nodes, number_of_edges, rng):
+    """
+    Barabási-Albert network grown by preferential attachment, as nx.barabasi_albert_graph: every new node is
+    connected to number_of_edges different existing nodes, chosen with a probability proportional to their degree.
+
+    Parameters
+    ----------
+    number_of_nodes: number of nodes
+    number_of_edges: number of edges of every new node
+    rng: numpy random Generator
+
+    Returns
+    -------
+    graph: the CSRGraph
+    """
+    m = number_of_edges
+    if m < 1 or m >= number_of_nodes:
+        raise ValueError(f"Barabási-Albert network must have 1 <= number_of_edges < number_of_nodes, "
+                         f"number_of_edges = {m}, number_of_nodes = {number_of_nodes}")
+    # every node appears in repeated_nodes once per edge, so drawing from it is proportional to the degree;
+    # the loop works on Python lists, which is faster than indexing numpy arrays one element at a time
+    targets = list(range(m))
+    repeated_nodes = list(range(m)) + [m] * m
+    # the uniform numbers are drawn in blocks, so they do not take as much memory as the network itself
+    block_size = min(2 * (number_of_nodes - m) * m, 2**16)
+    uniform = rng.random(size=block_size).tolist()
+    position = 0
+    for source in range(m + 1, number_of_nodes):
+        number_repeated = len(repeated_nodes)
+        chosen = set()
+        while len(chosen) < m:
+            if position == len(uniform):
+                uniform = rng.random(size=block_size).tolist()
+                position = 0
+            chosen.add(repeated_nodes[int(uniform[position] * number_repeated)])
+            position += 1
+        targets.extend(chosen)
+        repeated_nodes.extend(chosen)
+        repeated_nodes.extend([source] * m)
+    # the star of the first m + 1 nodes, then m edges per new node
+    sources = np.repeat(np.arange(m, number_of_nodes), m)
+    return CSRGraph.from_edges(number_of_nodes, sources, targets)
+
+
+def watts_strogatz_graph(number_of_nodes, number_of_nearest_neighbours, probability, rng, rewire_attempts=10):
+    """
+    Watts-Strogatz small-world network, as nx.watts_strogatz_graph: a ring in which every node is connected to its
+    number_of_nearest_neighbours nearest neighbours, after which every edge is rewired to a random node with the
+    given probability. All edges are rewired at once; a rewired edge that would become a self-loop or a duplicate is
+    drawn again, up to rewire_attempts times, and otherwise keeps its original node.
+    As in NetworkX, number_of_nearest_neighbours may not be larger than number_of_nodes, and if it is equal the
+    network is the complete graph.
+
+    Parameters
+    ----------
+    number_of_nodes: number of nodes
+    number_of_nearest_neighbours: number of nearest neighbours in the ring (rounded down to an even number)
+    probability: probability of rewiring an edge
+    rng: numpy random Generator
+    rewire_attempts: number of times a rewired edge is drawn again
+
+    Returns
+    -------
+    graph: the CSRGraph
+    """
+    n = number_of_nodes
+    if number_of_nearest_neighbours > n:
+        raise ValueError(f"Watts-Strogatz network must have number_of_nearest_neighbours <= number_of_nodes, "
+                         f"number_of_nearest_neighbours = {number_of_nearest_neighbours}, number_of_nodes = {n}")
+    if number_of_nearest_neighbours == n:
+        sources, targets = np.triu_indices(n, k=1)
+        return CSRGraph.from_edges(n, sources, targets)
+    half = number_of_nearest_neighbours // 2
+    sources = np.repeat(np.arange(n, dtype=np.int64), half)
+    targets = (sources + np.tile(np.arange(1, half + 1), n)) % n
+
+    rewire = np.flatnonzero(rng.random(len(sources)) < probability)
+    for _ in range(rewire_attempts):
+        if len(rewire) == 0:
+            break
+        new_targets = rng.integers(0, n, size=len(rewire))
+        edge_keys = np.sort(np.minimum(sources, targets) * n + np.maximum(sources, targets))
+        new_keys = np.minimum(sources[rewire], new_targets) * n + np.maximum(sources[rewire], new_targets)
+        # of several rewired edges that would become the same edge, only the first is accepted
+        order = np.argsort(new_keys, kind='stable')
+        sorted_keys = new_keys[order]
+        unique_new = np.zeros(len(rewire), dtype=bool)
+        unique_new[order] = np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]])
+        accepted = (new_targets != sources[rewire]) & unique_new & ~_contains_sorted(edge_keys, new_keys)
+        targets[rewire[accepted]] = new_targets[accepted]
+        rewire = rewire[~accepted]
+    return CSRGraph.from_edges(n, sources, targets)
+
+
+class CSRNetworkGrid:
+    """
+    The methods of Mesa's NetworkGrid on a CSRGraph. Only the nodes that hold agents keep a list of them.
+    """
+
+    def __init__(self, G):
+        self.G = G
+        self._agents = {}
+
+    def place_agent(self, agent, node_id):
+        """Place an agent in a node."""
+        self._agents.setdefault(node_id, []).append(agent)
+        agent.pos = node_id
+
+    def get_neighborhood(self, node_id, include_center=False, radius=1):
+        """Get all adjacent nodes within a certain radius."""
+        if radius == 1:
+            neighborhood = self.G.neighbors(node_id)
+            if include_center:
+                neighborhood.append(node_id)
+            return neighborhood
+        # breadth-first search up to the radius
+        visited = {node_id}
+        frontier = np.array([node_id])
+        for _ in range(radius):
+            next_nodes = np.concatenate([self.G.indices[self.G.indptr[node]:self.G.indptr[node + 1]]
+                                         for node in frontier]) if len(frontier) else np.zeros(0, dtype=np.int64)
+            frontier = np.array([node for node in set(next_nodes.tolist()) if node not in visited])
+            visited.update(frontier.tolist())
+        if not include_center:
+            visited.discard(node_id)
+        return sorted(visited)
+
+    def get_neighbors(self, node_id, include_center=False, radius=1):
+        """Get all agents in adjacent nodes (within a certain radius)."""
+        return self.get_cell_list_contents(self.get_neighborhood(node_id, include_center, radius))
+
+    def move_agent(self, agent, node_id):
+        """Move an agent from its current node to a new node."""
+        self.remove_agent(agent)
+        self.place_agent(agent, node_id)
+
+    def remove_agent(self, agent):
+        """Remove the agent from the network and set its pos attribute to None."""
+        agents = self._agents[agent.pos]
+        agents.remove(agent)
+        if not agents:
+            del self._agents[agent.pos]
+        agent.pos = None
+
+    def is_cell_empty(self, node_id):
+        """Returns a bool of the contents of a cell."""
+        return node_id not in self._agents
+
+    def get_cell_list_contents(self, cell_list):
+        """Returns a list of the agents contained in the nodes identified in cell_list."""
+        return [agent for node_id in cell_list for agent in self._agents.get(node_id, ())]
+
+    def get_all_cell_contents(self):
+        """Returns a list of all the agents in the network."""
+        return self.get_cell_list_contents(self.G.nodes())
+
+    def iter_cell_list_contents(self, cell_list):
+        """Returns an iterator of the agents contained in the nodes identified in cell_list."""
+        return iter(self.get_cell_list_contents(cell_list))
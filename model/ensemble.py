@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo ensembles of the AdaptationModel on one landscape.
+
+The landscape (network, household locations, floodplain checks, flood depths and household attributes) is built
+once by an AdaptationModel with the array engine. The replications only differ in the stochastic behaviour:
+the initial taken measures and perceived flood probability, the activation order and the noise of the flood events.
+Each replication has its own random streams (see rng.py), and all replications are stepped at once as an extra
+array dimension: the household arrays have one row per replication.
+"""
+import numpy as np
+import pandas as pd
+
+from model import AdaptationModel
+from agents import Government
+
+
+class Ensemble:
+    """
+    A number of replications of the AdaptationModel that share one landscape.
+    """
+
+    def __init__(self, number_of_replications, seed=None, influence_update='synchronous', **model_parameters):
+        """
+        Parameters
+        ----------
+        number_of_replications: number of replications in the ensemble
+        seed: seed of the landscape, from which the seeds of the replications are derived as well
+        influence_update: "synchronous" (all replications with one sparse matrix product per step) or
+                          "asynchronous" (every replication in its own random activation order, much slower)
+        model_parameters: other parameters of the AdaptationModel, e.g. number_of_households or flood_events
+        """
+        self.number_of_replications = number_of_replications
+        self.seed = seed
+        self.landscape = AdaptationModel(seed=seed, engine='arrays', influence_update=influence_update,
+                                         **model_parameters)
+        # the i-th replication gets the same streams however many replications there are
+        self.streams = self.landscape.streams.spawn(number_of_replications)
+
+        self.household_state = self.landscape.household_state.replicate([streams.attributes for streams in self.streams])
+        # the government of the ensemble inspects and warns the households of all replications at once
+        self.government = Government(unique_id=100, model=self.landscape, fine=self.landscape.fine,
+                                     flood_warning=self.landscape.flood_warning)
+        self.government.household_state = self.household_state
+        self.flood_events = self.landscape.flood_events
+
+        self.steps = 0
+        self._model_records = []
+
+    def collect(self):
+        """Collect the model reporters of every replication."""
+        state = self.household_state
+        self._model_records.append({
+            'total_adapted_households': state.is_adapted.sum(axis=1),
+            'total_flood_damage': state.flood_damage_final.sum(axis=1),
+            'whatif_damage': state.whatif_damage.sum(axis=1),
+            'total_money_saved': state.money_saved.sum(axis=1),
+            'average_perceived_flood_probability': state.perceived_flood_probability.mean(axis=1),
+        })
+
+    def step(self):
+        """Step all replications, in the same order as AdaptationModel.step with the array engine."""
+        self.flood_events.apply(self.landscape, self.steps, household_state=self.household_state,
+                                rngs=[streams.hazards for streams in self.streams])
+        self.collect()
+        activation_order = None
+        if self.household_state.influence_update == 'asynchronous':
+            activation_order = np.stack([streams.behaviour.permutation(self.household_state.number_of_households)
+                                         for streams in self.streams])
+        self.household_state.step(activation_order=activation_order)
+        self.government.step()
+        self.steps += 1
+
+    def run(self, max_steps):
+        """Run all replications for max_steps steps."""
+        for _ in range(max_steps):
+            self.step()
+
+    def get_model_vars_dataframe(self):
+        """
+        Return the collected model reporters, with one row per replication and step,
+        in the same layout as the results of batch_runner.run_batch.
+        """
+        if not self._model_records:
+            return pd.DataFrame()
+        columns = {'iteration': np.tile(np.arange(self.number_of_replications), len(self._model_records)),
+                   'Step': np.repeat(np.arange(len(self._model_records)), self.number_of_replications)}
+        for name in self._model_records[0].keys():
+            columns[name] = np.concatenate([record[name] for record in self._model_records])
+        return pd.DataFrame(columns).sort_values(['iteration', 'Step']).reset_index(drop=True)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Event-driven running of the AdaptationModel.
+
+Most steps of a long run are quiet: the government only inspects when (step_counter + 1) % 8 == 0 and warns when
+step_counter % 10 == 0, floods only happen at the steps of the flood events, and once adaptation has saturated the
+households make the same decisions every step. run_event_driven steps the model normally at the steps where
+something happens, and advances the quiet stretches in between at once when the households are quiescent:
+- no household can decide to take measures before the next event. A household that has not fully adapted wants to
+  take measures once its perceived flood probability exceeds a threshold set by its perceived effectiveness of
+  measures. Between events the perceived flood probability of a household only mixes its own (discounted) value
+  with those of its neighbours, so the largest perceived flood probability cannot increase. If it is below the
+  threshold of every household that has not fully adapted, nothing is decided until the next event.
+- the money saved then grows by the same amount every step, so it is advanced in closed form, and the model
+  reporters of the skipped steps are filled in (they are constant, except the money saved, which grows linearly).
+- without a social network the perceived flood probability decays geometrically by the discount rate, so it is
+  also advanced in closed form. With the synchronous update it takes one sparse product with the influence matrix
+  per step (needed anyway for the average perceived flood probability of every step), without any of the other work
+  of a step. The random activation orders of the skipped steps are still drawn, so the random streams continue as
+  in a normal run, and the run continues the same way as a normal run, up to rounding.
+
+With the asynchronous update and a social network, the perceived flood probability of every step is a sequential
+loop over all households in a new random order, which costs as much as a normal step. Skipping the rest of the step
+gains nothing there, so those models are stepped normally (see can_fast_forward); run_event_driven then only saves
+time by stopping early.
+
+The quiet stretches are only advanced at once with the array engine and Mesa's DataCollector; otherwise the model is
+stepped normally. Optionally the run stops early when the adaptation and the aggregates have converged.
+"""
+import numpy as np
+from mesa.datacollection import DataCollector
+
+from social_network import compile_influence_matrix, influence_synchronous
+
+# the aggregates that have to converge before a run stops early. The money saved keeps growing at a constant rate,
+# so it is not one of them
+converging_reporters = ['total_adapted_households', 'total_flood_damage', 'whatif_damage']
+
+
+def desire_thresholds(perceived_effectiveness_of_measures):
+    """
+    The perceived flood probability above which households want to take measures, as in
+    Households.reconsider_adaptation_measures (infinite if they never want to).
+    """
+    effectiveness = perceived_effectiveness_of_measures
+    return np.select([effectiveness > 4, effectiveness > 3, effectiveness > 2, effectiveness > 1.5, effectiveness > 1],
+                     [0.2, 0.4, 0.6, 0.8, 0.9], default=np.inf)
+
+
+def next_event_step(model):
+    """
+    The first step, from the current step on, at which something happens: a flood event, an inspection or a
+    warning of the government.
+    """
+    step = model.schedule.steps
+    flood_steps = [event_step for event_step in model.flood_events.events_by_step if event_step >= step]
+    # the government counts its steps before it inspects or warns
+    step_counter = model.government.step_counter
+    for steps_ahead in range(40):
+        counter = step_counter + 1 + steps_ahead
+        if (counter + 1) % 8 == 0 or counter % 10 == 0:
+            break
+    return min(flood_steps + [step + steps_ahead])
+
+
+def can_fast_forward(model):
+    """
+    Whether the quiet steps of a model can be advanced faster than by stepping it: without a social network or with
+    the synchronous update, see the module docstring.
+    """
+    state = model.household_state
+    if state is None:
+        return False
+    return len(state.neighbour_indices) == 0 or state.influence_update == 'synchronous'
+
+
+def is_quiescent(model):
+    """
+    Whether no household can decide to take measures before the next event, see the module docstring.
+    Only for the array engine with Mesa's DataCollector; False otherwise.
+    """
+    state = model.household_state
+    if state is None or state.perceived_flood_probability.ndim != 1 or not isinstance(model.datacollector, DataCollector):
+        return False
+    not_adapted = state.taken_measures < 1
+    if not not_adapted.any():
+        return True
+    perceived_flood_damage = state.size_of_house * state.max_damage_dol_per_sqm * state.flood_damage_estimated
+    effectiveness = (perceived_flood_damage + state.fine * 5) / state.perceived_costs_of_measures
+    return state.perceived_flood_probability.max() <= desire_thresholds(effectiveness[not_adapted]).min()
+
+
+def advance_quiescent(model, number_of_steps):
+    """
+    Advance a quiescent model (see is_quiescent and can_fast_forward) by a number of steps without events.
+
+    Parameters
+    ----------
+    model: the AdaptationModel
+    number_of_steps: number of steps, which must all be before the next event (see next_event_step)
+    """
+    state = model.household_state
+    savings = state.income * 0.05
+    no_network = len(state.neighbour_indices) == 0
+    if state.influence_update == 'synchronous' and state.influence_matrix is None:
+        state.influence_matrix, state.own_weight = compile_influence_matrix(
+            state.neighbour_indptr, state.neighbour_indices, state.trust_factor)
+
+    with model.profiler.phase('quiescent'):
+        # the reporters do not change during the quiet steps, except the money saved, which grows linearly
+        steps_ahead = np.arange(number_of_steps)
+        for name, reporter in model.datacollector.model_reporters.items():
+            value = reporter()
+            if name == 'total_money_saved':
+                model.datacollector.model_vars[name].extend((value + steps_ahead * float(savings.sum())).tolist())
+            else:
+                model.datacollector.model_vars[name].extend([value] * number_of_steps)
+
+        # the random activation orders of the skipped steps, so the random streams continue as in a normal run
+        for _ in range(number_of_steps):
+            if model.exact_activation:
+                model.random.shuffle(model.activation_order)
+            elif state.influence_update == 'asynchronous':
+                model.streams.behaviour.permutation(model.number_of_households)
+
+        if no_network:
+            # geometric decay by the discount rate
+            average = float(state.perceived_flood_probability.mean())
+            model.average_perceived_flood_probability_over_time.extend(
+                (average * state.discount_rate ** steps_ahead).tolist())
+            state.perceived_flood_probability *= state.discount_rate ** number_of_steps
+        else:
+            for _ in range(number_of_steps):
+                model.average_perceived_flood_probability_over_time.append(
+                    float(state.perceived_flood_probability.mean()))
+                state.perceived_flood_probability = influence_synchronous(
+                    state.perceived_flood_probability, state.discount_rate, state.influence_matrix, state.own_weight)
+
+        model.government.step_counter += number_of_steps
+        model.schedule.steps += number_of_steps
+        model.schedule.time += number_of_steps
+        state.money_saved += number_of_steps * savings
+        # the perceptions and the desire as they would be after the last of these steps
+        state.construct_perceived_flood_damage()
+        state.construct_perceived_effectiveness_of_measures()
+        state.reconsider_adaptation_measures()
+
+
+def run_event_driven(model, max_steps, tolerance=None, window=40):
+    """
+    Run a model up to max_steps, advancing the quiet stretches between events at once when the households are
+    quiescent, and optionally stop early when the run has converged.
+
+    Parameters
+    ----------
+    model: the AdaptationModel
+    max_steps: step up to which the model is run
+    tolerance: if given, the run stops when no flood events are left and, over the last window steps, the number of
+               adapted households, the flood damages and the average perceived flood probability changed by at most
+               this fraction
+    window: number of steps over which the convergence is checked. The default covers all combinations of
+            inspections (every 8 steps) and warnings (every 10 steps).
+
+    Returns
+    -------
+    steps: the step the model stopped at, max_steps unless it converged earlier
+    """
+    history = []
+    while model.schedule.steps < max_steps:
+        step = model.schedule.steps
+        next_event = min(next_event_step(model), max_steps)
+        if next_event > step and can_fast_forward(model) and is_quiescent(model):
+            advance_quiescent(model, next_event - step)
+        else:
+            model.step()
+
+        if tolerance is not None:
+            history.append((model.schedule.steps, _converging_values(model)))
+            if _has_converged(model, history, tolerance, window):
+                break
+    return model.schedule.steps
+
+
+def _converging_values(model):
+    reporters = model.datacollector.model_reporters
+    values = [float(reporters[name]()) for name in converging_reporters if name in reporters]
+    if model.household_state is not None:
+        values.append(float(model.household_state.perceived_flood_probability.mean()))
+    else:
+        values.append(model.perceived_flood_probability_total / model.number_of_households)
+    return np.array(values)
+
+
+def _has_converged(model, history, tolerance, window):
+    step, values = history[-1]
+    if any(event_step >= step for event_step in model.flood_events.events_by_step):
+        return False
+    earlier = [values_before for step_before, values_before in history if step_before <= step - window]
+    if not earlier:
+        return False
+    values_before = earlier[-1]
+    return bool(np.all(np.abs(values - values_before) <= tolerance * np.abs(values_before)))
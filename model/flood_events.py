@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Flood events and the scheduler that applies them to the households of the Flood Adaptation Model.
+
+A flood event says at which step a flood happens, which flood map gives the flood depths, and optionally which
+zone is flooded and how the actual depths deviate from the map. The depths of all households are gathered from
+the raster in one go and the damage is calculated with array operations. With the "field" noise the deviation
+is drawn per block of raster cells instead of per household, so households close to each other get a similar
+flood, following the raster.
+"""
+import numpy as np
+from rasterio.transform import rowcol
+
+from functions import calculate_flood_damage
+from flood_maps import get_flood_map
+
+
+class FloodEvent:
+    """
+    A flood that happens at a given step.
+    """
+
+    def __init__(self, step, flood_map_choice=None, return_period=None, zone=None, noise='uniform',
+                 noise_range=(0.5, 1.2), noise_cell_size=10):
+        """
+        Parameters
+        ----------
+        step: step at which the flood happens
+        flood_map_choice: flood map that gives the flood depths, "harvey", "100yr" or "500yr".
+                          If None, the estimated flood depths of the households (the flood map of the model) are used.
+        return_period: return period of the flood in years, only used for reporting
+        zone: Shapely (multi)polygon of the flooded zone. If None, the whole model domain is flooded.
+        noise: how the actual flood depth deviates from the flood map. "uniform": a factor drawn for every household,
+               "field": a factor drawn for every block of noise_cell_size by noise_cell_size raster cells, "none": no deviation
+        noise_range: lower and upper bound of the factor the flood depth is multiplied with
+        noise_cell_size: size of the blocks of the "field" noise, in raster cells
+        """
+        if noise not in ['uniform', 'field', 'none']:
+            raise ValueError(f"Unknown noise: '{noise}'. "
+                             f"Currently implemented noises are: 'uniform', 'field' and 'none'")
+        self.step = step
+        self.flood_map_choice = flood_map_choice
+        self.return_period = return_period
+        self.zone = zone
+        self.noise = noise
+        self.noise_range = noise_range
+        self.noise_cell_size = noise_cell_size
+
+
+class FloodEventScheduler:
+    """
+    A timeline of flood events. The events of a step are applied to all households at once.
+    """
+
+    def __init__(self, events):
+        self.events = sorted(events, key=lambda event: event.step)
+        self.events_by_step = {}
+        for event in self.events:
+            self.events_by_step.setdefault(event.step, []).append(event)
+        # record of the applied events
+        self.history = []
+        # flood depths and raster cells of the households, per flood map. The households do not move.
+        self._household_depths = {}
+        self._household_cells = {}
+
+    @classmethod
+    def from_return_periods(cls, return_periods, number_of_steps, rng, steps_per_year=4, **event_parameters):
+        """
+        Make a timeline of random flood events, where a flood of each flood map happens on average once per return period.
+
+        Parameters
+        ----------
+        return_periods: dictionary with the flood map choice as key and its return period in years as value
+        number_of_steps: number of steps of the run
+        rng: numpy random Generator used to draw the events
+        steps_per_year: number of steps in a year, 4 as the model works with quarters
+        event_parameters: other parameters of the FloodEvents, e.g. noise
+
+        Returns
+        -------
+        flood_event_scheduler: the FloodEventScheduler with the drawn events
+        """
+        events = []
+        for flood_map_choice, return_period in return_periods.items():
+            happens = rng.random(number_of_steps) < 1 / (return_period * steps_per_year)
+            for step in np.flatnonzero(happens):
+                events.append(FloodEvent(int(step), flood_map_choice=flood_map_choice, return_period=return_period,
+                                         **event_parameters))
+        return cls(events)
+
+    def for_model(self):
+        """
+        A scheduler with the same events, an empty history and no flood depths of households yet. Every model works on
+        its own, so one scheduler can be given to several models (e.g. the runs of a batch or an ensemble).
+        """
+        return type(self)(self.events)
+
+    def events_at(self, step):
+        """Return the flood events that happen at the given step."""
+        return self.events_by_step.get(step, [])
+
+    def apply(self, model, step, household_state=None, rngs=None):
+        """
+        Apply the flood events of the given step to the households of the model.
+        An ensemble (see ensemble.py) gives its own household state, with one row per replication, and one random
+        generator per replication. Otherwise the noise is drawn from the hazards stream of the model.
+        """
+        for event in self.events_at(step):
+            self.apply_event(model, event, household_state=household_state, rngs=rngs)
+
+    def household_depths(self, model, flood_map_choice):
+        """Flood depths of all households on a flood map, negative depths set to zero."""
+        if flood_map_choice is None:
+            if model.household_state is not None:
+                return model.household_state.flood_depth_estimated
+            return np.array([household.flood_depth_estimated for household in model.household_agents])
+        if flood_map_choice not in self._household_depths:
+            flood_map = get_flood_map(flood_map_choice, in_memory=model.flood_maps_in_memory)
+            depths = flood_map.get_depths(model.household_x, model.household_y)
+            self._household_depths[flood_map_choice] = np.maximum(depths, 0)
+        return self._household_depths[flood_map_choice]
+
+    def household_cells(self, model, flood_map_choice):
+        """Raster rows and columns of all households on a flood map."""
+        if flood_map_choice not in self._household_cells:
+            flood_map = get_flood_map(flood_map_choice if flood_map_choice is not None else model.flood_map_choice,
+                                      in_memory=model.flood_maps_in_memory)
+            self._household_cells[flood_map_choice] = rowcol(flood_map.transform, model.household_x, model.household_y)
+        return self._household_cells[flood_map_choice]
+
+    def draw_factors(self, model, event, rng):
+        """Draw the factor the flood depth of every household is multiplied with."""
+        number_of_households = model.number_of_households
+        low, high = event.noise_range
+        if event.noise == 'none':
+            return np.ones(number_of_households)
+        if event.noise == 'uniform':
+            return rng.uniform(low, high, size=number_of_households)
+        # one factor per block of raster cells, shared by all households within that block
+        rows, cols = self.household_cells(model, event.flood_map_choice)
+        blocks = np.stack([rows // event.noise_cell_size, cols // event.noise_cell_size])
+        unique_blocks, block_of_household = np.unique(blocks, axis=1, return_inverse=True)
+        block_factors = rng.uniform(low, high, size=unique_blocks.shape[1])
+        return block_factors[block_of_household.ravel()]
+
+    def apply_event(self, model, event, household_state=None, rngs=None):
+        """
+        Flood the households: the actual flood depth is the flood map depth times the drawn factor,
+        and the damage of the flood is added to the final damage and what-if damage of the households.
+        """
+        state = household_state if household_state is not None else model.household_state
+        depths = self.household_depths(model, event.flood_map_choice)
+        if rngs is None:
+            factors = self.draw_factors(model, event, model.streams.hazards)
+        else:
+            factors = np.stack([self.draw_factors(model, event, rng) for rng in rngs])
+        flood_depth_actual = depths * factors
+        flooded = np.ones(model.number_of_households, dtype=bool)
+        if event.zone is not None:
+            flooded = model.spatial_index.mask(model.spatial_index.within_polygon(event.zone))
+            flood_depth_actual = np.where(flooded, flood_depth_actual, 0.0)
+
+        # calculate the actual flood damage given the actual flood depth
+        flood_damage_actual = calculate_flood_damage(flood_depth_actual, model.depth_damage_curve)
+        if state is not None:
+            taken_measures, size_of_house = state.taken_measures, state.size_of_house
+        else:
+            taken_measures = np.array([household.taken_measures for household in model.household_agents])
+            size_of_house = np.array([household.size_of_house for household in model.household_agents])
+        flood_damage = np.maximum(flood_damage_actual - taken_measures, 0) * size_of_house * model.max_damage_dol_per_sqm
+        whatif_damage = flood_damage_actual * size_of_house * model.max_damage_dol_per_sqm
+        flood_damage = np.where(flooded, flood_damage, 0.0)
+        whatif_damage = np.where(flooded, whatif_damage, 0.0)
+
+        if state is not None:
+            state.flood_depth_actual = np.where(flooded, flood_depth_actual, state.flood_depth_actual)
+            state.flood_damage_actual = np.where(flooded, flood_damage_actual, state.flood_damage_actual)
+            state.flood_damage_final += flood_damage
+            state.whatif_damage += whatif_damage
+        else:
+            for i in np.flatnonzero(flooded):
+                household = model.household_agents[i]
+                household.flood_depth_actual = flood_depth_actual[i]
+                household.flood_damage_actual = flood_damage_actual[i]
+                household.flood_damage_final += flood_damage[i]
+                household.whatif_damage += whatif_damage[i]
+            # kept up to date for the model reporters of the agents engine
+            model.flood_damage_total += flood_damage.sum()
+            model.whatif_damage_total += whatif_damage.sum()
+
+        # the damages of an ensemble are recorded per replication
+        self.history.append({'step': event.step, 'flood_map_choice': event.flood_map_choice,
+                             'return_period': event.return_period, 'households_flooded': int(flooded.sum()),
+                             'flood_damage': flood_damage.sum(axis=-1).tolist(),
+                             'whatif_damage': whatif_damage.sum(axis=-1).tolist()})
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Compact cache of the flood maps, clipped to the model domain.
+
+The model only samples the flood maps within the bounds of the model domain, so a preprocessing step
+(build_flood_map_cache) clips every scenario to these bounds, with a margin of a few cells for the off-by-one
+sampling of get_depth, and stores the depths as int16 centimetres. Cells with the nodata value of the original flood
+map are stored as -32768 and read back as that nodata value; NaN cells are stored as -32767 and read back as NaN.
+All scenarios are stacked into one .npy file (one layer per scenario, rows in order) with a JSON file of metadata
+next to it. The .npy file is opened as a memory map, so a
+later run opens the cache at once and only the pages that are sampled are read from disk.
+
+The cached depths are rounded to whole centimetres, so the cache is only used after flood_maps.use_flood_map_cache()
+is called. The flood map registry (flood_maps.get_flood_map) then reads the scenarios that were cached from the
+current flood map files for the current model domain from the cache instead of the GeoTIFFs, and the depths of all
+cached scenarios at the household locations are read with one gather (FloodMapCache.get_depths).
+"""
+import json
+import os
+
+import numpy as np
+import rasterio as rs
+from rasterio.transform import rowcol, Affine
+from rasterio.windows import Window
+
+# values of cells without data (nodata and NaN) in the cache, and the scale of the stored values (centimetres)
+cache_nodata = -32768
+cache_nan = -32767
+depth_scale = 0.01
+
+
+def _source_signature(path):
+    # the cache is out of date when a flood map file changes
+    status = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+
+def build_flood_map_cache(cache_path, flood_map_paths, domain_bounds, margin=2):
+    """
+    Clip the flood maps to the model domain, convert them to int16 centimetres and stack them into one cache.
+
+    Parameters
+    ----------
+    cache_path: path of the cache without extension; cache_path.npy and cache_path.json are written
+    flood_map_paths: dictionary with the paths of the flood maps, keyed by scenario. All flood maps must have the
+                     same grid (transform and size).
+    domain_bounds: (minx, miny, maxx, maxy) of the model domain
+    margin: number of cells added around the domain bounds
+
+    Returns
+    -------
+    cache: the FloodMapCache that was written
+    """
+    flood_map_choices = list(flood_map_paths)
+    datasets = [rs.open(flood_map_paths[flood_map_choice]) for flood_map_choice in flood_map_choices]
+    try:
+        first = datasets[0]
+        for flood_map_choice, dataset in zip(flood_map_choices, datasets):
+            if dataset.transform != first.transform or dataset.shape != first.shape:
+                raise ValueError(f"The flood map '{flood_map_choice}' does not have the same grid as the flood map "
+                                 f"'{flood_map_choices[0]}'; only flood maps on the same grid can be stacked")
+
+        # the window of the domain bounds, with a margin for the cell above and left of every household's cell
+        minx, miny, maxx, maxy = domain_bounds
+        rows, cols = rowcol(first.transform, [minx, maxx, minx, maxx], [miny, miny, maxy, maxy])
+        row_off = max(int(min(rows)) - 1 - margin, 0)
+        col_off = max(int(min(cols)) - 1 - margin, 0)
+        row_end = min(int(max(rows)) + margin + 1, first.height)
+        col_end = min(int(max(cols)) + margin + 1, first.width)
+        window = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+        stack = np.lib.format.open_memmap(f'{cache_path}.npy', mode='w+', dtype=np.int16,
+                                          shape=(len(datasets), row_end - row_off, col_end - col_off))
+        nodata_values = []
+        for layer, dataset in enumerate(datasets):
+            depths = dataset.read(1, window=window).astype(np.float64)
+            nodata = depths == dataset.nodata if dataset.nodata is not None else np.zeros(depths.shape, dtype=bool)
+            centimetres = np.clip(np.round(depths / depth_scale), cache_nan + 1, np.iinfo(np.int16).max)
+            centimetres = np.where(np.isnan(depths), cache_nan, np.nan_to_num(centimetres))
+            stack[layer] = np.where(nodata, cache_nodata, centimetres).astype(np.int16)
+            nodata_values.append(dataset.nodata)
+        stack.flush()
+        del stack
+
+        metadata = {
+            'flood_map_choices': flood_map_choices,
+            'sources': [_source_signature(flood_map_paths[flood_map_choice]) for flood_map_choice in flood_map_choices],
+            'nodata': nodata_values,
+            'dtype': str(first.dtypes[0]),
+            'transform': list(first.transform)[:6],
+            'shape': [first.height, first.width],
+            'bounds': list(first.bounds),
+            'row_off': row_off,
+            'col_off': col_off,
+            'domain_bounds': [float(bound) for bound in domain_bounds],
+            'depth_scale': depth_scale,
+        }
+    finally:
+        for dataset in datasets:
+            dataset.close()
+    with open(f'{cache_path}.json', 'w') as metadata_file:
+        json.dump(metadata, metadata_file, indent=2)
+    return FloodMapCache(cache_path)
+
+
+class FloodMapCache:
+    """
+    A flood map cache written by build_flood_map_cache, opened as a memory map.
+    Rows and columns are those of the original flood maps; the cache holds the window from row_off and col_off.
+    """
+
+    def __init__(self, cache_path):
+        with open(f'{cache_path}.json') as metadata_file:
+            self.metadata = json.load(metadata_file)
+        self.cache_path = cache_path
+        self.stack = np.load(f'{cache_path}.npy', mmap_mode='r')
+        self.flood_map_choices = self.metadata['flood_map_choices']
+        self.layers = {flood_map_choice: layer for layer, flood_map_choice in enumerate(self.flood_map_choices)}
+        self.transform = Affine(*self.metadata['transform'])
+        self.row_off = self.metadata['row_off']
+        self.col_off = self.metadata['col_off']
+        self.dtype = np.dtype(self.metadata['dtype'])
+        self.nodata = np.array([np.nan if nodata is None else nodata for nodata in self.metadata['nodata']])
+
+    def is_valid_for(self, flood_map_choice, path, domain_bounds):
+        """Whether the cache holds the scenario, built from the current file at path, for these domain bounds."""
+        if flood_map_choice not in self.layers or not os.path.exists(path):
+            return False
+        if self.metadata['sources'][self.layers[flood_map_choice]] != _source_signature(path):
+            return False
+        return np.allclose(self.metadata['domain_bounds'], domain_bounds)
+
+    def read_cells(self, layers, rows, cols):
+        """
+        Depths of cells of the original flood maps, for one or more layers at once.
+
+        Parameters
+        ----------
+        layers: layer index or array of layer indices
+        rows, cols: arrays of rows and columns of the original flood maps
+
+        Returns
+        -------
+        depths: array of depths in metres, with the nodata value of the flood map for nodata cells and cells
+                outside the cached window, and NaN for NaN cells
+        """
+        layers = np.atleast_1d(layers)
+        rows = np.asarray(rows) - self.row_off
+        cols = np.asarray(cols) - self.col_off
+        inside = (rows >= 0) & (rows < self.stack.shape[1]) & (cols >= 0) & (cols < self.stack.shape[2])
+        centimetres = self.stack[layers[:, None], np.where(inside, rows, 0).ravel(), np.where(inside, cols, 0).ravel()]
+        depths = np.where(centimetres == cache_nan, np.nan, centimetres * depth_scale)
+        missing = (centimetres == cache_nodata) | ~inside.ravel()
+        depths = np.where(missing, self.nodata[layers][:, None], depths).astype(self.dtype)
+        return depths.reshape((len(layers),) + np.shape(rows))
+
+    def get_depths(self, flood_map_choices, x, y):
+        """
+        Depths of several scenarios at many locations with one gather, the same way as SharedFloodMap.get_depths.
+
+        Parameters
+        ----------
+        flood_map_choices: scenarios to read
+        x, y: arrays of location coordinates
+
+        Returns
+        -------
+        depths: dictionary with an array of depths per scenario
+        """
+        rows, cols = rowcol(self.transform, x, y)
+        layers = [self.layers[flood_map_choice] for flood_map_choice in flood_map_choices]
+        depths = self.read_cells(layers, np.asarray(rows) - 1, np.asarray(cols) - 1)
+        return dict(zip(flood_map_choices, depths))
+
+
+class CachedFloodMap:
+    """
+    A scenario of a FloodMapCache with the interface of SharedFloodMap, used by the flood map registry.
+    """
+
+    def __init__(self, flood_map_choice, path, cache, in_memory=True):
+        self.flood_map_choice = flood_map_choice
+        self.path = path
+        self.in_memory = in_memory
+        self.cache = cache
+        self.layer = cache.layers[flood_map_choice]
+        self.transform = cache.transform
+        self.bound_left, self.bound_bottom, self.bound_right, self.bound_top = cache.metadata['bounds']
+        self._dataset = None
+        self._band = None
+
+    @property
+    def dataset(self):
+        """The GeoTIFF of the flood map itself, only opened when it is asked for."""
+        if self._dataset is None:
+            self._dataset = rs.open(self.path)
+        return self._dataset
+
+    @property
+    def band(self):
+        """
+        Band 1 of the flood map itself, indexed by the rows and columns of the full raster, for code that indexes the
+        raster directly (e.g. get_flood_depth in functions.py). It is only read when it is asked for; the depths of
+        the households are read from the cache.
+        """
+        if self._band is None:
+            band = self.dataset.read(1)
+            band.flags.writeable = False
+            self._band = band
+        return self._band
+
+    def read_window(self, row_off, col_off, height, width):
+        """Read a window of band 1, in rows and columns of the original flood map."""
+        rows, cols = np.indices((height, width))
+        return self.cache.read_cells(self.layer, rows + row_off, cols + col_off)[0]
+
+    def get_depth(self, location):
+        """To get the flood depth of a specific location, the same way as SharedFloodMap.get_depth."""
+        row, col = rowcol(self.transform, location.x, location.y)
+        return self.cache.read_cells(self.layer, np.array([row - 1]), np.array([col - 1]))[0, 0]
+
+    def get_depths(self, x, y):
+        """To get the flood depths of many locations at once, the same way as SharedFloodMap.get_depths."""
+        return self.cache.get_depths([self.flood_map_choice], x, y)[self.flood_map_choice]
+
+    def close(self):
+        if self._dataset is not None:
+            self._dataset.close()
+            self._dataset = None
+        self._band = None
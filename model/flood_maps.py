@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide registry of the flood maps used by the Flood Adaptation Model.
+
+Every flood map (scenario) is opened once per process. The band is read at most once and shared as a
+read-only array between the AdaptationModel and all agents, so the memory use does not grow with the
+number of households. Large rasters can also be used without reading the full band, through windowed access.
+
+Optionally the flood maps are read from a flood map cache (see flood_map_cache.py), with depths rounded to whole
+centimetres. The cache is off by default, so the results do not depend on whether a cache file exists; it is
+switched on for the process with use_flood_map_cache(). The scenarios that were cached from the current flood maps
+for the current model domain are then read from the cache: it is opened at once as a memory map, and the depths of all
+scenarios at the household locations are read with one gather (get_household_depths).
+Build the cache with "python flood_maps.py".
+"""
+import os
+
+import rasterio as rs
+from rasterio.transform import rowcol
+from rasterio.windows import Window
+
+from functions import geodata
+from flood_map_cache import build_flood_map_cache, FloodMapCache, CachedFloodMap
+
+# Paths to the flood maps, keyed by scenario
+flood_map_paths = {
+    'harvey': r'../input_data/floodmaps/Harvey_depth_meters.tif',
+    '100yr': r'../input_data/floodmaps/100yr_storm_depth_meters.tif',
+    '500yr': r'../input_data/floodmaps/500yr_storm_depth_meters.tif'
+}
+
+# Path of the flood map cache that is built by "python flood_maps.py", without extension
+default_flood_map_cache_path = r'../input_data/floodmaps/flood_map_cache'
+
+# Path of the flood map cache used in this process, None to read the flood maps themselves (see use_flood_map_cache)
+flood_map_cache_path = None
+
+# Flood maps that are already opened in this process, keyed by scenario
+_shared_flood_maps = {}
+
+# The opened flood map cache of this process, or False if there is no cache at flood_map_cache_path
+_flood_map_cache = None
+
+
+class SharedFloodMap:
+    """
+    A flood map that is opened once and shared by the model and all agents.
+    The band is only read when it is first needed and is then kept as a read-only array.
+    When in_memory is False the band is never read as a whole; depths are read through small windows instead.
+    """
+
+    def __init__(self, flood_map_choice, path, in_memory=True):
+        self.flood_map_choice = flood_map_choice
+        self.path = path
+        self.in_memory = in_memory
+        self.dataset = rs.open(path)
+        self.transform = self.dataset.transform
+        self.bound_left = self.dataset.bounds.left
+        self.bound_right = self.dataset.bounds.right
+        self.bound_top = self.dataset.bounds.top
+        self.bound_bottom = self.dataset.bounds.bottom
+        self._band = None
+
+    @property
+    def band(self):
+        """Band 1 of the flood map. Read on first use and shared as a read-only array."""
+        if self._band is None:
+            band = self.dataset.read(1)
+            band.flags.writeable = False
+            self._band = band
+        return self._band
+
+    def read_window(self, row_off, col_off, height, width):
+        """
+        Read a window of band 1 without reading the full band.
+
+        Parameters
+        ----------
+        row_off, col_off: row and column of the upper left cell of the window
+        height, width: size of the window in cells
+
+        Returns
+        -------
+        window: array with the flood depths within the window
+        """
+        return self.dataset.read(1, window=Window(col_off, row_off, width, height))
+
+    def get_depth(self, location):
+        """
+        To get the flood depth of a specific location, the same way as get_flood_depth in functions.py.
+
+        Parameters
+        ----------
+        location: household location (a Shapely Point) on the map
+
+        Returns
+        -------
+        depth: flood depth at the given location
+        """
+        row, col = self.dataset.index(location.x, location.y)
+        if self.in_memory:
+            return self.band[row - 1, col - 1]
+        return self.read_window(row - 1, col - 1, 1, 1)[0, 0]
+
+    def get_depths(self, x, y):
+        """
+        To get the flood depths of many locations at once, the same way as get_depth.
+
+        Parameters
+        ----------
+        x, y: arrays of location coordinates
+
+        Returns
+        -------
+        depths: array of flood depths at the given locations
+        """
+        rows, cols = rowcol(self.transform, x, y)
+        rows = rows - 1
+        cols = cols - 1
+        if self.in_memory:
+            return self.band[rows, cols]
+        # only read the window that contains all locations
+        row_off, col_off = rows.min(), cols.min()
+        window = self.read_window(row_off, col_off, rows.max() - row_off + 1, cols.max() - col_off + 1)
+        return window[rows - row_off, cols - col_off]
+
+    def close(self):
+        self.dataset.close()
+        self._band = None
+
+
+def get_flood_map(flood_map_choice, in_memory=True):
+    """
+    Get the shared flood map of a scenario. The flood map is opened the first time it is asked for.
+
+    Parameters
+    ----------
+    flood_map_choice: scenario of the flood map, "harvey", "100yr" or "500yr"
+    in_memory: whether the full band may be read into memory. If False, depths are read through windows.
+
+    Returns
+    -------
+    shared_flood_map: the SharedFloodMap of the scenario, or a CachedFloodMap if it is read from the flood map cache
+    """
+    if flood_map_choice not in flood_map_paths.keys():
+        raise ValueError(f"Unknown flood map choice: '{flood_map_choice}'. "
+                         f"Currently implemented choices are: {list(flood_map_paths.keys())}")
+
+    shared_flood_map = _shared_flood_maps.get(flood_map_choice)
+    if shared_flood_map is None:
+        path = flood_map_paths[flood_map_choice]
+        cache = get_flood_map_cache()
+        if cache is not None and cache.is_valid_for(flood_map_choice, path, geodata.map_bounds):
+            shared_flood_map = CachedFloodMap(flood_map_choice, path, cache, in_memory=in_memory)
+        else:
+            shared_flood_map = SharedFloodMap(flood_map_choice, path, in_memory=in_memory)
+        _shared_flood_maps[flood_map_choice] = shared_flood_map
+    elif in_memory and not shared_flood_map.in_memory:
+        # someone needs the full band, so the already opened map may keep it from now on
+        shared_flood_map.in_memory = True
+    return shared_flood_map
+
+
+def get_flood_map_cache():
+    """The flood map cache at flood_map_cache_path, opened once per process, or None if there is none."""
+    global _flood_map_cache
+    if _flood_map_cache is None:
+        exists = flood_map_cache_path is not None and os.path.exists(f'{flood_map_cache_path}.json') \
+            and os.path.exists(f'{flood_map_cache_path}.npy')
+        _flood_map_cache = FloodMapCache(flood_map_cache_path) if exists else False
+    return _flood_map_cache or None
+
+
+def use_flood_map_cache(cache_path=default_flood_map_cache_path):
+    """
+    Read the flood maps of this process from a flood map cache, or from the flood maps themselves again.
+    The flood maps that are already opened are closed.
+
+    Parameters
+    ----------
+    cache_path: path of the cache without extension, or None to stop using a cache
+    """
+    global flood_map_cache_path
+    close_flood_maps()
+    flood_map_cache_path = cache_path
+
+
+def get_household_depths(flood_map_choices, x, y, in_memory=True):
+    """
+    The flood depths of many locations on several flood maps, the same way as SharedFloodMap.get_depths.
+    The scenarios that are read from the flood map cache are all read with one gather.
+
+    Parameters
+    ----------
+    flood_map_choices: scenarios of the flood maps
+    x, y: arrays of location coordinates
+    in_memory: whether the full bands may be read into memory
+
+    Returns
+    -------
+    depths: dictionary with an array of flood depths per scenario
+    """
+    flood_maps = {flood_map_choice: get_flood_map(flood_map_choice, in_memory=in_memory)
+                  for flood_map_choice in flood_map_choices}
+    cached = [flood_map_choice for flood_map_choice, flood_map in flood_maps.items()
+              if isinstance(flood_map, CachedFloodMap)]
+    depths = get_flood_map_cache().get_depths(cached, x, y) if cached else {}
+    for flood_map_choice, flood_map in flood_maps.items():
+        if flood_map_choice not in depths:
+            depths[flood_map_choice] = flood_map.get_depths(x, y)
+    return depths
+
+
+def close_flood_maps():
+    """Close all flood maps that are opened in this process."""
+    global _flood_map_cache
+    for shared_flood_map in _shared_flood_maps.values():
+        shared_flood_map.close()
+    _shared_flood_maps.clear()
+    _flood_map_cache = None
+
+
+if __name__ == '__main__':
+    # Build the flood map cache of all flood maps, clipped to the model domain
+    close_flood_maps()
+    cache = build_flood_map_cache(default_flood_map_cache_path, flood_map_paths, geodata.map_bounds)
+    print(f"Flood map cache written to '{default_flood_map_cache_path}.npy': {len(cache.flood_map_choices)} scenarios of "
+          f"{cache.stack.shape[1]} x {cache.stack.shape[2]} cells, {cache.stack.nbytes / 1e6:.1f} MB")
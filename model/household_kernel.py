@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Household step kernel with the exact activation semantics of the agents engine.
+
+With Mesa's RandomActivation every household does its whole step (Households.step) before the next household is
+activated, so a household sees the perceived flood probability of the neighbours activated before it in the same
+step, and the government is activated somewhere in between. step_households steps a sequence of households of a
+HouseholdState one by one in the same way, on the arrays and the neighbour lists of the state, so an array model
+activated in the order of the agents engine gives the same household states.
+
+Numba is an optional dependency of the model (pip install numba); nothing else needs it. If it is installed, the loop
+is compiled to native code, and so is the asynchronous social influence of the array engine (compiled_influence).
+Otherwise the rules that only use a household's own state are evaluated with array operations for all given
+households, and only the social influence is done one household at a time; the results are the same.
+tests/test_household_kernel.py checks that exact activation gives the same households as the agents engine.
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _step_households_loop(households, indptr, indices, income, money_saved, trust_factor,
+                          perceived_flood_probability, size_of_house, flood_damage_estimated,
+                          perceived_costs_of_measures, perceived_flood_damage, perceived_effectiveness_of_measures,
+                          desire_to_take_measures, taken_measures, is_adapted, measures_changed, discount_rate, fine,
+                          elevation_costs_per_square_metre, max_damage_dol_per_sqm):
+    # the rules of Households.step, in the same order and with the same arithmetic
+    for position in range(len(households)):
+        household = households[position]
+        # save_money
+        money_saved[household] += income[household] * 0.05
+
+        # construct_perceived_flood_probability
+        probability = discount_rate * perceived_flood_probability[household]
+        for entry in range(indptr[household], indptr[household + 1]):
+            neighbour = indices[entry]
+            probability = (probability * (1 - trust_factor[neighbour]) +
+                           trust_factor[neighbour] * perceived_flood_probability[neighbour])
+        perceived_flood_probability[household] = probability
+
+        # construct_perceived_flood_damage and construct_perceived_effectiveness_of_measures
+        damage = size_of_house[household] * max_damage_dol_per_sqm * flood_damage_estimated[household]
+        perceived_flood_damage[household] = damage
+        effectiveness = (damage + fine * 5) / perceived_costs_of_measures[household]
+        perceived_effectiveness_of_measures[household] = effectiveness
+
+        # reconsider_adaptation_measures
+        desire = ((effectiveness > 4 and probability > 0.2) or (effectiveness > 3 and probability > 0.4) or
+                  (effectiveness > 2 and probability > 0.6) or (effectiveness > 1.5 and probability > 0.8) or
+                  (effectiveness > 1 and probability > 0.9))
+        desire_to_take_measures[household] = desire
+
+        # take_adaptation_measures
+        if taken_measures[household] < 1 and desire:
+            money_to_spend_on_measures = money_saved[household]
+            elevation_costs = size_of_house[household] * elevation_costs_per_square_metre
+            if money_to_spend_on_measures >= elevation_costs:
+                taken_measures[household] = 1.0
+                money_saved[household] -= elevation_costs
+                measures_changed[household] = True
+            elif 1.000 < money_to_spend_on_measures < elevation_costs:
+                taken_measures[household] += money_to_spend_on_measures / elevation_costs
+                measures_changed[household] = True
+
+        if taken_measures[household] > 0.8:
+            is_adapted[household] = True
+
+
+def _influence_loop(households, indptr, indices, trust_factor, perceived_flood_probability, discount_rate):
+    # only the social influence of construct_perceived_flood_probability, e.g. for steps without decisions
+    for position in range(len(households)):
+        household = households[position]
+        probability = discount_rate * perceived_flood_probability[household]
+        for entry in range(indptr[household], indptr[household + 1]):
+            neighbour = indices[entry]
+            probability = (probability * (1 - trust_factor[neighbour]) +
+                           trust_factor[neighbour] * perceived_flood_probability[neighbour])
+        perceived_flood_probability[household] = probability
+
+
+if numba is not None:
+    _compiled_step_households = numba.njit(cache=True)(_step_households_loop)
+    compiled_influence = numba.njit(cache=True)(_influence_loop)
+else:
+    _compiled_step_households = None
+    # without Numba, HouseholdState._influence_asynchronous loops over Python lists instead
+    compiled_influence = None
+
+
+def step_households(household_state, households):
+    """
+    Step the given households one after another, as RandomActivation does with the Households agents.
+
+    Parameters
+    ----------
+    household_state: the HouseholdState (with one row per household, not an ensemble)
+    households: array with the households in the order they are activated
+    """
+    state = household_state
+    households = np.asarray(households, dtype=np.int64)
+    if _compiled_step_households is not None:
+        _compiled_step_households(households, state.neighbour_indptr, state.neighbour_indices, state.income,
+                                  state.money_saved, state.trust_factor, state.perceived_flood_probability,
+                                  state.size_of_house, state.flood_damage_estimated, state.perceived_costs_of_measures,
+                                  state.perceived_flood_damage, state.perceived_effectiveness_of_measures,
+                                  state.desire_to_take_measures, state.taken_measures, state.is_adapted,
+                                  state.measures_changed, float(state.discount_rate), float(state.fine),
+                                  float(state.elevation_costs_per_square_metre), float(state.max_damage_dol_per_sqm))
+        return
+
+    # Without Numba: the money is saved by all given households before the social influence, which does not
+    # change the result because a household's money is not used by the other households
+    state.money_saved[households] += state.income[households] * 0.05
+    state.perceived_flood_probability[:] = state._influence_asynchronous(state.perceived_flood_probability, households)
+
+    damage = state.size_of_house[households] * state.max_damage_dol_per_sqm * state.flood_damage_estimated[households]
+    effectiveness = (damage + state.fine * 5) / state.perceived_costs_of_measures[households]
+    probability = state.perceived_flood_probability[households]
+    state.perceived_flood_damage[households] = damage
+    state.perceived_effectiveness_of_measures[households] = effectiveness
+    desire = (((effectiveness > 4) & (probability > 0.2)) | ((effectiveness > 3) & (probability > 0.4)) |
+              ((effectiveness > 2) & (probability > 0.6)) | ((effectiveness > 1.5) & (probability > 0.8)) |
+              ((effectiveness > 1) & (probability > 0.9)))
+    state.desire_to_take_measures[households] = desire
+
+    taken_measures = state.taken_measures[households]
+    money_saved = state.money_saved[households]
+    elevation_costs = state.size_of_house[households] * state.elevation_costs_per_square_metre
+    considering = (taken_measures < 1) & desire
+    can_pay_all = considering & (money_saved >= elevation_costs)
+    can_pay_part = considering & (1.000 < money_saved) & (money_saved < elevation_costs)
+    state.taken_measures[households] = np.where(can_pay_all, 1.0,
+                                                np.where(can_pay_part, taken_measures + money_saved / elevation_costs,
+                                                         taken_measures))
+    state.money_saved[households] = np.where(can_pay_all, money_saved - elevation_costs, money_saved)
+    state.measures_changed[households] |= can_pay_all | can_pay_part
+    state.is_adapted[households] |= state.taken_measures[households] > 0.8
+
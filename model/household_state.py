@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Array-backed household state for the Flood Adaptation Model.
+
+The state of all households is stored in NumPy arrays (one array per attribute) and the rules of
+Households.step in agents.py are evaluated for all households at once. The Households agent class
+remains the reference implementation; the methods below carry the same names as its methods.
+
+Only the synchronous social influence is fully vectorized. The asynchronous influence (the default, as in the agents
+engine) is sequential by nature: every household sees the values of the neighbours activated before it in the same
+step. Without Numba it is a loop over the households in Python, so an array step costs about 1.4 microseconds per
+household against about 33 for the agents engine (10,000 households), some 20 times faster. The two orders of
+magnitude are only reached with influence_update='synchronous' (about 0.1 microseconds per household) or with Numba
+installed, which compiles the asynchronous loop (see household_kernel.py).
+"""
+import copy
+
+import numpy as np
+
+from functions import calculate_flood_damage
+from social_network import neighbour_lists_from_network, compile_influence_matrix, influence_synchronous
+from household_kernel import compiled_influence
+
+
+class HouseholdState:
+    """
+    The state of all households of a model, stored as arrays. Household i is the household on network node i.
+    """
+
+    def __init__(self, number_of_households, fine=0, discount_rate=0.99, elevation_costs_per_square_metre=290,
+                 max_damage_dol_per_sqm=1216.65, influence_update='asynchronous'):
+        self.number_of_households = number_of_households
+        # "asynchronous" or "synchronous" update of the perceived flood probability, see social_network.py
+        self.influence_update = influence_update
+        self.fine = fine
+        self.discount_rate = discount_rate
+        self.elevation_costs_per_square_metre = elevation_costs_per_square_metre
+        self.max_damage_dol_per_sqm = max_damage_dol_per_sqm
+
+        # location related attributes
+        self.x = np.zeros(number_of_households)
+        self.y = np.zeros(number_of_households)
+        self.in_floodplain = np.zeros(number_of_households, dtype=bool)
+        self.flood_depth_estimated = np.zeros(number_of_households)
+        self.flood_damage_estimated = np.zeros(number_of_households)
+        self.flood_depth_Harvey = np.zeros(number_of_households)
+        self.flood_depth_actual = np.zeros(number_of_households)
+        self.flood_damage_actual = np.zeros(number_of_households)
+        self.flood_damage_final = np.zeros(number_of_households)
+        self.whatif_damage = np.zeros(number_of_households)
+
+        # household attributes
+        self.size_of_house = np.zeros(number_of_households)
+        self.income = np.zeros(number_of_households)
+        self.money_saved = np.zeros(number_of_households)
+        self.trust_factor = np.zeros(number_of_households)
+        self.taken_measures = np.zeros(number_of_households)
+        self.is_adapted = np.zeros(number_of_households, dtype=bool)
+        # whether the taken measures changed since the last inspection of the government
+        self.measures_changed = np.zeros(number_of_households, dtype=bool)
+
+        # perception and decision attributes
+        self.perceived_flood_probability = np.zeros(number_of_households)
+        self.perceived_costs_of_measures = np.zeros(number_of_households)
+        self.perceived_flood_damage = np.full(number_of_households, np.nan)
+        self.perceived_effectiveness_of_measures = np.full(number_of_households, np.nan)
+        self.desire_to_take_measures = np.zeros(number_of_households, dtype=bool)
+
+        # social network, see neighbour_lists_from_network
+        self.neighbour_indptr = np.zeros(number_of_households + 1, dtype=np.int64)
+        self.neighbour_indices = np.zeros(0, dtype=np.int64)
+        self.friends_count = np.zeros(number_of_households, dtype=np.int64)
+        # trust weighted influence matrix, compiled on first use by the synchronous update
+        self.influence_matrix = None
+        self.own_weight = None
+        # trust factors and neighbour lists as Python lists for the asynchronous update, made on first use
+        self._influence_lists = None
+        # PhaseTimer of the model, which times the wrapped methods of the state (see profiling.py)
+        self.profiler = None
+
+    @classmethod
+    def initialize(cls, model, x, y, in_floodplain, flood_depth_estimated, flood_depth_Harvey, attributes):
+        """
+        Create the state of all households, following Households.__init__.
+
+        Parameters
+        ----------
+        model: the AdaptationModel the households belong to
+        x, y: arrays of household location coordinates
+        in_floodplain: array telling whether each household is within the floodplain
+        flood_depth_estimated, flood_depth_Harvey: arrays of flood depths at the household locations
+        attributes: dictionary with the drawn household attributes, see rng.draw_household_attributes
+
+        Returns
+        -------
+        household_state: the HouseholdState of the households
+        """
+        number_of_households = len(x)
+        state = cls(number_of_households, fine=model.fine, discount_rate=model.discount_rate,
+                    elevation_costs_per_square_metre=model.elevation_costs_per_square_metre,
+                    influence_update=model.influence_update)
+        state.x[:] = x
+        state.y[:] = y
+        state.in_floodplain[:] = in_floodplain
+        state.flood_depth_Harvey[:] = flood_depth_Harvey
+        # handle negative values of flood depth, the damage is calculated before this
+        state.flood_damage_estimated[:] = calculate_flood_damage(np.asarray(flood_depth_estimated), model.depth_damage_curve)
+        state.flood_depth_estimated[:] = np.maximum(flood_depth_estimated, 0)
+
+        state.size_of_house[:] = attributes['size_of_house']
+        state.income[:] = attributes['income']
+        state.money_saved[:] = state.income * 1.8
+        state.trust_factor[:] = attributes['trust_factor']
+        state.taken_measures[:] = attributes['taken_measures']
+        state.perceived_flood_probability[:] = attributes['perceived_flood_probability']
+        state.perceived_costs_of_measures[:] = state.elevation_costs_per_square_metre * state.size_of_house
+
+        state.neighbour_indptr, state.neighbour_indices = neighbour_lists_from_network(model.G)
+        state.friends_count = np.diff(state.neighbour_indptr)
+        state.profiler = model.profiler
+        return state
+
+    @classmethod
+    def from_agents(cls, households, G, influence_update='asynchronous'):
+        """
+        Create the state from Households agents, e.g. to compare the array engine with the agent engine.
+
+        Parameters
+        ----------
+        households: list of Households agents, household i being the one on network node i
+        G: network graph of the households
+        influence_update: "asynchronous" or "synchronous" update of the perceived flood probability
+
+        Returns
+        -------
+        household_state: the HouseholdState of the households
+        """
+        first = households[0]
+        state = cls(len(households), fine=first.fine, discount_rate=first.discount_rate,
+                    elevation_costs_per_square_metre=first.elevation_costs_per_square_metre,
+                    max_damage_dol_per_sqm=first.max_damage_dol_per_sqm, influence_update=influence_update)
+        for attribute in ['in_floodplain', 'flood_depth_estimated', 'flood_damage_estimated', 'flood_depth_Harvey',
+                          'flood_depth_actual', 'flood_damage_actual', 'flood_damage_final', 'whatif_damage',
+                          'size_of_house', 'income', 'money_saved', 'trust_factor', 'taken_measures', 'is_adapted',
+                          'perceived_flood_probability', 'perceived_costs_of_measures', 'desire_to_take_measures']:
+            getattr(state, attribute)[:] = [getattr(household, attribute) for household in households]
+        for attribute in ['perceived_flood_damage', 'perceived_effectiveness_of_measures']:
+            getattr(state, attribute)[:] = [np.nan if getattr(household, attribute) is None
+                                            else getattr(household, attribute) for household in households]
+        state.x[:] = [household.location.x for household in households]
+        state.y[:] = [household.location.y for household in households]
+        state.neighbour_indptr, state.neighbour_indices = neighbour_lists_from_network(G)
+        state.friends_count = np.diff(state.neighbour_indptr)
+        return state
+
+    def replicate(self, rngs):
+        """
+        Create the state of an ensemble of replications on the same households.
+        The locations, flood depths, household attributes and social network stay the same for all replications;
+        the taken measures and perceived flood probability are drawn again for every replication, and everything
+        that changes during a run gets one row per replication.
+
+        Parameters
+        ----------
+        rngs: list with one numpy random Generator per replication, normally their attributes streams
+
+        Returns
+        -------
+        household_state: the HouseholdState with arrays of shape (number of replications, number of households)
+        """
+        number_of_replications = len(rngs)
+        state = copy.copy(self)
+        for attribute in ['flood_depth_actual', 'flood_damage_actual', 'flood_damage_final', 'whatif_damage',
+                          'money_saved', 'is_adapted', 'measures_changed', 'perceived_flood_damage',
+                          'perceived_effectiveness_of_measures', 'desire_to_take_measures']:
+            setattr(state, attribute, np.tile(getattr(self, attribute), (number_of_replications, 1)))
+        state.taken_measures = np.stack([rng.triangular(0, 0.1, 0.8, size=self.number_of_households) for rng in rngs])
+        state.perceived_flood_probability = np.stack([rng.random(size=self.number_of_households) for rng in rngs])
+        return state
+
+    def save_money(self):
+        self.money_saved += self.income * 0.05
+
+    def construct_perceived_flood_probability(self, activation_order=None):
+        """
+        Every household blends the perceived flood probability of its neighbours into its own.
+        With the asynchronous update this happens in the given activation order and households activated
+        later see the values of the households activated earlier in the same step, as with RandomActivation.
+        With the synchronous update all households are updated at once with the compiled influence matrix.
+        """
+        if self.influence_update == 'synchronous':
+            if self.influence_matrix is None:
+                self.influence_matrix, self.own_weight = compile_influence_matrix(
+                    self.neighbour_indptr, self.neighbour_indices, self.trust_factor)
+            self.perceived_flood_probability = influence_synchronous(
+                self.perceived_flood_probability, self.discount_rate, self.influence_matrix, self.own_weight)
+            return
+
+        if self.perceived_flood_probability.ndim == 2:
+            # an ensemble: every replication has its own activation order
+            for replication in range(self.perceived_flood_probability.shape[0]):
+                self.perceived_flood_probability[replication] = self._influence_asynchronous(
+                    self.perceived_flood_probability[replication], activation_order[replication])
+            return
+        self.perceived_flood_probability[:] = self._influence_asynchronous(self.perceived_flood_probability,
+                                                                           activation_order)
+
+    def _influence_asynchronous(self, perceived_flood_probability, activation_order):
+        if compiled_influence is not None:
+            probability = np.array(perceived_flood_probability, dtype=float)
+            compiled_influence(np.asarray(activation_order, dtype=np.int64), self.neighbour_indptr,
+                               self.neighbour_indices, self.trust_factor, probability, float(self.discount_rate))
+            return probability
+        discount_rate = self.discount_rate
+        probability = perceived_flood_probability.tolist()
+        # the network and the trust factors do not change during a run, so they are converted only once
+        if self._influence_lists is None:
+            self._influence_lists = (self.trust_factor.tolist(), self.neighbour_indptr.tolist(),
+                                     self.neighbour_indices.tolist())
+        trust_factor, indptr, indices = self._influence_lists
+        for household in activation_order.tolist():
+            perceived_flood_probability = discount_rate * probability[household]
+            for neighbour in indices[indptr[household]:indptr[household + 1]]:
+                perceived_flood_probability = (
+                    perceived_flood_probability * (1 - trust_factor[neighbour]) +
+                    trust_factor[neighbour] * probability[neighbour])
+            probability[household] = perceived_flood_probability
+        return probability
+
+    def construct_perceived_flood_damage(self):
+        self.perceived_flood_damage = self.size_of_house * self.max_damage_dol_per_sqm * self.flood_damage_estimated
+
+    def construct_perceived_effectiveness_of_measures(self):
+        # effectiveness ratio: damage reduction and fine divided by costs of measures
+        # fine is multiplied by 5 to show that households take into account that fines are fines multiple times
+        self.perceived_effectiveness_of_measures = ((self.perceived_flood_damage + self.fine*5) / self.perceived_costs_of_measures)
+
+    def reconsider_adaptation_measures(self):
+        effectiveness = self.perceived_effectiveness_of_measures
+        probability = self.perceived_flood_probability
+        self.desire_to_take_measures = (((effectiveness > 4) & (probability > 0.2)) |
+                                        ((effectiveness > 3) & (probability > 0.4)) |
+                                        ((effectiveness > 2) & (probability > 0.6)) |
+                                        ((effectiveness > 1.5) & (probability > 0.8)) |
+                                        ((effectiveness > 1) & (probability > 0.9)))
+
+    def take_adaptation_measures(self):
+        considering = (self.taken_measures < 1) & self.desire_to_take_measures
+        elevation_costs = self.size_of_house * self.elevation_costs_per_square_metre
+        can_pay_all = considering & (self.money_saved >= elevation_costs)
+        can_pay_part = considering & (1.000 < self.money_saved) & (self.money_saved < elevation_costs)
+
+        # adds a ratio of the complete elevation to the level of adaption, based on how much someone is able to spend
+        self.taken_measures = np.where(can_pay_part, self.taken_measures + self.money_saved / elevation_costs,
+                                       self.taken_measures)
+        self.taken_measures = np.where(can_pay_all, 1.0, self.taken_measures)
+        self.money_saved = np.where(can_pay_all, self.money_saved - elevation_costs, self.money_saved)
+        self.measures_changed |= can_pay_all | can_pay_part
+
+    def step(self, activation_order=None):
+        """
+        Step all households, in the same order of rules as Households.step.
+
+        Parameters
+        ----------
+        activation_order: array with the order in which the households update their perceived flood probability.
+                          Only used by the asynchronous update.
+        """
+        self.save_money()
+        self.construct_perceived_flood_probability(activation_order)
+        self.construct_perceived_flood_damage()
+        self.construct_perceived_effectiveness_of_measures()
+        self.reconsider_adaptation_measures()
+        self.take_adaptation_measures()
+
+        self.is_adapted |= self.taken_measures > 0.8
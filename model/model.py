@@ -4,18 +4,31 @@ from mesa import Model, Agent
 from mesa.time import RandomActivation, SimultaneousActivation
 from mesa.space import NetworkGrid
 from mesa.datacollection import DataCollector
-import geopandas as gpd
-import rasterio as rs
-import matplotlib.pyplot as plt
-import random
+import numpy as np
+from shapely import points
 
 # Import the agent class(es) from agents.py
 from agents import Households
 from agents import Government
+from household_state import HouseholdState
+from household_kernel import step_households
+from columnar_datacollector import ColumnarDataCollector
 
 # Import functions from functions.py
-from functions import get_flood_map_data, calculate_basic_flood_damage
-from functions import map_domain_gdf, floodplain_gdf
+from functions import geodata
+from functions import generate_random_locations_within_map_domain, generate_random_location_within_map_domain
+from flood_maps import flood_map_paths, get_flood_map, get_household_depths
+from flood_events import FloodEvent, FloodEventScheduler
+from rng import RandomStreams, draw_household_attributes
+from profiling import PhaseTimer
+from spatial_index import HouseholdIndex
+from rendering import plot_model_domain_with_agents
+from csr_network import CSRGraph, CSRNetworkGrid, erdos_renyi_graph, barabasi_albert_graph, watts_strogatz_graph
+
+# methods of the households that are timed when profiling, the same for the agents and the array engine
+household_step_methods = ['step', 'save_money', 'construct_perceived_flood_probability',
+                          'construct_perceived_flood_damage', 'construct_perceived_effectiveness_of_measures',
+                          'reconsider_adaptation_measures', 'take_adaptation_measures']
 
 
 # Define the AdaptationModel class
@@ -48,6 +61,51 @@ class AdaptationModel(Model):
                  discount_rate=0.99,
                  max_trust_value=0.1,
                 elevation_costs_per_square_metre=290,
+                 # whether the full flood map bands are read into memory. If False, depths are read through windows
+                 flood_maps_in_memory=True,
+                 # whether all households are placed at once with vectorized location drawing and depth sampling
+                 batch_initialization=False,
+                 # How the households are stepped. Can currently be "agents" (one Households agent per household,
+                 # the reference) or "arrays" (the state of all households in arrays, stepped with array operations)
+                 engine='agents',
+                 # How the perceived flood probability is updated by the social network in the array engine.
+                 # "asynchronous": households update one by one in random activation order and see the values of
+                 # the households updated before them in the same step (the behaviour of the agents engine).
+                 # "synchronous": all households update at once from the values at the start of the step, with
+                 # one sparse matrix product. Much faster (the asynchronous update is a loop over the households, in
+                 # Python unless Numba is installed), but the results differ from the asynchronous update.
+                 influence_update='asynchronous',
+                 # whether the array engine activates the households and the government in exactly the order of
+                 # Mesa's RandomActivation, stepping the households one by one with a compiled loop (see
+                 # household_kernel.py). The results are then the same as those of the agents engine for the same seed
+                 # (with the same batch_initialization). Only with the asynchronous update.
+                 exact_activation=False,
+                 # Which data collector is used. Can currently be "mesa" (Mesa's DataCollector, keeps all data in memory)
+                 # or "columnar" (writes typed columns to disk every flush_every steps, see columnar_datacollector.py)
+                 collector='mesa',
+                 # path and start of the file names of the columnar data collector. Every run needs its own; if None,
+                 # the data is written to a new temporary directory
+                 output_path=None,
+                 # whether the columnar data collector may replace the data of an earlier run at the same output path
+                 overwrite_output=False,
+                 # number of steps after which the columnar data collector writes its data to disk
+                 flush_every=10,
+                 # file format of the columnar data collector, "parquet" or "npz"
+                 output_format='parquet',
+                 # depth-damage curve (a DepthDamageCurve from functions.py) used instead of the basic
+                 # depth-damage function, e.g. DepthDamageCurve.from_excel()
+                 depth_damage_curve=None,
+                 # timeline of flood events, a FloodEventScheduler or a list of FloodEvents (see flood_events.py).
+                 # The model applies them with its own copy of the scheduler, whose history is model.flood_events.history.
+                 # By default there is one flood at step 5, with a random factor of 0.5 to 1.2 on the estimated flood depth
+                 flood_events=None,
+                 # whether the time spent in the phases of a step and in the agent methods is recorded (see profiling.py).
+                 # The agent methods stay wrapped for the whole process until PhaseTimer.restore() is called, but are
+                 # only timed for the models with profiling on
+                 profile=False,
+                 # How the social network is stored. Can currently be "networkx" (a NetworkX graph in Mesa's NetworkGrid)
+                 # or "csr" (compact arrays with fast generators for very large numbers of households, see csr_network.py)
+                 network_backend='networkx',
                  ):
 
         super().__init__(seed = seed)
@@ -62,6 +120,39 @@ class AdaptationModel(Model):
         self.max_trust_value = max_trust_value
         self.flood_warning = flood_warning
         self.elevation_costs_per_square_metre= elevation_costs_per_square_metre
+        self.flood_maps_in_memory = flood_maps_in_memory
+        self.depth_damage_curve = depth_damage_curve
+        self.flood_map_choice = flood_map_choice
+        self.batch_initialization = batch_initialization
+        self.engine = engine
+        self.influence_update = influence_update
+        if flood_events is None:
+            flood_events = [FloodEvent(step=5)]
+        if not isinstance(flood_events, FloodEventScheduler):
+            flood_events = FloodEventScheduler(flood_events)
+        # the model has its own copy of the scheduler, with its own history and flood depths of the households
+        self.flood_events = flood_events.for_model()
+        # timing of the phases of a step, an empty context manager per phase when profiling is off
+        self.profiler = PhaseTimer(enabled=profile)
+        self.instrument_methods()
+        # independent random streams for the placement, attributes, behaviour and flood events (see rng.py)
+        self.streams = RandomStreams(seed)
+        if self.engine not in ['agents', 'arrays']:
+            raise ValueError(f"Unknown engine: '{self.engine}'. "
+                             f"Currently implemented engines are: 'agents' and 'arrays'")
+        if self.influence_update not in ['asynchronous', 'synchronous']:
+            raise ValueError(f"Unknown influence update: '{self.influence_update}'. "
+                             f"Currently implemented influence updates are: 'asynchronous' and 'synchronous'")
+        if self.engine == 'agents' and self.influence_update == 'synchronous':
+            raise ValueError("The synchronous influence update is only available with the 'arrays' engine")
+        self.exact_activation = exact_activation
+        if self.exact_activation and (self.engine != 'arrays' or self.influence_update != 'asynchronous'):
+            raise ValueError("The exact activation is only available with the 'arrays' engine and the "
+                             "asynchronous influence update")
+        self.network_backend = network_backend
+        if self.network_backend not in ['networkx', 'csr']:
+            raise ValueError(f"Unknown network backend: '{self.network_backend}'. "
+                             f"Currently implemented network backends are: 'networkx' and 'csr'")
 
         # network
         self.network = network # Type of network to be created
@@ -70,11 +161,25 @@ class AdaptationModel(Model):
         self.number_of_nearest_neighbours = number_of_nearest_neighbours
 
         self.average_perceived_flood_probability_over_time = []
+        # spatial index of the household locations, built on first use (see spatial_index.py)
+        self._spatial_index = None
+
+        # aggregates of the household agents. The agents keep these up to date when their state changes,
+        # so the model reporters do not have to go through all agents every step. The float totals are summed
+        # again at the start of every step (resync_aggregates), so the rounding errors of the updates do not add up.
+        self.adapted_households_count = 0
+        self.flood_damage_total = 0.0
+        self.whatif_damage_total = 0.0
+        self.money_saved_total = 0.0
+        self.perceived_flood_probability_total = 0.0
 
         # generating the graph according to the network used and the network parameters specified
         self.G = self.initialize_network()
         # create grid out of network graph
-        self.grid = NetworkGrid(self.G)
+        if self.network_backend == 'csr':
+            self.grid = CSRNetworkGrid(self.G)
+        else:
+            self.grid = NetworkGrid(self.G)
 
         # Initialize maps
         self.initialize_maps(flood_map_choice)
@@ -82,15 +187,57 @@ class AdaptationModel(Model):
         # set schedule for agents
         self.schedule = RandomActivation(self)  # Schedule for activating agents
 
-        # create households through initiating a household on each node of the network graph
-        for i, node in enumerate(self.G.nodes()):
-            household = Households(unique_id=i, model=self, fine= self.fine, discount_rate=self.discount_rate,
-                                   max_trust_value=self.max_trust_value, elevation_costs_per_square_metre=self.elevation_costs_per_square_metre)
-            self.schedule.add(household)
-            self.grid.place_agent(agent=household, node_id=node)
+        # place all households at once if batch initialization is used
+        if self.batch_initialization or (self.engine == 'arrays' and not self.exact_activation):
+            self.initialize_household_placements()
+        elif self.exact_activation:
+            # one location after another, as the households of the agents engine are placed
+            self.initialize_household_placements(sequential=True)
+
+        # the attributes of all households are drawn at once, the same way for both engines
+        household_attributes = draw_household_attributes(self.number_of_households, self.max_trust_value,
+                                                         self.streams.attributes)
+
+        self.household_state = None
+        self.household_agents = []
+        if self.engine == 'arrays':
+            # the households only exist as arrays, the schedule only holds the government
+            self.household_state = HouseholdState.initialize(
+                self, self.household_x, self.household_y, self.household_in_floodplain,
+                self.household_flood_depths[self.flood_map_choice], self.household_flood_depths['harvey'],
+                household_attributes)
+        else:
+            # create households through initiating a household on each node of the network graph
+            for i, node in enumerate(self.G.nodes()):
+                placement = {}
+                if self.batch_initialization:
+                    placement = dict(location=self.household_locations[i],
+                                     in_floodplain=bool(self.household_in_floodplain[i]),
+                                     flood_depth_estimated=self.household_flood_depths[self.flood_map_choice][i],
+                                     flood_depth_Harvey=self.household_flood_depths['harvey'][i])
+                attributes = {name: values[i] for name, values in household_attributes.items()}
+                household = Households(unique_id=i, model=self, fine= self.fine, discount_rate=self.discount_rate,
+                                       max_trust_value=self.max_trust_value, elevation_costs_per_square_metre=self.elevation_costs_per_square_metre,
+                                       attributes=attributes, **placement)
+                self.schedule.add(household)
+                self.grid.place_agent(agent=household, node_id=node)
+                # the network is static, so the number of friends is counted once
+                household.friends_count = self.G.degree(node)
+                self.household_agents.append(household)
+            if not self.batch_initialization:
+                # household coordinates as arrays, for the flood events
+                self.household_x = np.array([household.location.x for household in self.household_agents])
+                self.household_y = np.array([household.location.y for household in self.household_agents])
+
+        # positions of the households (0 to number_of_households - 1) and the government (number_of_households) in
+        # the activation order of the exact activation, which is shuffled in place every step like the agents in
+        # RandomActivation
+        self.activation_order = list(range(self.number_of_households + 1)) if self.exact_activation else None
 
         government_agent = Government(unique_id=100, model=self,fine= self.fine, flood_warning=self.flood_warning)
         government_agent.household_list = self.schedule.agents
+        government_agent.household_state = self.household_state
+        self.government = government_agent
         self.schedule.add(government_agent)
         self.grid.place_agent(agent=government_agent, node_id=2)
 
@@ -112,20 +259,97 @@ class AdaptationModel(Model):
                         "FloodDamageActual" : "flood_damage_actual",
                         "DesireToTakeMeasures" : "desire_to_take_measures",
                         "IsAdapted": "is_adapted",
-                        "FriendsCount": lambda a: a.count_friends(radius=1),
+                        "FriendsCount": "friends_count",
                         "location":"location",
                         "MoneySaved": "money_saved",
                         "FinedTotal": "fined_total"
                         # ... other reporters ...
                         }
         #set up the data collector
-        self.datacollector = DataCollector(model_reporters=model_metrics,agent_reporters=agent_metrics)
+        if collector == 'columnar':
+            # the columnar data collector reads the agent reporters of the array engine from self.household_state
+            self.datacollector = ColumnarDataCollector(model_reporters=model_metrics, agent_reporters=agent_metrics,
+                                                       output_path=output_path, flush_every=flush_every,
+                                                       file_format=output_format, overwrite=overwrite_output)
+        elif collector == 'mesa':
+            # The array engine has no household agents, its agent level data is in self.household_state
+            if self.engine == 'arrays':
+                agent_metrics = {}
+            self.datacollector = DataCollector(model_reporters=model_metrics,agent_reporters=agent_metrics)
+        else:
+            raise ValueError(f"Unknown collector: '{collector}'. "
+                             f"Currently implemented collectors are: 'mesa' and 'columnar'")
+        # kept to set up the data collector again when the model is restored from a checkpoint
+        self.model_metrics = model_metrics
+        self.agent_metrics = agent_metrics
+
+    def __getstate__(self):
+        """
+        The state of the model for pickling, e.g. for a checkpoint (see checkpoint.py).
+        The flood maps are left out, they are opened again from the flood map registry when the model is restored.
+        Mesa's DataCollector cannot be pickled, so only its collected data is kept.
+        """
+        state = self.__dict__.copy()
+        state.pop('shared_flood_map', None)
+        # the spatial index is built again when it is needed
+        state['_spatial_index'] = None
+        if isinstance(self.datacollector, DataCollector):
+            state['datacollector'] = {'model_vars': self.datacollector.model_vars,
+                                      '_agent_records': self.datacollector._agent_records,
+                                      'tables': self.datacollector.tables}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.initialize_maps(self.flood_map_choice)
+        if isinstance(self.datacollector, dict):
+            collected_data = self.datacollector
+            self.datacollector = DataCollector(model_reporters=self.model_metrics, agent_reporters=self.agent_metrics)
+            self.datacollector.model_vars = collected_data['model_vars']
+            self.datacollector._agent_records = collected_data['_agent_records']
+            self.datacollector.tables = collected_data['tables']
+        # the timed methods are wrapped per process
+        self.instrument_methods()
+
+    def set_policy(self, fine=None, flood_warning=None, regulations=None):
+        """
+        Change the policy of the government during a run, e.g. for the branches of a forked run (see branching.py).
+        Parameters that are None are not changed.
+
+        Parameters
+        ----------
+        fine: fine for households that do not comply with the regulations, also known by the households
+        flood_warning: strength of the flood warnings of the government
+        regulations: maximum flood damage factor (after taken measures) that complies with the regulations
+        """
+        if fine is not None:
+            self.fine = fine
+            self.government.fine = fine
+            for household in self.household_agents:
+                household.fine = fine
+            if self.household_state is not None:
+                self.household_state.fine = fine
+        if flood_warning is not None:
+            self.flood_warning = flood_warning
+            self.government.flood_warning = flood_warning
+        if regulations is not None:
+            # the government checks all households again at its next inspection
+            self.government.regulations = regulations
+
+    def instrument_methods(self):
+        """Let the profiler time the methods of the agents, if profiling is on."""
+        self.profiler.instrument(Households, household_step_methods)
+        self.profiler.instrument(HouseholdState, household_step_methods)
+        self.profiler.instrument(Government, ['step', 'check_all_households', 'warn_households'])
+        self.profiler.instrument(FloodEventScheduler, ['apply_event'])
 
 
     def initialize_network(self):
         """
         Initialize and return the social network graph based on the provided network type using pattern matching.
         """
+        if self.network_backend == 'csr':
+            return self.initialize_csr_network()
         if self.network == 'erdos_renyi':
             return nx.erdos_renyi_graph(n=self.number_of_households,
                                         p=self.number_of_nearest_neighbours / self.number_of_households,
@@ -148,110 +372,189 @@ class AdaptationModel(Model):
                             f"Currently implemented network types are: "
                             f"'erdos_renyi', 'barabasi_albert', 'watts_strogatz', and 'no_network'")
 
+    def initialize_csr_network(self):
+        """
+        Initialize and return the social network as a compact CSRGraph, with the same network types and parameters.
+        """
+        rng = self.streams.network
+        if self.network == 'erdos_renyi':
+            return erdos_renyi_graph(self.number_of_households,
+                                     self.number_of_nearest_neighbours / self.number_of_households, rng)
+        elif self.network == 'barabasi_albert':
+            return barabasi_albert_graph(self.number_of_households, self.number_of_edges, rng)
+        elif self.network == 'watts_strogatz':
+            return watts_strogatz_graph(self.number_of_households, self.number_of_nearest_neighbours,
+                                        self.probability_of_network_connection, rng)
+        elif self.network == 'no_network':
+            return CSRGraph(self.number_of_households, np.zeros(self.number_of_households + 1, dtype=np.int64),
+                            np.zeros(0, dtype=np.int32))
+        else:
+            raise ValueError(f"Unknown network type: '{self.network}'. "
+                            f"Currently implemented network types are: "
+                            f"'erdos_renyi', 'barabasi_albert', 'watts_strogatz', and 'no_network'")
+
 
     def initialize_maps(self, flood_map_choice):
         """
         Initialize and set up the flood map related data based on the provided flood map choice.
         """
-        # Define paths to flood maps
-        flood_map_paths = {
-            'harvey': r'../input_data/floodmaps/Harvey_depth_meters.tif',
-            '100yr': r'../input_data/floodmaps/100yr_storm_depth_meters.tif',
-            '500yr': r'../input_data/floodmaps/500yr_storm_depth_meters.tif'  # Example path for 500yr flood map
-        }
-
         # Throw a ValueError if the flood map choice is not in the dictionary
         if flood_map_choice not in flood_map_paths.keys():
             raise ValueError(f"Unknown flood map choice: '{flood_map_choice}'. "
                              f"Currently implemented choices are: {list(flood_map_paths.keys())}")
 
-        # Choose the appropriate flood map based on the input choice
-        flood_map_path = flood_map_paths[flood_map_choice]
+        # Getting the shared flood map. It is opened once per process and its band is shared with the agents
+        self.shared_flood_map = get_flood_map(flood_map_choice, in_memory=self.flood_maps_in_memory)
+        self.bound_left = self.shared_flood_map.bound_left
+        self.bound_right = self.shared_flood_map.bound_right
+        self.bound_top = self.shared_flood_map.bound_top
+        self.bound_bottom = self.shared_flood_map.bound_bottom
 
-        # Loading and setting up the flood map
-        self.flood_map = rs.open(flood_map_path)
-        self.band_flood_img, self.bound_left, self.bound_right, self.bound_top, self.bound_bottom = get_flood_map_data(
-            self.flood_map)
+    def initialize_household_placements(self, sequential=False):
+        """
+        Place all households at once. All locations are drawn with NumPy and checked against the model domain
+        with vectorized contains_xy calls; the households in the floodplain are found with one query on the
+        spatial index. The flood depths of every flood map that is used
+        are gathered in one go, so the households do not have to sample the maps one by one.
+        With sequential, the locations are drawn one after another, giving the same locations as the households
+        of the agents engine without batch initialization.
+        """
+        if sequential:
+            locations = [generate_random_location_within_map_domain(self.streams.placement)
+                         for _ in range(self.number_of_households)]
+            x = np.array([location[0] for location in locations])
+            y = np.array([location[1] for location in locations])
+        else:
+            x, y = generate_random_locations_within_map_domain(self.number_of_households, self.streams.placement)
+        self.household_x = x
+        self.household_y = y
+        self.household_locations = points(x, y)
+        self.household_in_floodplain = self.spatial_index.mask(
+            self.spatial_index.within_polygon(geodata.floodplain_multipolygon))
+
+        self.household_flood_depths = get_household_depths(sorted({self.flood_map_choice, 'harvey'}), x, y,
+                                                           in_memory=self.flood_maps_in_memory)
+
+    @property
+    def flood_map(self):
+        """The rasterio dataset of the flood map."""
+        return self.shared_flood_map.dataset
+
+    @property
+    def band_flood_img(self):
+        """Band 1 of the flood map, indexed by the rows and columns of the raster (None without flood_maps_in_memory)."""
+        return self.shared_flood_map.band if self.flood_maps_in_memory else None
+
+    @property
+    def spatial_index(self):
+        """STRtree index of the household locations, for queries by zone, distance or raster window."""
+        if self._spatial_index is None:
+            self._spatial_index = HouseholdIndex(self.household_x, self.household_y)
+        return self._spatial_index
 
     def total_adapted_households(self):
         """Return the total number of households that have adapted."""
-        #BE CAREFUL THAT YOU MAY HAVE DIFFERENT AGENT TYPES SO YOU NEED TO FIRST CHECK IF THE AGENT IS ACTUALLY A HOUSEHOLD AGENT USING "ISINSTANCE"
-        adapted_count = sum([1 for agent in self.schedule.agents if isinstance(agent, Households) and agent.is_adapted])
-        return adapted_count
+        if self.household_state is not None:
+            return int(self.household_state.is_adapted.sum())
+        # kept up to date by the Households agents
+        return self.adapted_households_count
 
     def total_flood_damage(self):
-        """Return the total number of households that have adapted."""
-        #BE CAREFUL THAT YOU MAY HAVE DIFFERENT AGENT TYPES SO YOU NEED TO FIRST CHECK IF THE AGENT IS ACTUALLY A HOUSEHOLD AGENT USING "ISINSTANCE"
-        total_damage = sum([agent.flood_damage_final for agent in self.schedule.agents if isinstance(agent, Households)])
-        return total_damage
+        """Return the total flood damage of the households."""
+        if self.household_state is not None:
+            return float(self.household_state.flood_damage_final.sum())
+        # kept up to date by the flood shock
+        return self.flood_damage_total
 
     def whatif_damage(self):
-        whatif_damage = sum([agent.whatif_damage for agent in self.schedule.agents if isinstance(agent, Households)])
-        return whatif_damage
-    def plot_model_domain_with_agents(self):
-        fig, ax = plt.subplots()
-        # Plot the model domain
-        map_domain_gdf.plot(ax=ax, color='lightgrey')
-        # Plot the floodplain
-        floodplain_gdf.plot(ax=ax, color='lightblue', edgecolor='k', alpha=0.5)
-
-        # Collect agent locations and statuses
-        for agent in self.schedule.agents:
-            if isinstance(agent, Households):
-                color = 'blue' if agent.is_adapted else 'red'
-            else:
-                color = 'green'
-            ax.scatter(agent.location.x, agent.location.y, color=color, s=10, label=color.capitalize() if not ax.collections else "")
-            ax.annotate(str(agent.unique_id), (agent.location.x, agent.location.y), textcoords="offset points", xytext=(0,1), ha='center', fontsize=9)
-        # Create legend with unique entries
-        handles, labels = ax.get_legend_handles_labels()
-        by_label = dict(zip(labels, handles))
-        ax.legend(by_label.values(), by_label.keys(), title="Red: not adapted, Blue: adapted")
-
-        # Customize plot with titles and labels
-        plt.title(f'Model Domain with Agents at Step {self.schedule.steps}')
-        plt.xlabel('Longitude')
-        plt.ylabel('Latitude')
-        plt.show()
+        if self.household_state is not None:
+            return float(self.household_state.whatif_damage.sum())
+        # kept up to date by the flood shock
+        return self.whatif_damage_total
+
+    def total_money_saved(self):
+        """
+        Return the total money saved by the households. Not one of the model reporters, so the output has the same
+        columns as before; add it to the model reporters to collect it.
+        """
+        if self.household_state is not None:
+            return float(self.household_state.money_saved.sum())
+        # kept up to date by the Households and Government agents
+        return self.money_saved_total
+
+    def resync_aggregates(self):
+        """
+        Sum the float aggregates of the household agents again from the agents themselves, since the updates with
+        += and -= add up rounding errors over a long run. Only the counter of adapted households is exact.
+        """
+        if self.household_state is not None:
+            return
+        self.flood_damage_total = sum((household.flood_damage_final for household in self.household_agents), 0.0)
+        self.whatif_damage_total = sum((household.whatif_damage for household in self.household_agents), 0.0)
+        self.money_saved_total = sum((household.money_saved for household in self.household_agents), 0.0)
+        self.perceived_flood_probability_total = sum((household.perceived_flood_probability
+                                                      for household in self.household_agents), 0.0)
+
+    def plot_model_domain_with_agents(self, label_threshold=100):
+        """
+        Plot the model domain with all agents, coloured by adaptation state (see rendering.py).
+        The agents get a label with their id only if there are at most label_threshold households.
+        """
+        return plot_model_domain_with_agents(self, label_threshold=label_threshold)
 
     def step(self):
         """
         introducing a shock:
-        at time step 5, there will be a global flooding.
-        This will result in actual flood depth. Here, we assume it is a random number
-        between 0.5 and 1.2 of the estimated flood depth. In your model, you can replace this
-        with a more sound procedure (e.g., you can divide the flood map into zones and
-        assume local flooding instead of global flooding). The actual flood depth can be
-        estimated differently
+        the flood events of this step are applied to the households (see flood_events.py).
+        By default, at time step 5 there will be a global flooding, where the actual flood depth
+        is a random number between 0.5 and 1.2 of the estimated flood depth. Other timelines, with
+        flooded zones, other flood maps or a spatially correlated noise field, can be given with flood_events.
         """
-        average_perceived_flood_probability = sum(agent.perceived_flood_probability for agent in self.schedule.agents if isinstance(agent, Households)) / self.number_of_households
+        if self.household_state is not None:
+            average_perceived_flood_probability = float(self.household_state.perceived_flood_probability.mean())
+        else:
+            self.resync_aggregates()
+            average_perceived_flood_probability = self.perceived_flood_probability_total / self.number_of_households
 
         # Append the current average to the list
         self.average_perceived_flood_probability_over_time.append(average_perceived_flood_probability)
 
-        #opzet voor functie om totale schade bij een flooding te berekenen, kan uiteindelijk geintegreeerd worden in de if functie hieronder
-        # for agent in self.schedule.agents:
-        #     if isinstance(agent, Households):
-        #     # Calculate the actual flood depth as a random number between 0.5 and 1.2 times the estimated flood depth
-        #         agent.flood_depth_actual = random.uniform(0.5, 1.2) * agent.flood_depth_estimated
-        #     # calculate the actual flood damage given the actual flood depth
-        #         agent.flood_damage_actual = calculate_basic_flood_damage(agent.flood_depth_actual)
-        #         agent.flood_damage_monetary_value = agent.flood_damage_actual*self.max_damage_dol_per_sqm
-        #         self.total_damage += agent.flood_damage_monetary_value
-        # print(self.total_damage)
-
-
-        if self.schedule.steps == 5:
-            for agent in self.schedule.agents:
-                if isinstance(agent, Households):
-                    # Calculate the actual flood depth as a random number between 0.5 and 1.2 times the estimated flood depth
-                    agent.flood_depth_actual = random.uniform(0.5, 1.2) * agent.flood_depth_estimated
-                    # calculate the actual flood damage given the actual flood depth
-                    agent.flood_damage_actual = calculate_basic_flood_damage(agent.flood_depth_actual)
-                    agent.flood_damage_final += max(agent.flood_damage_actual-agent.taken_measures,0) * agent.size_of_house * agent.max_damage_dol_per_sqm
-                    agent.whatif_damage += agent.flood_damage_actual * agent.size_of_house * agent.max_damage_dol_per_sqm
-        # Collect data and advance the model by one step
-        self.datacollector.collect(self)
-        # for agent in self.schedule:
-        #     agent.step()
-        self.schedule.step()
+        with self.profiler.step(self.schedule.steps):
+            with self.profiler.phase('flood_events'):
+                self.flood_events.apply(self, self.schedule.steps)
+            # Collect data and advance the model by one step
+            with self.profiler.phase('collect'):
+                self.datacollector.collect(self)
+            # for agent in self.schedule:
+            #     agent.step()
+            if self.exact_activation:
+                self.step_exact_activation()
+                return
+            if self.household_state is not None:
+                # the households are stepped with array operations, before the government is stepped by the schedule
+                with self.profiler.phase('households'):
+                    activation_order = None
+                    if self.influence_update == 'asynchronous':
+                        activation_order = self.streams.behaviour.permutation(self.number_of_households)
+                    self.household_state.step(activation_order=activation_order)
+            with self.profiler.phase('schedule'):
+                self.schedule.step()
+
+    def step_exact_activation(self):
+        """
+        Activate the households and the government as RandomActivation does in the agents engine: the activation
+        order is shuffled in place with Mesa's random generator, the households before the government are stepped,
+        then the government, then the households after it.
+        """
+        with self.profiler.phase('households'):
+            self.random.shuffle(self.activation_order)
+            activation_order = np.array(self.activation_order)
+            government_position = self.activation_order.index(self.number_of_households)
+            step_households(self.household_state, activation_order[:government_position])
+        with self.profiler.phase('schedule'):
+            self.government.step()
+            # the schedule only holds the government, which was stepped above
+            self.schedule.steps += 1
+            self.schedule.time += 1
+        with self.profiler.phase('households'):
+            step_households(self.household_state, activation_order[government_position + 1:])
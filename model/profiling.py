@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the Flood Adaptation Model.
+
+The PhaseTimer records the wall time and number of calls of the phases of AdaptationModel.step (flood events,
+data collection, households, schedule) and, when enabled, of the methods of the agent classes. When it is
+disabled a phase is an empty context manager. The methods are only wrapped once a model with an enabled timer is
+made; every call of a wrapped method is then timed by the timer of the model of the instance, and only if that timer
+is enabled, so models without profiling are never timed (they only pay for looking up their timer).
+PhaseTimer.restore() puts the original methods back.
+
+The timings can be exported as a table with one row per step, or as folded stacks
+("step;schedule;Households.step;Households.save_money 1234") that flame graph tools such as
+flamegraph.pl or speedscope can read.
+"""
+from collections import defaultdict
+from contextlib import nullcontext
+from functools import wraps
+import time
+
+import pandas as pd
+
+# the original methods of the classes that are wrapped by a PhaseTimer, keyed by class and method name
+_original_methods = {}
+
+_disabled_phase = nullcontext()
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer._stack.append([self.name, time.perf_counter(), 0.0])
+
+    def __exit__(self, *exc_info):
+        timer = self.timer
+        name, start, children_time = timer._stack.pop()
+        elapsed = time.perf_counter() - start
+        timer.total_time[name] += elapsed
+        timer.call_counts[name] += 1
+        timer._step_times[name] += elapsed
+        # the time of the phase itself, without the phases within it, as flame graphs add those up
+        path = ';'.join([frame[0] for frame in timer._stack] + [name])
+        timer.folded_stacks[path] += elapsed - children_time
+        if timer._stack:
+            timer._stack[-1][2] += elapsed
+
+
+class PhaseTimer:
+    """
+    Records the wall time and number of calls per phase of the model loop and per agent method.
+    """
+
+    def __init__(self, enabled=False):
+        """
+        Parameters
+        ----------
+        enabled: whether anything is recorded
+        """
+        self.enabled = enabled
+        self.total_time = defaultdict(float)
+        self.call_counts = defaultdict(int)
+        self.folded_stacks = defaultdict(float)
+        self.step_records = []
+        self._step_times = defaultdict(float)
+        self._stack = []
+
+    def phase(self, name):
+        """Context manager that times the code within it as the phase with the given name."""
+        if not self.enabled:
+            return _disabled_phase
+        return _Phase(self, name)
+
+    def step(self, step):
+        """Context manager around a whole model step, which adds a row to the per-step table."""
+        if not self.enabled:
+            return _disabled_phase
+        return _StepPhase(self, step)
+
+    def instrument(self, cls, method_names):
+        """
+        Wrap methods of a class, so every call is timed as a phase named "Class.method" by the timer of the model of
+        the instance (see _timer_of), if that timer is enabled. The methods are wrapped for all instances of the class
+        in this process, until restore is called; a disabled timer does not wrap them.
+
+        Parameters
+        ----------
+        cls: the class, e.g. Households
+        method_names: names of the methods to time
+        """
+        if not self.enabled:
+            return
+        for method_name in method_names:
+            key = (cls, method_name)
+            if key not in _original_methods:
+                _original_methods[key] = getattr(cls, method_name)
+                setattr(cls, method_name, _wrap(_original_methods[key], f'{cls.__name__}.{method_name}'))
+
+    @staticmethod
+    def restore():
+        """Put back the original methods of all classes wrapped by instrument."""
+        for (cls, method_name), method in _original_methods.items():
+            setattr(cls, method_name, method)
+        _original_methods.clear()
+
+    def summary(self):
+        """
+        Returns
+        -------
+        summary: DataFrame with the total time, number of calls and mean time per call of every phase
+        """
+        summary = pd.DataFrame({'total_time': pd.Series(self.total_time, dtype=float),
+                                'calls': pd.Series(self.call_counts, dtype='int64')})
+        summary['time_per_call'] = summary['total_time'] / summary['calls']
+        return summary.sort_values('total_time', ascending=False)
+
+    def table(self):
+        """
+        Returns
+        -------
+        table: DataFrame with one row per step and the time spent in every phase during that step
+        """
+        return pd.DataFrame(self.step_records).set_index('Step').fillna(0.0) if self.step_records else pd.DataFrame()
+
+    def export_table(self, path):
+        """Write the per-step timing table to a CSV file."""
+        self.table().to_csv(path)
+
+    def export_folded(self, path):
+        """Write the timings as folded stacks in microseconds, the input format of flame graph tools."""
+        with open(path, 'w') as output_file:
+            for stack, seconds in self.folded_stacks.items():
+                output_file.write(f'{stack} {int(round(seconds * 1e6))}\n')
+
+
+def _timer_of(instance, args):
+    # the agents have their model, the HouseholdState has the timer of its model and the FloodEventScheduler gets
+    # the model as first argument
+    timer = getattr(instance, 'profiler', None)
+    if timer is None:
+        model = getattr(instance, 'model', None)
+        if model is None and args:
+            model = args[0]
+        timer = getattr(model, 'profiler', None)
+    return timer if isinstance(timer, PhaseTimer) else None
+
+
+def _wrap(method, name):
+    @wraps(method)
+    def timed_method(instance, *args, **kwargs):
+        timer = _timer_of(instance, args)
+        if timer is None or not timer.enabled:
+            return method(instance, *args, **kwargs)
+        with _Phase(timer, name):
+            return method(instance, *args, **kwargs)
+    return timed_method
+
+
+class _StepPhase(_Phase):
+    def __init__(self, timer, step):
+        super().__init__(timer, 'step')
+        self.step = step
+
+    def __enter__(self):
+        self.timer._step_times = defaultdict(float)
+        super().__enter__()
+
+    def __exit__(self, *exc_info):
+        super().__exit__(*exc_info)
+        self.timer.step_records.append({'Step': self.step, **self.timer._step_times})
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Fast map rendering of the Flood Adaptation Model, for large numbers of households and for animations.
+
+The model domain and the floodplain do not change during a run, so they are drawn only once, into an image that is
+kept for the process (the basemap) and shown behind the households. All households are drawn as one scatter
+collection whose colours follow their adaptation state; for a new step only these colours are changed. Labels with
+the agent ids are only drawn for small models.
+
+write_frames steps a model and writes every step to an image sequence (like Analysis/Model domain step N.png) or,
+with a .gif or .mp4 path, to an animation, reusing the same figure for every frame.
+"""
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib import animation
+from matplotlib.lines import Line2D
+
+from functions import geodata
+
+# colours of the adaptation states, as in the original plot
+adapted_color = 'blue'
+not_adapted_color = 'red'
+government_color = 'green'
+
+# basemap images by (extent, pixel size), drawn once per process
+_basemaps = {}
+
+
+def get_basemap(width_pixels=1200):
+    """
+    Image of the model domain and the floodplain, drawn once and reused.
+
+    Parameters
+    ----------
+    width_pixels: width of the image in pixels
+
+    Returns
+    -------
+    image: RGBA array of the basemap
+    extent: (left, right, bottom, top) of the image in map coordinates
+    """
+    left, bottom, right, top = geodata.map_domain_gdf.total_bounds
+    extent = (left, right, bottom, top)
+    height_pixels = max(1, int(round(width_pixels * (top - bottom) / (right - left))))
+    key = (extent, width_pixels)
+    if key not in _basemaps:
+        dpi = 100
+        fig = plt.figure(figsize=(width_pixels / dpi, height_pixels / dpi), dpi=dpi)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        geodata.map_domain_gdf.plot(ax=ax, color='lightgrey')
+        geodata.floodplain_gdf.plot(ax=ax, color='lightblue', edgecolor='k', alpha=0.5)
+        ax.set_xlim(left, right)
+        ax.set_ylim(bottom, top)
+        fig.canvas.draw()
+        _basemaps[key] = np.asarray(fig.canvas.buffer_rgba()).copy()
+        plt.close(fig)
+    return _basemaps[key], extent
+
+
+class MapRenderer:
+    """
+    Figure of the model domain with all households of a model, updated in place for every step.
+    """
+
+    def __init__(self, model, ax=None, label_threshold=100, marker_size=None, basemap_width=1200):
+        """
+        Parameters
+        ----------
+        model: the AdaptationModel
+        ax: matplotlib axes to draw in. A new figure is made if None.
+        label_threshold: the agents get a label with their id only if there are at most this many households
+        marker_size: size of the household markers, by default smaller for larger models
+        basemap_width: width of the basemap image in pixels
+        """
+        self.model = model
+        if ax is None:
+            self.fig, self.ax = plt.subplots()
+        else:
+            self.fig, self.ax = ax.figure, ax
+
+        image, extent = get_basemap(basemap_width)
+        self.ax.imshow(image, extent=extent, origin='upper', zorder=0)
+        self.ax.set_xlim(extent[0], extent[1])
+        self.ax.set_ylim(extent[2], extent[3])
+
+        number_of_households = len(model.household_x)
+        if marker_size is None:
+            marker_size = 10 if number_of_households <= 1000 else max(0.5, 10 * np.sqrt(1000 / number_of_households))
+        self.households = self.ax.scatter(model.household_x, model.household_y, s=marker_size, linewidths=0,
+                                          zorder=2)
+        government_location = model.government.location
+        self.ax.scatter([government_location.x], [government_location.y], color=government_color, s=10, zorder=3)
+
+        if number_of_households <= label_threshold:
+            household_ids = [household.unique_id for household in model.household_agents] \
+                if model.household_state is None else range(number_of_households)
+            for household_id, x, y in zip(household_ids, model.household_x, model.household_y):
+                self.ax.annotate(str(household_id), (x, y), textcoords="offset points", xytext=(0, 1), ha='center',
+                                 fontsize=9)
+            self.ax.annotate(str(model.government.unique_id), (government_location.x, government_location.y),
+                             textcoords="offset points", xytext=(0, 1), ha='center', fontsize=9)
+
+        legend_handles = [Line2D([], [], marker='o', linestyle='', color=color, label=color.capitalize())
+                          for color in [not_adapted_color, adapted_color, government_color]]
+        self.ax.legend(handles=legend_handles, title="Red: not adapted, Blue: adapted")
+        self.ax.set_xlabel('Longitude')
+        self.ax.set_ylabel('Latitude')
+        self.update()
+
+    def adaptation_states(self):
+        """Boolean array, True for the households that are adapted."""
+        if self.model.household_state is not None:
+            return self.model.household_state.is_adapted
+        return np.fromiter((household.is_adapted for household in self.model.household_agents), dtype=bool,
+                           count=len(self.model.household_agents))
+
+    def update(self):
+        """Colour the households by their current adaptation state and set the title to the current step."""
+        colors = np.where(self.adaptation_states(), adapted_color, not_adapted_color)
+        self.households.set_color(colors)
+        self.ax.set_title(f'Model Domain with Agents at Step {self.model.schedule.steps}')
+
+
+def plot_model_domain_with_agents(model, ax=None, label_threshold=100, show=True):
+    """
+    Plot the model domain with all agents, coloured by adaptation state.
+
+    Parameters
+    ----------
+    model: the AdaptationModel
+    ax: matplotlib axes to draw in. A new figure is made if None.
+    label_threshold: the agents get a label with their id only if there are at most this many households
+    show: whether plt.show() is called
+
+    Returns
+    -------
+    renderer: the MapRenderer, which can be updated after further steps
+    """
+    renderer = MapRenderer(model, ax=ax, label_threshold=label_threshold)
+    if show:
+        plt.show()
+    return renderer
+
+
+def write_frames(model, path, steps, dpi=100, fps=4, label_threshold=100):
+    """
+    Run a model for a number of steps and write the map of every step (including the current one) to disk.
+
+    Parameters
+    ----------
+    model: the AdaptationModel
+    path: a directory, to write an image sequence "Model domain step N.png", or the path of an animation file.
+          GIF animations are written with Pillow, other formats (e.g. .mp4) with ffmpeg.
+    steps: number of model steps
+    dpi: resolution of the frames
+    fps: frames per second of an animation
+    label_threshold: the agents get a label with their id only if there are at most this many households
+
+    Returns
+    -------
+    paths: list with the paths of the written images, or a list with the path of the animation
+    """
+    renderer = MapRenderer(model, label_threshold=label_threshold)
+    try:
+        if os.path.splitext(path)[1] == '':
+            os.makedirs(path, exist_ok=True)
+            paths = []
+            for frame in range(steps + 1):
+                if frame > 0:
+                    model.step()
+                    renderer.update()
+                frame_path = os.path.join(path, f'Model domain step {model.schedule.steps}.png')
+                renderer.fig.savefig(frame_path, dpi=dpi)
+                paths.append(frame_path)
+            return paths
+
+        if path.endswith('.gif'):
+            writer = animation.PillowWriter(fps=fps)
+        elif animation.writers.is_available('ffmpeg'):
+            writer = animation.FFMpegWriter(fps=fps)
+        else:
+            raise ValueError(f"Cannot write '{path}': ffmpeg is not installed. "
+                             f"Write a .gif or an image sequence (a directory) instead")
+        with writer.saving(renderer.fig, path, dpi=dpi):
+            writer.grab_frame()
+            for _ in range(steps):
+                model.step()
+                renderer.update()
+                writer.grab_frame()
+        return [path]
+    finally:
+        plt.close(renderer.fig)
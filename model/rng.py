@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Random number streams for the Flood Adaptation Model.
+
+All random numbers of a model come from NumPy random Generators derived from one seed with a SeedSequence.
+Every part of the model has its own stream, so drawing more or fewer numbers in one part (e.g. placing more
+households) does not change the numbers of another part (e.g. the flood noise):
+- placement: locations of the households and the government
+- attributes: initial household attributes (house size, income, trust, taken measures, perceived flood probability)
+- behaviour: activation order of the households in the array engine
+  (the agents engine activates its agents with Mesa's model.random, which is seeded with the same seed)
+- hazards: flood events and their noise
+- network: social network of the compact network backend (see csr_network.py)
+"""
+import numpy as np
+
+
+class RandomStreams:
+    """
+    Independent random generators for the parts of the model, derived from one seed.
+    """
+    components = ('placement', 'attributes', 'behaviour', 'hazards', 'network')
+
+    def __init__(self, seed=None, seed_sequence=None):
+        """
+        Parameters
+        ----------
+        seed: seed of the model. If None, fresh entropy from the operating system is used.
+        seed_sequence: SeedSequence to derive the streams from, used instead of the seed
+        """
+        self.seed_sequence = seed_sequence if seed_sequence is not None else np.random.SeedSequence(seed)
+        for component, child in zip(self.components, self.seed_sequence.spawn(len(self.components))):
+            setattr(self, component, np.random.default_rng(child))
+
+    def spawn(self, number_of_streams):
+        """
+        Derive independent sets of streams, e.g. for the replications of an ensemble.
+        The i-th set is the same however many sets are spawned.
+
+        Parameters
+        ----------
+        number_of_streams: number of sets of streams
+
+        Returns
+        -------
+        streams: list of RandomStreams
+        """
+        return [RandomStreams(seed_sequence=child) for child in self.seed_sequence.spawn(number_of_streams)]
+
+
+def draw_household_attributes(number_of_households, max_trust_value, rng):
+    """
+    Draw the initial attributes of many households at once.
+
+    Parameters
+    ----------
+    number_of_households: number of households to draw the attributes for
+    max_trust_value: maximum trust factor of a household
+    rng: numpy random Generator, normally the attributes stream
+
+    Returns
+    -------
+    attributes: dictionary with an array per household attribute
+    """
+    return {
+        # range around average house size (159.14 square meters)
+        'size_of_house': rng.integers(120, 200, size=number_of_households),
+        # range around average quarterly income (17078)
+        'income': rng.integers(13000, 22000, size=number_of_households),
+        'trust_factor': rng.uniform(0, max_trust_value, size=number_of_households),
+        'taken_measures': rng.triangular(0, 0.1, 0.8, size=number_of_households),
+        'perceived_flood_probability': rng.random(size=number_of_households),
+    }
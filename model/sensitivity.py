@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+Global sensitivity analysis of the AdaptationModel with adaptive replication.
+
+Instead of one-at-a-time grids with a fixed number of replications per point (as for the studies in Output/), the
+parameters are varied together over their ranges with one of three designs:
+- latin_hypercube: space-filling sample of the parameter space, analysed with standardized regression coefficients
+- sobol: Saltelli sample built on a Sobol sequence, giving first-order and total Sobol indices
+- morris: elementary effects along random trajectories (mu, mu_star and sigma), a cheap screening of many parameters
+
+Every design point is replicated only until the confidence interval of the mean of every output is narrow enough
+(relative to the mean, or in absolute terms), with a minimum and maximum number of replications. Points where the
+outputs vary little between replications therefore stop after a few runs. The outputs are the model reporters
+at the last step, by default total_adapted_households and total_flood_damage.
+
+Usage, from the model directory:
+    python sensitivity.py
+"""
+import multiprocessing
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.stats import qmc
+
+from model import AdaptationModel
+import flood_maps
+from batch_runner import make_run_seeds, _initialize_worker
+
+# ranges of the parameters of the one-at-a-time studies in Output/
+default_parameter_ranges = {
+    'fine': (0, 5000),
+    'discount_rate': (0.9, 0.995),
+    'flood_warning': (0.0, 0.5),
+    'max_trust_value': (0.0, 0.5),
+    'elevation_costs_per_square_metre': (100, 500),
+}
+
+default_outputs = ('total_adapted_households', 'total_flood_damage')
+
+
+def _scale(unit_points, parameter_ranges):
+    """
+    Scale points in the unit hypercube to the parameter ranges. Parameters with integer bounds get integer values.
+
+    Parameters
+    ----------
+    unit_points: array with one row per point and one column per parameter, with values in [0, 1]
+    parameter_ranges: dictionary with the parameter names as keys and (lower bound, upper bound) as values
+
+    Returns
+    -------
+    points: DataFrame with one row per point and one column per parameter
+    """
+    columns = {}
+    for column, (name, (low, high)) in enumerate(parameter_ranges.items()):
+        if isinstance(low, (int, np.integer)) and isinstance(high, (int, np.integer)):
+            # every integer gets an equal share of [0, 1]; a value of exactly 1 would give high + 1
+            values = np.floor(low + unit_points[:, column] * (high - low + 1))
+            columns[name] = np.minimum(values, high).astype(int)
+        else:
+            columns[name] = low + unit_points[:, column] * (high - low)
+    return pd.DataFrame(columns)
+
+
+def make_design(parameter_ranges, number_of_points, method='latin_hypercube', seed=0):
+    """
+    Make a sample of the parameter space.
+
+    Parameters
+    ----------
+    parameter_ranges: dictionary with the parameter names as keys and (lower bound, upper bound) as values
+    number_of_points: number of points. For 'sobol' this is rounded up to a power of two.
+    method: "latin_hypercube" or "sobol" (a scrambled Sobol sequence)
+    seed: seed of the sample
+
+    Returns
+    -------
+    design: DataFrame with one row per point and one column per parameter
+    """
+    dimensions = len(parameter_ranges)
+    if method == 'latin_hypercube':
+        unit_points = qmc.LatinHypercube(d=dimensions, seed=seed).random(number_of_points)
+    elif method == 'sobol':
+        unit_points = qmc.Sobol(d=dimensions, seed=seed).random_base2(int(np.ceil(np.log2(number_of_points))))
+    else:
+        raise ValueError(f"Unknown sampling method: '{method}'. "
+                         f"Currently implemented sampling methods are: 'latin_hypercube' and 'sobol'")
+    return _scale(unit_points, parameter_ranges)
+
+
+def make_saltelli_design(parameter_ranges, number_of_base_points, seed=0):
+    """
+    Make the Saltelli sample for Sobol indices: two base matrices A and B from a Sobol sequence, and for every
+    parameter the matrix A with the column of that parameter taken from B. The model is run
+    number_of_base_points * (number_of_parameters + 2) times.
+
+    Parameters
+    ----------
+    parameter_ranges: dictionary with the parameter names as keys and (lower bound, upper bound) as values
+    number_of_base_points: number of rows of A and B, rounded up to a power of two
+    seed: seed of the sample
+
+    Returns
+    -------
+    design: DataFrame with the columns "matrix" ("A", "B" or the name of the parameter taken from B),
+            "sample" (the row of the base matrices) and the parameters
+    """
+    dimensions = len(parameter_ranges)
+    exponent = int(np.ceil(np.log2(number_of_base_points)))
+    base = qmc.Sobol(d=2 * dimensions, seed=seed).random_base2(exponent)
+    A, B = base[:, :dimensions], base[:, dimensions:]
+
+    matrices = {'A': A, 'B': B}
+    for column, name in enumerate(parameter_ranges):
+        AB = A.copy()
+        AB[:, column] = B[:, column]
+        matrices[name] = AB
+
+    designs = []
+    for matrix, unit_points in matrices.items():
+        design = _scale(unit_points, parameter_ranges)
+        design.insert(0, 'sample', np.arange(len(unit_points)))
+        design.insert(0, 'matrix', matrix)
+        designs.append(design)
+    return pd.concat(designs, ignore_index=True)
+
+
+def make_morris_design(parameter_ranges, number_of_trajectories, number_of_levels=4, seed=0):
+    """
+    Make the Morris trajectories: every trajectory starts at a random point of a grid with number_of_levels levels
+    per parameter and changes one parameter at a time, in a random order, by delta = levels / (2 * (levels - 1))
+    of its range. The model is run number_of_trajectories * (number_of_parameters + 1) times.
+
+    Parameters
+    ----------
+    parameter_ranges: dictionary with the parameter names as keys and (lower bound, upper bound) as values
+    number_of_trajectories: number of trajectories
+    number_of_levels: number of grid levels per parameter (even)
+    seed: seed of the trajectories
+
+    Returns
+    -------
+    design: DataFrame with the columns "trajectory", "changed_parameter" (None at the start of a trajectory),
+            "step" (the change of the changed parameter as a fraction of its range) and the parameters
+    """
+    rng = np.random.default_rng(seed)
+    names = list(parameter_ranges)
+    dimensions = len(names)
+    delta = number_of_levels / (2 * (number_of_levels - 1))
+    levels = np.arange(number_of_levels) / (number_of_levels - 1)
+
+    unit_points, trajectories, changed_parameters, steps = [], [], [], []
+    for trajectory in range(number_of_trajectories):
+        point = rng.choice(levels, size=dimensions)
+        unit_points.append(point.copy())
+        trajectories.append(trajectory)
+        changed_parameters.append(None)
+        steps.append(0.0)
+        for column in rng.permutation(dimensions):
+            # move up if that stays within the range, otherwise down
+            step = delta if point[column] + delta <= 1 + 1e-12 else -delta
+            point[column] = min(max(point[column] + step, 0.0), 1.0)
+            unit_points.append(point.copy())
+            trajectories.append(trajectory)
+            changed_parameters.append(names[column])
+            steps.append(step)
+
+    design = _scale(np.array(unit_points), parameter_ranges)
+    design.insert(0, 'step', steps)
+    design.insert(0, 'changed_parameter', changed_parameters)
+    design.insert(0, 'trajectory', trajectories)
+    return design
+
+
+def run_replications(parameters, seed, max_steps, outputs=default_outputs, min_replications=3,
+                     max_replications=30, relative_precision=0.05, absolute_precision=None, confidence=0.95):
+    """
+    Replicate the model at one design point until the confidence interval of the mean of every output is narrow
+    enough: its half-width at most relative_precision times the absolute mean, or at most the absolute precision
+    of that output.
+
+    Parameters
+    ----------
+    parameters: dictionary with the parameters of the AdaptationModel
+    seed: seed of the point, from which the seed of every replication is derived
+    max_steps: number of steps of each run
+    outputs: model reporters of which the value at the last step is used
+    min_replications: number of replications before the precision is checked (at least 2)
+    max_replications: largest number of replications
+    relative_precision: required half-width of the confidence interval relative to the mean
+    absolute_precision: dictionary with a required half-width per output, e.g. {'total_adapted_households': 1}
+    confidence: confidence level of the interval
+
+    Returns
+    -------
+    result: dictionary with the mean and half-width of every output and the number of replications
+    """
+    absolute_precision = absolute_precision or {}
+    replication_seeds = make_run_seeds(seed, max_replications)
+    values = {output: [] for output in outputs}
+
+    for replication in range(max_replications):
+        model = AdaptationModel(seed=replication_seeds[replication], **parameters)
+        for _ in range(max_steps):
+            model.step()
+        last_step = model.datacollector.get_model_vars_dataframe().iloc[-1]
+        for output in outputs:
+            values[output].append(float(last_step[output]))
+
+        number_of_replications = replication + 1
+        if number_of_replications >= max(min_replications, 2):
+            half_widths = _half_widths(values, confidence)
+            if all(half_widths[output] <= relative_precision * abs(np.mean(values[output])) or
+                   half_widths[output] <= absolute_precision.get(output, 0)
+                   for output in outputs):
+                break
+
+    half_widths = _half_widths(values, confidence) if number_of_replications > 1 \
+        else {output: np.nan for output in outputs}
+    result = {'replications': number_of_replications}
+    for output in outputs:
+        result[output] = float(np.mean(values[output]))
+        result[f'{output}_half_width'] = float(half_widths[output])
+    return result
+
+
+def _half_widths(values, confidence):
+    # half-width of the Student t confidence interval of the mean
+    half_widths = {}
+    for output, output_values in values.items():
+        number = len(output_values)
+        half_widths[output] = (stats.t.ppf((1 + confidence) / 2, number - 1) *
+                               np.std(output_values, ddof=1) / np.sqrt(number))
+    return half_widths
+
+
+def _run_point(task):
+    point_id, parameters, seed, max_steps, replication_settings = task
+    return {'point': point_id, **parameters, **run_replications(parameters, seed, max_steps, **replication_settings)}
+
+
+def run_design(design, parameter_names, fixed_parameters=None, max_steps=50, seed=0, processes=None,
+               **replication_settings):
+    """
+    Run every point of a design with adaptive replication, spread over a pool of processes.
+
+    Parameters
+    ----------
+    design: DataFrame made by make_design, make_saltelli_design or make_morris_design
+    parameter_names: names of the design columns that are parameters of the AdaptationModel
+    fixed_parameters: dictionary with the other parameters of the AdaptationModel
+    max_steps: number of steps of each run
+    seed: seed of the study, from which the seed of every point is derived
+    processes: number of worker processes, by default the number of cores. With 1 the points run in this process.
+    replication_settings: outputs, min_replications, max_replications, relative_precision, absolute_precision
+                          and confidence, see run_replications
+
+    Returns
+    -------
+    results: DataFrame with the design and, per point, the number of replications and the mean and half-width of
+             every output
+    """
+    fixed_parameters = fixed_parameters or {}
+    point_seeds = make_run_seeds(seed, len(design))
+    tasks = [(point_id, {**fixed_parameters, **{name: _python_value(row[name]) for name in parameter_names}},
+              point_seeds[point_id], max_steps, replication_settings)
+             for point_id, row in enumerate(design.to_dict(orient='records'))]
+
+    flood_map_choices = sorted({'harvey', fixed_parameters.get('flood_map_choice', 'harvey')})
+    flood_maps_in_memory = fixed_parameters.get('flood_maps_in_memory', True)
+    if processes == 1:
+        _initialize_worker(flood_map_choices, flood_maps_in_memory, flood_maps.flood_map_cache_path)
+        point_results = [_run_point(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes=processes, initializer=_initialize_worker,
+                                  initargs=(flood_map_choices, flood_maps_in_memory,
+                                            flood_maps.flood_map_cache_path)) as pool:
+            point_results = list(pool.imap_unordered(_run_point, tasks))
+
+    point_results = pd.DataFrame(point_results).sort_values('point').set_index('point')
+    outputs = point_results.drop(columns=list(fixed_parameters) + list(parameter_names), errors='ignore')
+    return pd.concat([design.reset_index(drop=True), outputs.reset_index(drop=True)], axis=1)
+
+
+def _python_value(value):
+    # the model parameters as Python numbers instead of numpy scalars
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def regression_coefficients(results, parameter_names, outputs=default_outputs):
+    """
+    Standardized regression coefficients of the outputs on the parameters, e.g. for a Latin hypercube design.
+    A coefficient is the change of the output, in standard deviations, per standard deviation of the parameter.
+    Parameters that have the same value in all results have no coefficient: they are left out of the regression,
+    get NaN and are reported with a warning.
+
+    Returns
+    -------
+    coefficients: DataFrame with one row per parameter and one column per output
+    """
+    parameter_names = list(parameter_names)
+    X = results[parameter_names].to_numpy(dtype=float)
+    varied = X.std(axis=0) > 0
+    if not varied.all():
+        warnings.warn(f"The parameters {[name for name, is_varied in zip(parameter_names, varied) if not is_varied]} "
+                      f"have the same value in all results and get no regression coefficient")
+    X = X[:, varied]
+    X = (X - X.mean(axis=0)) / X.std(axis=0)
+    X = np.column_stack([np.ones(len(X)), X])
+    coefficients = {}
+    for output in outputs:
+        y = results[output].to_numpy(dtype=float)
+        y = (y - y.mean()) / y.std() if y.std() > 0 else y - y.mean()
+        coefficients[output] = np.full(len(parameter_names), np.nan)
+        coefficients[output][varied] = np.linalg.lstsq(X, y, rcond=None)[0][1:]
+    return pd.DataFrame(coefficients, index=parameter_names)
+
+
+def sobol_indices(results, parameter_names, outputs=default_outputs):
+    """
+    First-order (S1) and total (ST) Sobol indices from the results of a Saltelli design, with the estimators
+    of Saltelli et al. (2010) for S1 and Jansen for ST.
+
+    Returns
+    -------
+    indices: DataFrame with one row per parameter and the columns "<output>_S1" and "<output>_ST"
+    """
+    indices = {}
+    for output in outputs:
+        by_matrix = {matrix: group.sort_values('sample')[output].to_numpy(dtype=float)
+                     for matrix, group in results.groupby('matrix')}
+        f_A, f_B = by_matrix['A'], by_matrix['B']
+        variance = np.var(np.concatenate([f_A, f_B]))
+        first_order, total = [], []
+        for name in parameter_names:
+            f_AB = by_matrix[name]
+            first_order.append(np.mean(f_B * (f_AB - f_A)) / variance if variance > 0 else np.nan)
+            total.append(0.5 * np.mean((f_A - f_AB) ** 2) / variance if variance > 0 else np.nan)
+        indices[f'{output}_S1'] = first_order
+        indices[f'{output}_ST'] = total
+    return pd.DataFrame(indices, index=list(parameter_names))
+
+
+def morris_effects(results, parameter_ranges, outputs=default_outputs):
+    """
+    Elementary effects from the results of a Morris design: mu (mean effect), mu_star (mean absolute effect, the
+    importance of the parameter) and sigma (spread of the effects, from interactions or non-linearity).
+    The effects are the changes of the output per full range of the parameter.
+
+    Returns
+    -------
+    effects: DataFrame with one row per parameter and the columns "<output>_mu", "<output>_mu_star" and
+             "<output>_sigma"
+    """
+    effects = {name: {output: [] for output in outputs} for name in parameter_ranges}
+    for _, trajectory in results.sort_index().groupby('trajectory'):
+        for output in outputs:
+            values = trajectory[output].to_numpy(dtype=float)
+            for position in range(1, len(trajectory)):
+                changed_parameter = trajectory['changed_parameter'].iloc[position]
+                step = trajectory['step'].iloc[position]
+                effects[changed_parameter][output].append((values[position] - values[position - 1]) / step)
+
+    table = {}
+    for output in outputs:
+        table[f'{output}_mu'] = [np.mean(effects[name][output]) for name in parameter_ranges]
+        table[f'{output}_mu_star'] = [np.mean(np.abs(effects[name][output])) for name in parameter_ranges]
+        table[f'{output}_sigma'] = [np.std(effects[name][output], ddof=1) if len(effects[name][output]) > 1
+                                    else np.nan for name in parameter_ranges]
+    return pd.DataFrame(table, index=list(parameter_ranges))
+
+
+def run_sensitivity_analysis(parameter_ranges=None, method='morris', number_of_points=10, fixed_parameters=None,
+                             max_steps=50, seed=0, processes=None, **replication_settings):
+    """
+    Make a design, run it with adaptive replication and analyse the results.
+
+    Parameters
+    ----------
+    parameter_ranges: dictionary with the parameter names as keys and (lower bound, upper bound) as values,
+                      by default the parameters of the studies in Output/
+    method: "latin_hypercube", "sobol" or "morris"
+    number_of_points: number of points (latin_hypercube), base points (sobol) or trajectories (morris)
+    fixed_parameters: dictionary with the other parameters of the AdaptationModel
+    max_steps: number of steps of each run
+    seed: seed of the study
+    processes: number of worker processes, by default the number of cores
+    replication_settings: see run_replications
+
+    Returns
+    -------
+    results: DataFrame with the results of every design point, see run_design
+    analysis: DataFrame with the regression coefficients, Sobol indices or Morris effects of every parameter
+    """
+    parameter_ranges = parameter_ranges or default_parameter_ranges
+    outputs = replication_settings.get('outputs', default_outputs)
+    if method == 'latin_hypercube':
+        design = make_design(parameter_ranges, number_of_points, method='latin_hypercube', seed=seed)
+    elif method == 'sobol':
+        design = make_saltelli_design(parameter_ranges, number_of_points, seed=seed)
+    elif method == 'morris':
+        design = make_morris_design(parameter_ranges, number_of_points, seed=seed)
+    else:
+        raise ValueError(f"Unknown sensitivity method: '{method}'. "
+                         f"Currently implemented sensitivity methods are: 'latin_hypercube', 'sobol' and 'morris'")
+
+    results = run_design(design, list(parameter_ranges), fixed_parameters=fixed_parameters, max_steps=max_steps,
+                         seed=seed, processes=processes, **replication_settings)
+    if method == 'latin_hypercube':
+        analysis = regression_coefficients(results, list(parameter_ranges), outputs)
+    elif method == 'sobol':
+        analysis = sobol_indices(results, list(parameter_ranges), outputs)
+    else:
+        analysis = morris_effects(results, parameter_ranges, outputs)
+    return results, analysis
+
+
+if __name__ == '__main__':
+    # Morris screening of the parameters of the one-at-a-time studies in Output/
+    results, analysis = run_sensitivity_analysis(method='morris', number_of_points=10,
+                                                 fixed_parameters={'number_of_households': 100}, max_steps=50,
+                                                 absolute_precision={'total_adapted_households': 1})
+    print(f"{results['replications'].sum()} model runs for {len(results)} design points")
+    print(analysis.to_string())
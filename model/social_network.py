@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Functions to compile the social network of the households into arrays, for the array engine.
+
+The perceived flood probability of a household is updated by blending in its neighbours one by one
+(see Households.construct_perceived_flood_probability in agents.py):
+
+    p_i = discount_rate * p_i
+    for every neighbour j, in order: p_i = p_i * (1 - trust_j) + trust_j * p_j
+
+Written out, this is p_i = discount_rate * own_weight_i * p_i + sum_j w_ij * p_j, with
+own_weight_i = prod_j (1 - trust_j) and w_ij = trust_j * prod_{k after j} (1 - trust_k).
+As the trust factors do not change, these weights are compiled once into a sparse matrix.
+
+Two semantics are possible for the update:
+- "asynchronous": the households update one by one in activation order and read the values of the neighbours
+  that were already updated in the same step, as with RandomActivation. This is the reference.
+- "synchronous": all households update at once from the values at the start of the step. This is one sparse
+  matrix-vector product per step, but results differ from the reference because the activation order no longer matters.
+"""
+import numpy as np
+from scipy import sparse
+
+from csr_network import CSRGraph
+
+
+def neighbour_lists_from_network(G):
+    """
+    Store the neighbours of every node of the network graph in two flat arrays (compressed sparse rows).
+    The neighbours of node i are indices[indptr[i]:indptr[i+1]], in the same order as NetworkGrid gives them.
+
+    Parameters
+    ----------
+    G: network graph with the nodes 0 to n-1
+
+    Returns
+    -------
+    indptr, indices: arrays with the start of every node's neighbours and the neighbours themselves
+    """
+    if isinstance(G, CSRGraph):
+        # the compact network backend already stores its neighbours this way
+        return G.indptr, G.indices.astype(np.int64)
+    number_of_nodes = G.number_of_nodes()
+    indptr = np.zeros(number_of_nodes + 1, dtype=np.int64)
+    neighbours = []
+    for node in range(number_of_nodes):
+        node_neighbours = list(G.neighbors(node))
+        indptr[node + 1] = indptr[node] + len(node_neighbours)
+        neighbours.extend(node_neighbours)
+    indices = np.array(neighbours, dtype=np.int64)
+    return indptr, indices
+
+
+def compile_influence_matrix(indptr, indices, trust_factor):
+    """
+    Compile the social influence of the neighbours into a sparse matrix with trust weights.
+
+    Parameters
+    ----------
+    indptr, indices: neighbour lists of the households, see neighbour_lists_from_network
+    trust_factor: array with the trust factor of every household
+
+    Returns
+    -------
+    influence_matrix: CSR matrix with the weight w_ij of neighbour j in the perceived flood probability of household i
+    own_weight: array with the weight of each household's own (discounted) perceived flood probability
+    """
+    number_of_households = len(indptr) - 1
+    degree = np.diff(indptr)
+    row = np.repeat(np.arange(number_of_households), degree)
+    # position of every neighbour within the neighbour list of its household
+    position = np.arange(len(indices)) - indptr[row]
+    neighbour_trust = trust_factor[indices]
+
+    # go through the neighbours from the last position to the first, keeping the product of (1 - trust)
+    # of the neighbours after the current position for every household
+    weights = np.empty(len(indices))
+    product_after = np.ones(number_of_households)
+    by_position = np.argsort(-position, kind='stable')
+    position_starts = np.flatnonzero(np.diff(position[by_position], prepend=-1))
+    for entries in np.split(by_position, position_starts[1:]):
+        weights[entries] = neighbour_trust[entries] * product_after[row[entries]]
+        product_after[row[entries]] *= 1 - neighbour_trust[entries]
+
+    influence_matrix = sparse.csr_matrix((weights, indices, indptr), shape=(number_of_households, number_of_households))
+    return influence_matrix, product_after
+
+
+def influence_synchronous(perceived_flood_probability, discount_rate, influence_matrix, own_weight):
+    """
+    Update the perceived flood probability of all households at once from the values at the start of the step.
+
+    Parameters
+    ----------
+    perceived_flood_probability: array with the perceived flood probability of every household,
+                                 or an array with one row per replication of an ensemble
+    discount_rate: discount rate of the perceived flood probability
+    influence_matrix, own_weight: compiled social influence, see compile_influence_matrix
+
+    Returns
+    -------
+    perceived_flood_probability: array with the updated perceived flood probability
+    """
+    # the households are the last axis, so a batch of replications is multiplied with the transposed matrix at once
+    return (discount_rate * own_weight * perceived_flood_probability +
+            (influence_matrix @ perceived_flood_probability.T).T)
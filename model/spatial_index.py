@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial index of the household locations of the Flood Adaptation Model.
+
+The coordinates of the households are kept in arrays, in the order of the households (household i is the household
+on network node i), and indexed with a Shapely STRtree. Questions like "which households lie in this zone",
+"which households are within 500 m of this levee" or "which households read their flood depth from this raster
+window" are answered with one query on the tree instead of a check of every household.
+"""
+import numpy as np
+from shapely import STRtree, points, box
+from rasterio.transform import rowcol, xy
+
+
+class HouseholdIndex:
+    """
+    STRtree index over the locations of all households.
+    """
+
+    def __init__(self, x, y):
+        """
+        Parameters
+        ----------
+        x, y: arrays of household location coordinates
+        """
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.number_of_households = len(self.x)
+        self.tree = STRtree(points(self.x, self.y))
+
+    def within_polygon(self, polygon):
+        """
+        Households within a (multi)polygon, e.g. the floodplain or a flood zone.
+        Households on the boundary are not within the polygon, as with contains_xy.
+
+        Parameters
+        ----------
+        polygon: Shapely (multi)polygon
+
+        Returns
+        -------
+        households: sorted array with the indices of the households within the polygon
+        """
+        return np.sort(self.tree.query(polygon, predicate='contains'))
+
+    def within_distance(self, geometry, distance):
+        """
+        Households within a distance of a geometry, e.g. a levee (line) or a point.
+
+        Parameters
+        ----------
+        geometry: Shapely geometry
+        distance: distance in metres
+
+        Returns
+        -------
+        households: sorted array with the indices of the households within the distance
+        """
+        return np.sort(self.tree.query(geometry, predicate='dwithin', distance=distance))
+
+    def within_raster_window(self, transform, row_off, col_off, height, width):
+        """
+        Households that read their flood depth from a window of a flood map, the same way as SharedFloodMap.get_depths.
+
+        Parameters
+        ----------
+        transform: transform of the flood map
+        row_off, col_off: row and column of the upper left cell of the window
+        height, width: size of the window in cells
+
+        Returns
+        -------
+        households: sorted array with the indices of the households within the window
+        """
+        # the depth of a household is read from the cell above and left of its own cell, so the window is shifted
+        # one cell; the candidates of the bounding box (with a cell margin) are then checked by their cell
+        corners_x, corners_y = xy(transform, [row_off, row_off + height + 1], [col_off, col_off + width + 1],
+                                  offset='ul')
+        candidates = self.tree.query(box(min(corners_x), min(corners_y), max(corners_x), max(corners_y)))
+        rows, cols = rowcol(transform, self.x[candidates], self.y[candidates])
+        rows = np.asarray(rows) - 1
+        cols = np.asarray(cols) - 1
+        inside = (rows >= row_off) & (rows < row_off + height) & (cols >= col_off) & (cols < col_off + width)
+        return np.sort(candidates[inside])
+
+    def mask(self, households):
+        """
+        Turn household indices into a boolean array with one value per household.
+
+        Parameters
+        ----------
+        households: array with household indices, e.g. the result of a query
+
+        Returns
+        -------
+        mask: boolean array, True for the given households
+        """
+        mask = np.zeros(self.number_of_households, dtype=bool)
+        mask[households] = True
+        return mask
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+The tests run the model on the small synthetic landscape of benchmark.py, so they do not need the input data.
+The modules of the model import each other by name, so the model directory is put on the path.
+"""
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import use_synthetic_landscape
+
+
+@pytest.fixture(scope='session', autouse=True)
+def synthetic_landscape(tmp_path_factory):
+    use_synthetic_landscape(str(tmp_path_factory.mktemp('landscape')))
+
+
+@pytest.fixture
+def forked_workers():
+    # the worker processes are forked, so they use the synthetic landscape as well (importing Mesa sets the start
+    # method to spawn, and a spawned worker would load the input data)
+    start_method = multiprocessing.get_start_method()
+    multiprocessing.set_start_method('fork', force=True)
+    yield
+    multiprocessing.set_start_method(start_method, force=True)
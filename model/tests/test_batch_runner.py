@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+The parallel batch runner: the results do not depend on the number of worker processes.
+"""
+import pandas as pd
+
+from batch_runner import make_parameter_combinations, make_run_seeds, run_batch, run_model
+
+
+def test_parameter_combinations_and_seeds():
+    combinations = make_parameter_combinations({'fine': [0, 500], 'discount_rate': 0.99})
+    assert combinations == [{'fine': 0, 'discount_rate': 0.99}, {'fine': 500, 'discount_rate': 0.99}]
+    assert make_run_seeds(0, 4) == make_run_seeds(0, 4)
+    assert len(set(make_run_seeds(0, 4))) == 4
+
+
+def test_results_do_not_depend_on_processes(tmp_path, forked_workers):
+    parameter_grid = {'number_of_households': 50, 'fine': [0, 500]}
+    output_path = tmp_path / 'results.csv'
+    serial = run_batch(parameter_grid, replications=2, max_steps=8, seed=1, processes=1)
+    parallel = run_batch(parameter_grid, replications=2, max_steps=8, seed=1, processes=2, output_path=output_path)
+    assert len(serial) == 4 * 8
+    pd.testing.assert_frame_equal(serial, parallel)
+
+    # the CSV file holds the same rows, in the order the runs finished
+    written = pd.read_csv(output_path).sort_values(['RunId', 'Step']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(written, parallel, check_dtype=False)
+
+    # a run of the batch is the same as the run on its own
+    rows = run_model(3, 1, {'number_of_households': 50, 'fine': 500}, int(parallel['seed'][3 * 8]), 8)
+    pd.testing.assert_frame_equal(pd.DataFrame(rows), parallel[parallel['RunId'] == 3].reset_index(drop=True))
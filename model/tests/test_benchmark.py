@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+The benchmark suite, on a few small configurations.
+"""
+import numpy as np
+
+import benchmark
+from benchmark import run_benchmarks, compare_benchmarks
+from flood_maps import flood_map_paths
+from functions import geodata
+
+
+def test_run_and_compare_benchmarks(tmp_path, monkeypatch):
+    monkeypatch.setitem(benchmark.slow_networks, 'erdos_renyi', 50)
+    paths_before, bounds_before = dict(flood_map_paths), geodata.map_bounds
+    output_path = str(tmp_path / 'benchmark_results.json')
+    benchmarks = run_benchmarks(household_counts=(25, 100), networks=('watts_strogatz', 'erdos_renyi'),
+                                engines=('agents', 'arrays'), steps=1, measure_memory=False, output_path=output_path)
+    results = benchmarks['results']
+    assert len(results) == 2 * 2 * 2
+    skipped = [(result['number_of_households'], result['network']) for result in results if 'skipped' in result]
+    assert skipped == [(100, 'erdos_renyi')] * 2
+    assert all(result['step_time'] > 0 for result in results if 'skipped' not in result)
+
+    # the landscape of the process is set back
+    assert flood_map_paths == paths_before
+    assert geodata.map_bounds == bounds_before
+
+    comparison = compare_benchmarks(output_path, output_path)
+    assert len(comparison) == 6
+    np.testing.assert_allclose(comparison['ratio'], 1)
+
+    # the csr backend generates the slow networks quickly, so they are not skipped
+    benchmarks = run_benchmarks(household_counts=(100,), networks=('erdos_renyi',), engines=('arrays',), steps=1,
+                                measure_memory=False, network_backend='csr')
+    assert 'skipped' not in benchmarks['results'][0]
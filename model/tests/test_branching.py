@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Warm-start branching: a branch gives the same results as a run that changes its policy at the branch step.
+"""
+import pandas as pd
+import pytest
+
+from model import AdaptationModel
+from branching import run_branches
+
+policies = [{'fine': 0}, {'fine': 2000, 'flood_warning': 0.3}]
+
+
+def run_with_policy_change(parameters, branch_step, policy, max_steps):
+    model = AdaptationModel(**parameters)
+    for _ in range(branch_step):
+        model.step()
+    model.set_policy(**policy)
+    for _ in range(max_steps - branch_step):
+        model.step()
+    return model.datacollector.get_model_vars_dataframe().reset_index(drop=True)
+
+
+@pytest.mark.parametrize('collector', ['mesa', 'columnar'])
+def test_branches_match_runs_with_policy_change(collector, forked_workers):
+    parameters = {'seed': 11, 'number_of_households': 80, 'collector': collector}
+    results = run_branches(parameters, branch_step=6, policies=policies, max_steps=16, processes=1)
+    assert len(results) == 2 * 16
+    for branch_id, policy in enumerate(policies):
+        expected = run_with_policy_change(parameters, 6, policy, 16)
+        branch = results[results['branch'] == branch_id].reset_index(drop=True)
+        pd.testing.assert_frame_equal(branch[expected.columns], expected, check_dtype=False)
+        assert (branch['fine'] == policy['fine']).all()
+
+    parallel = run_branches(parameters, branch_step=6, policies=policies, max_steps=16, processes=2)
+    pd.testing.assert_frame_equal(parallel, results)
+
+
+def test_reseeded_branches():
+    parameters = {'seed': 11, 'number_of_households': 80}
+    same_policy = [{'fine': 500}, {'fine': 500}]
+    shared_streams = run_branches(parameters, branch_step=6, policies=same_policy, max_steps=30, processes=1)
+    reseeded = run_branches(parameters, branch_step=6, policies=same_policy, max_steps=30, processes=1, reseed=True)
+    reporters = ['total_adapted_households', 'total_flood_damage', 'whatif_damage']
+    branches = [shared_streams[shared_streams['branch'] == branch_id][reporters].to_numpy() for branch_id in [0, 1]]
+    assert (branches[0] == branches[1]).all()
+    # the reseeded branches share the steps before the branch step
+    branches = [reseeded[reseeded['branch'] == branch_id][reporters].to_numpy() for branch_id in [0, 1]]
+    assert (branches[0][:7] == branches[1][:7]).all()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints and forks: a restored model continues exactly as the original would have.
+"""
+import pandas as pd
+import pytest
+
+from model import AdaptationModel
+from checkpoint import snapshot, restore, save_checkpoint, load_checkpoint, fork_model
+
+
+def run(model, steps):
+    for _ in range(steps):
+        model.step()
+    return model.datacollector.get_model_vars_dataframe()
+
+
+@pytest.mark.parametrize('engine, collector', [('agents', 'mesa'), ('arrays', 'mesa'), ('agents', 'columnar')])
+def test_checkpoint_round_trip(engine, collector, tmp_path):
+    parameters = dict(seed=10, number_of_households=80, engine=engine, collector=collector, fine=300)
+    expected = run(AdaptationModel(**parameters), 14)
+
+    model = AdaptationModel(**parameters)
+    run(model, 4)
+    path = tmp_path / 'checkpoint.pkl'
+    save_checkpoint(model, path)
+    del model
+    restored = load_checkpoint(path)
+    assert restored.schedule.steps == 4
+    pd.testing.assert_frame_equal(run(restored, 10), expected)
+
+
+def test_fork_model():
+    model = AdaptationModel(seed=10, number_of_households=80, fine=300)
+    run(model, 5)
+    first, second = fork_model(model, 2, reseed=False)
+    continued = run(model, 8)
+    # without reseeding every fork continues exactly as the model
+    pd.testing.assert_frame_equal(run(first, 8), continued)
+    pd.testing.assert_frame_equal(run(second, 8), continued)
+
+    # with reseeding the forks are different continuations of the same first steps
+    reseeded = [run(fork, 8) for fork in fork_model(restore(snapshot(model)), 2)]
+    assert not reseeded[0].equals(reseeded[1])
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+The columnar data collector against Mesa's DataCollector, and the output paths it writes to.
+"""
+import gc
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from model import AdaptationModel
+from checkpoint import snapshot, restore
+
+
+def run_model(steps=12, **model_parameters):
+    model = AdaptationModel(seed=4, number_of_households=100, **model_parameters)
+    for _ in range(steps):
+        model.step()
+    return model
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'npz'])
+def test_columnar_matches_mesa(output_format):
+    mesa_model = run_model(collector='mesa')
+    expected = mesa_model.datacollector.get_model_vars_dataframe()
+    model = run_model(collector='columnar', flush_every=5, output_format=output_format)
+    model_vars = model.datacollector.get_model_vars_dataframe()
+    assert len(model_vars) == len(expected)
+    for column in expected.columns:
+        np.testing.assert_allclose(model_vars[column].to_numpy(dtype=float),
+                                   expected[column].to_numpy(dtype=float), err_msg=column)
+    agent_vars = model.datacollector.get_agent_vars_dataframe()
+    assert len(agent_vars) == len(mesa_model.datacollector.get_agent_vars_dataframe())
+    assert agent_vars.index.names == ['Step', 'AgentID']
+
+
+def test_output_path_of_another_run(tmp_path):
+    output_path = str(tmp_path / 'run')
+    run_model(collector='columnar', output_path=output_path)
+    with pytest.raises(ValueError):
+        AdaptationModel(seed=4, number_of_households=100, collector='columnar', output_path=output_path)
+    AdaptationModel(seed=4, number_of_households=100, collector='columnar', output_path=output_path,
+                    overwrite_output=True)
+
+
+def test_temporary_directory_is_removed():
+    model = run_model(collector='columnar', flush_every=5)
+    temporary_directory = os.path.dirname(model.datacollector.output_path)
+    assert os.listdir(temporary_directory)
+
+    # a copy of the model writes to a temporary directory of its own, with the chunks written so far
+    copy = restore(snapshot(model))
+    copy_directory = os.path.dirname(copy.datacollector.output_path)
+    assert copy_directory != temporary_directory
+    pd.testing.assert_frame_equal(copy.datacollector.get_model_vars_dataframe(),
+                                  model.datacollector.get_model_vars_dataframe())
+
+    del model
+    gc.collect()
+    assert not os.path.exists(temporary_directory)
+    copy.step()
+    assert len(copy.datacollector.get_model_vars_dataframe()) == 13
+    copy.datacollector.remove_temporary_directory()
+    assert not os.path.exists(copy_directory)
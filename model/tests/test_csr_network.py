@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+The compact social network backend against the NetworkX generators and Mesa's NetworkGrid.
+"""
+import networkx as nx
+import numpy as np
+import pytest
+
+from csr_network import CSRGraph, CSRNetworkGrid, erdos_renyi_graph, barabasi_albert_graph, watts_strogatz_graph
+from model import AdaptationModel
+
+
+def degrees(graph):
+    return sorted(graph.degree(node) for node in graph.nodes())
+
+
+@pytest.mark.parametrize('number_of_nodes, number_of_nearest_neighbours',
+                         [(10, 2), (10, 5), (50, 4), (7, 6), (6, 6), (5, 5), (1, 1)])
+def test_watts_strogatz_matches_networkx(number_of_nodes, number_of_nearest_neighbours):
+    rng = np.random.default_rng(0)
+    for probability in [0, 0.3]:
+        graph = watts_strogatz_graph(number_of_nodes, number_of_nearest_neighbours, probability, rng)
+        expected = nx.watts_strogatz_graph(number_of_nodes, number_of_nearest_neighbours, probability, seed=0)
+        assert graph.number_of_nodes() == expected.number_of_nodes()
+        assert graph.number_of_edges() == expected.number_of_edges()
+        if probability == 0 or number_of_nearest_neighbours == number_of_nodes:
+            assert degrees(graph) == degrees(expected)
+
+
+def test_watts_strogatz_more_neighbours_than_nodes():
+    with pytest.raises(nx.NetworkXError):
+        nx.watts_strogatz_graph(5, 6, 0.3, seed=0)
+    with pytest.raises(ValueError):
+        watts_strogatz_graph(5, 6, 0.3, np.random.default_rng(0))
+
+
+def test_barabasi_albert_matches_networkx():
+    graph = barabasi_albert_graph(200, 3, np.random.default_rng(0))
+    expected = nx.barabasi_albert_graph(200, 3, seed=0)
+    assert graph.number_of_edges() == expected.number_of_edges()
+    with pytest.raises(ValueError):
+        barabasi_albert_graph(3, 3, np.random.default_rng(0))
+
+
+def test_erdos_renyi_number_of_edges():
+    graph = erdos_renyi_graph(2000, 0.01, np.random.default_rng(0))
+    expected_edges = 0.01 * 2000 * 1999 / 2
+    assert abs(graph.number_of_edges() - expected_edges) < 5 * np.sqrt(expected_edges)
+    # no self-loops or duplicate edges
+    assert nx.number_of_selfloops(graph.to_networkx()) == 0
+    assert graph.to_networkx().number_of_edges() == graph.number_of_edges()
+
+
+def test_graph_from_edges():
+    graph = CSRGraph.from_edges(4, np.array([0, 1, 1, 2, 3]), np.array([1, 0, 2, 2, 0]))
+    assert graph.number_of_edges() == 3
+    assert list(graph.neighbors(0)) == [1, 3]
+    assert graph.degree(2) == 1
+    assert set(graph.to_networkx().edges()) == {(0, 1), (1, 2), (0, 3)}
+
+
+def test_network_grid_matches_mesa():
+    model = AdaptationModel(seed=2, number_of_households=100, network_backend='csr')
+    assert isinstance(model.grid, CSRNetworkGrid)
+    expected = AdaptationModel(seed=2, number_of_households=100, network_backend='networkx')
+    for node in [0, 2, 50]:
+        neighbours = model.grid.get_neighborhood(node, include_center=False)
+        assert sorted(neighbours) == sorted(model.G.neighbors(node))
+        agents = model.grid.get_neighbors(node)
+        assert all(agent.pos in neighbours for agent in agents)
+    assert model.G.number_of_edges() == expected.G.number_of_edges()
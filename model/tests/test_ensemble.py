@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Ensembles of replications on one landscape.
+"""
+import pandas as pd
+import pytest
+
+from ensemble import Ensemble
+
+
+@pytest.mark.parametrize('influence_update', ['synchronous', 'asynchronous'])
+def test_replications_do_not_depend_on_ensemble_size(influence_update):
+    # the i-th replication gets the same random streams however many replications there are
+    results = []
+    for number_of_replications in [2, 4]:
+        ensemble = Ensemble(number_of_replications, seed=8, influence_update=influence_update,
+                            number_of_households=80, fine=300)
+        ensemble.run(12)
+        results.append(ensemble.get_model_vars_dataframe())
+    small, large = results
+    assert len(small) == 2 * 12 and len(large) == 4 * 12
+    pd.testing.assert_frame_equal(small, large[large['iteration'] < 2].reset_index(drop=True))
+
+    # the replications differ in their stochastic behaviour
+    final = large[large['Step'] == 11]
+    assert final['total_flood_damage'].nunique() > 1
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Event-driven running against stepping the model every step.
+"""
+import numpy as np
+import pytest
+
+import event_scheduler
+from model import AdaptationModel
+from event_scheduler import run_event_driven, next_event_step
+
+
+@pytest.mark.parametrize('parameters', [
+    {'engine': 'arrays', 'network': 'no_network'},
+    {'engine': 'arrays', 'influence_update': 'synchronous'},
+    {'engine': 'agents'},
+])
+def test_event_driven_matches_stepwise(parameters, monkeypatch):
+    parameters = dict(seed=14, number_of_households=100, fine=2000, **parameters)
+    stepwise = AdaptationModel(**parameters)
+    for _ in range(120):
+        stepwise.step()
+
+    advanced_steps = []
+    advance_quiescent = event_scheduler.advance_quiescent
+    monkeypatch.setattr(event_scheduler, 'advance_quiescent',
+                        lambda model, number_of_steps: (advanced_steps.append(number_of_steps),
+                                                        advance_quiescent(model, number_of_steps)))
+    event_driven = AdaptationModel(**parameters)
+    assert run_event_driven(event_driven, 120) == 120
+    if parameters['engine'] == 'arrays':
+        assert sum(advanced_steps) > 0
+    else:
+        assert advanced_steps == []
+
+    expected = stepwise.datacollector.get_model_vars_dataframe()
+    model_vars = event_driven.datacollector.get_model_vars_dataframe()
+    assert len(model_vars) == len(expected)
+    for column in expected.columns:
+        np.testing.assert_allclose(model_vars[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                   rtol=1e-9, err_msg=column)
+    np.testing.assert_allclose(event_driven.average_perceived_flood_probability_over_time,
+                               stepwise.average_perceived_flood_probability_over_time, rtol=1e-9)
+    if parameters['engine'] == 'arrays':
+        np.testing.assert_allclose(event_driven.household_state.money_saved, stepwise.household_state.money_saved,
+                                   rtol=1e-9)
+        np.testing.assert_array_equal(event_driven.household_state.is_adapted, stepwise.household_state.is_adapted)
+
+
+def test_next_event_step():
+    model = AdaptationModel(seed=14, number_of_households=50, engine='arrays')
+    # the flood at step 5, the first inspection at step 6 and the first warning at step 9
+    expected = {0: 5, 5: 5, 6: 6, 7: 9, 9: 9, 10: 14}
+    for step in range(11):
+        if step in expected:
+            assert next_event_step(model) == expected[step]
+        model.step()
+
+
+def test_early_stop():
+    model = AdaptationModel(seed=14, number_of_households=100, engine='arrays', network='no_network', fine=2000)
+    steps = run_event_driven(model, 1000, tolerance=1e-6)
+    assert steps < 1000
+    assert len(model.datacollector.get_model_vars_dataframe()) == steps
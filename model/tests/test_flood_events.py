@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+The flood events and the scheduler that applies them to the households.
+"""
+import numpy as np
+import pytest
+from shapely.geometry import box
+
+from model import AdaptationModel
+from flood_events import FloodEvent, FloodEventScheduler
+from functions import geodata, calculate_flood_damage
+
+
+def household_values(model, attribute):
+    if model.household_state is not None:
+        return getattr(model.household_state, attribute)
+    return np.array([getattr(household, attribute) for household in model.household_agents])
+
+
+def test_unknown_noise():
+    with pytest.raises(ValueError):
+        FloodEvent(step=5, noise='lognormal')
+
+
+def test_from_return_periods():
+    first = FloodEventScheduler.from_return_periods({'100yr': 5, '500yr': 20}, 400, np.random.default_rng(0))
+    second = FloodEventScheduler.from_return_periods({'100yr': 5, '500yr': 20}, 400, np.random.default_rng(0))
+    assert [(event.step, event.flood_map_choice) for event in first.events] == \
+        [(event.step, event.flood_map_choice) for event in second.events]
+    assert [event.step for event in first.events] == sorted(event.step for event in first.events)
+    assert 0 < len(first.events_by_step) < 400
+
+
+@pytest.mark.parametrize('engine', ['agents', 'arrays'])
+def test_flood_without_noise(engine):
+    events = [FloodEvent(step=2, flood_map_choice='harvey', noise='none')]
+    model = AdaptationModel(seed=7, number_of_households=100, engine=engine, flood_events=events)
+    for _ in range(3):
+        model.step()
+    depths = np.maximum(household_values(model, 'flood_depth_Harvey'), 0)
+    np.testing.assert_allclose(household_values(model, 'flood_depth_actual'), depths)
+    np.testing.assert_allclose(household_values(model, 'flood_damage_actual'),
+                               calculate_flood_damage(depths, model.depth_damage_curve))
+    assert model.flood_events.history[0]['households_flooded'] == 100
+    np.testing.assert_allclose(model.total_flood_damage(), model.flood_events.history[0]['flood_damage'])
+
+
+def test_flood_of_a_zone():
+    minx, miny, maxx, maxy = geodata.map_bounds
+    zone = box(minx, miny, (minx + maxx) / 2, maxy)
+    model = AdaptationModel(seed=7, number_of_households=200,
+                            flood_events=[FloodEvent(step=0, flood_map_choice='harvey', zone=zone)])
+    model.step()
+    in_zone = model.household_x <= (minx + maxx) / 2
+    damage = household_values(model, 'flood_damage_final')
+    assert 0 < in_zone.sum() < 200 and damage[in_zone].sum() > 0
+    assert model.flood_events.history[0]['households_flooded'] == in_zone.sum()
+    assert np.all(damage[~in_zone] == 0)
+    assert np.all(household_values(model, 'flood_depth_actual')[~in_zone] == 0)
+
+
+def test_field_noise_is_shared_within_a_block():
+    model = AdaptationModel(seed=7, number_of_households=300, flood_events=[])
+    scheduler = model.flood_events
+    event = FloodEvent(step=0, flood_map_choice='harvey', noise='field', noise_cell_size=20)
+    factors = scheduler.draw_factors(model, event, np.random.default_rng(0))
+    rows, cols = scheduler.household_cells(model, 'harvey')
+    blocks = rows // 20 * 1000000 + cols // 20
+    for block in np.unique(blocks):
+        assert np.ptp(factors[blocks == block]) == 0
+    assert factors.min() >= 0.5 and factors.max() <= 1.2
+
+
+def test_scheduler_shared_by_models():
+    # every model applies the events with its own copy of the scheduler
+    scheduler = FloodEventScheduler([FloodEvent(step=1)])
+    models = [AdaptationModel(seed=seed, number_of_households=50, flood_events=scheduler) for seed in [1, 2]]
+    for model in models:
+        for _ in range(3):
+            model.step()
+    assert scheduler.history == []
+    assert [len(model.flood_events.history) for model in models] == [1, 1]
+    assert models[0].flood_events.history != models[1].flood_events.history
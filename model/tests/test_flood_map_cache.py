@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+The flood map cache against the flood maps themselves.
+"""
+import os
+
+import numpy as np
+import pytest
+
+import flood_maps
+from flood_maps import flood_map_paths, get_flood_map, get_household_depths, use_flood_map_cache
+from flood_map_cache import build_flood_map_cache, CachedFloodMap
+from functions import geodata
+from model import AdaptationModel
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    cache_path = str(tmp_path / 'flood_map_cache')
+    build_flood_map_cache(cache_path, flood_map_paths, geodata.map_bounds)
+    yield cache_path
+    use_flood_map_cache(None)
+
+
+def test_cache_is_opt_in(cache_path):
+    assert flood_maps.flood_map_cache_path is None
+    assert not isinstance(get_flood_map('harvey'), CachedFloodMap)
+    use_flood_map_cache(cache_path)
+    assert isinstance(get_flood_map('harvey'), CachedFloodMap)
+
+
+def test_cached_depths_within_half_a_centimetre(cache_path):
+    model = AdaptationModel(seed=15, number_of_households=500)
+    x, y = model.household_x, model.household_y
+    expected = {flood_map_choice: get_flood_map(flood_map_choice).get_depths(x, y)
+                for flood_map_choice in flood_map_paths}
+    expected_window = get_flood_map('100yr').read_window(100, 120, 30, 40)
+
+    use_flood_map_cache(cache_path)
+    depths = get_household_depths(list(flood_map_paths), x, y)
+    for flood_map_choice in flood_map_paths:
+        np.testing.assert_allclose(depths[flood_map_choice], expected[flood_map_choice], atol=0.005)
+        np.testing.assert_allclose(get_flood_map(flood_map_choice).get_depths(x, y), depths[flood_map_choice])
+    np.testing.assert_allclose(get_flood_map('100yr').read_window(100, 120, 30, 40), expected_window, atol=0.005)
+
+    # a model on the cache only differs by the rounding of the depths
+    cached_model = AdaptationModel(seed=15, number_of_households=500)
+    np.testing.assert_allclose([household.flood_depth_estimated for household in cached_model.household_agents],
+                               [household.flood_depth_estimated for household in model.household_agents], atol=0.005)
+
+
+def test_cache_is_not_used_when_out_of_date(cache_path):
+    use_flood_map_cache(cache_path)
+    cache = flood_maps.get_flood_map_cache()
+    path = flood_map_paths['harvey']
+    assert cache.is_valid_for('harvey', path, geodata.map_bounds)
+    minx, miny, maxx, maxy = geodata.map_bounds
+    assert not cache.is_valid_for('harvey', path, (minx, miny, maxx + 1000, maxy))
+
+    # a flood map file that changed is read from the file itself again
+    status = os.stat(path)
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 10**9))
+    try:
+        use_flood_map_cache(cache_path)
+        assert not isinstance(get_flood_map('harvey'), CachedFloodMap)
+        assert isinstance(get_flood_map('500yr'), CachedFloodMap)
+    finally:
+        os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+The depth-damage functions and curves, the distribution sampler and the geometry cache of functions.py.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions import DepthDamageCurve, DistributionSampler, calculate_basic_flood_damage, \
+    calculate_basic_flood_damage_array, set_initial_values
+
+
+def dense_depths():
+    # a dense grid with the depths around the jumps of the basic function at 0.025m and 6m
+    jumps = np.array([0.025, 6.0])
+    around_jumps = np.concatenate([jumps, np.nextafter(jumps, -np.inf), np.nextafter(jumps, np.inf),
+                                   jumps - 1e-5, jumps + 1e-5, [5.99993]])
+    return np.concatenate([np.linspace(-1, 8, 100001), around_jumps])
+
+
+def test_basic_flood_damage_array_matches_scalar():
+    depths = dense_depths()
+    expected = np.array([calculate_basic_flood_damage(depth) for depth in depths])
+    np.testing.assert_allclose(calculate_basic_flood_damage_array(depths), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_depth_damage_curve_matches_basic_function():
+    depths = dense_depths()
+    expected = np.array([calculate_basic_flood_damage(depth) for depth in depths])
+    curve = DepthDamageCurve.from_function()
+    # the jumps are at the same depths; elsewhere only the linear interpolation of the logarithm differs
+    np.testing.assert_allclose(curve(depths), expected, atol=4e-5)
+    jumps = np.array([0.025, 6.0])
+    around_jumps = np.concatenate([jumps, np.nextafter(jumps, -np.inf), np.nextafter(jumps, np.inf)])
+    np.testing.assert_allclose(curve(around_jumps), [calculate_basic_flood_damage(depth) for depth in around_jumps],
+                               atol=1e-12)
+
+
+def test_depth_damage_curve_scalar():
+    curve = DepthDamageCurve([0, 1, 2], [0, 0.5, 1], damage_below=0.0)
+    assert curve(-0.5) == 0.0
+    assert curve(0.5) == 0.25
+    assert curve(3) == 1.0
+
+
+def test_reprojected_geometry_cache(tmp_path):
+    import geopandas as gpd
+    from shapely.geometry import box
+    from functions import load_reprojected_geometry
+
+    shapefile_path = str(tmp_path / 'domain.shp')
+    gpd.GeoDataFrame(geometry=[box(-95.5, 29.5, -95.0, 30.0)], crs='EPSG:4326').to_file(shapefile_path)
+    cache_directory = str(tmp_path / 'cache')
+
+    geometry = load_reprojected_geometry(shapefile_path, 26915, cache_directory)
+    assert sorted(os.listdir(cache_directory)) == ['domain_epsg26915.key', 'domain_epsg26915.wkb']
+    assert load_reprojected_geometry(shapefile_path, 26915, cache_directory).equals_exact(geometry, 1e-6)
+
+    # a corrupt cached geometry is made again
+    with open(os.path.join(cache_directory, 'domain_epsg26915.wkb'), 'wb') as wkb_file:
+        wkb_file.write(b'\x01\x03')
+    assert load_reprojected_geometry(shapefile_path, 26915, cache_directory).equals_exact(geometry, 1e-6)
+    assert load_reprojected_geometry(shapefile_path, 26915, cache_directory).equals_exact(geometry, 1e-6)
+
+
+class FixedRandomNumbers:
+    # a random generator that draws the given numbers, one at a time or all at once
+    def __init__(self, numbers):
+        self.numbers = list(numbers)
+
+    def integers(self, low, high, endpoint=False, size=None):
+        if size is None:
+            return self.numbers.pop(0)
+        drawn, self.numbers = np.array(self.numbers[:size]), self.numbers[size:]
+        return drawn
+
+
+def test_distribution_sampler_matches_set_initial_values():
+    # the percentages of the last parameter do not reach 100, so the highest numbers give 0
+    input_data = pd.DataFrame({'parameter': ['income'] * 4 + ['size_of_house'] * 3,
+                               'value': [20000, 40000, 60000, 90000, 80, 120, 200],
+                               'value_for_input': [10, 35, 80, 100, 30, 30, 90]})
+    sampler = DistributionSampler(input_data)
+    assert sampler.parameters == ['income', 'size_of_house']
+    numbers = np.arange(101)
+    for parameter in sampler.parameters:
+        expected = [set_initial_values(input_data, parameter, FixedRandomNumbers([number])) for number in numbers]
+        np.testing.assert_array_equal(sampler.sample(parameter, 101, FixedRandomNumbers(numbers)), expected)
+    with pytest.raises(ValueError):
+        sampler.sample('age', 10, np.random.default_rng(0))
+    with pytest.raises(ValueError):
+        DistributionSampler(input_data.assign(value_for_input=[10, 5, 80, 100, 30, 30, 90]))
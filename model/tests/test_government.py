@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+The compliance index of the government against a full inspection of all households.
+"""
+import numpy as np
+import pytest
+
+from model import AdaptationModel
+from functions import calculate_flood_damage
+
+
+def full_inspection(model):
+    # whether every household complies, checked from scratch
+    government = model.government
+    if model.household_state is not None:
+        state = model.household_state
+        return calculate_flood_damage(state.flood_depth_Harvey, model.depth_damage_curve) - state.taken_measures \
+            <= government.regulations
+    return np.array([government.complies_with_certification(household) for household in model.household_agents])
+
+
+@pytest.mark.parametrize('engine', ['agents', 'arrays'])
+def test_compliance_index_matches_full_inspection(engine):
+    model = AdaptationModel(seed=6, number_of_households=150, engine=engine, fine=200)
+    government = model.government
+    for _ in range(4):
+        for _ in range(10):
+            model.step()
+        # an inspection only checks the households whose measures changed since the last one
+        government.check_all_households()
+        np.testing.assert_array_equal(government.complies, full_inspection(model))
+    assert government.fined_households_count == government.fine_counts.sum()
+    assert government.fined_total == government.fine * government.fined_households_count
+
+    # new regulations rebuild the index at the next inspection
+    model.set_policy(regulations=0.05)
+    government.check_all_households()
+    np.testing.assert_array_equal(government.complies, full_inspection(model))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+The exact activation of the array engine (household_kernel.py) against the agents engine.
+"""
+import numpy as np
+import pytest
+
+from model import AdaptationModel
+from household_state import HouseholdState
+from flood_events import FloodEvent
+
+compared_attributes = ['money_saved', 'perceived_flood_probability', 'taken_measures', 'is_adapted',
+                       'desire_to_take_measures', 'flood_damage_actual', 'perceived_effectiveness_of_measures']
+
+
+@pytest.mark.parametrize('network', ['watts_strogatz', 'barabasi_albert', 'erdos_renyi', 'no_network'])
+@pytest.mark.parametrize('batch_initialization', [False, True])
+def test_exact_activation_matches_agents(network, batch_initialization):
+    parameters = dict(seed=7, number_of_households=200, network=network, batch_initialization=batch_initialization,
+                      fine=500, flood_warning=0.2, flood_events=[FloodEvent(step=5), FloodEvent(step=20)])
+    agents_model = AdaptationModel(engine='agents', **parameters)
+    arrays_model = AdaptationModel(engine='arrays', exact_activation=True, **parameters)
+    for _ in range(30):
+        agents_model.step()
+        arrays_model.step()
+
+    expected = HouseholdState.from_agents(agents_model.household_agents, agents_model.G)
+    for attribute in compared_attributes:
+        np.testing.assert_array_equal(getattr(arrays_model.household_state, attribute), getattr(expected, attribute),
+                                      err_msg=attribute)
+    assert arrays_model.government.fined_total == agents_model.government.fined_total
+    np.testing.assert_allclose(arrays_model.datacollector.get_model_vars_dataframe().values,
+                               agents_model.datacollector.get_model_vars_dataframe().values, rtol=1e-9)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+The array engine (HouseholdState) against the agents engine (Households).
+"""
+import numpy as np
+import pytest
+
+from model import AdaptationModel
+from household_state import HouseholdState
+
+compared_attributes = ['money_saved', 'perceived_flood_probability', 'perceived_flood_damage',
+                       'perceived_effectiveness_of_measures', 'desire_to_take_measures', 'taken_measures', 'is_adapted']
+
+
+@pytest.mark.parametrize('network', ['watts_strogatz', 'barabasi_albert', 'erdos_renyi', 'no_network'])
+def test_households_step_matches_agents(network):
+    # a step of all households in the same activation order gives the same households in both engines
+    model = AdaptationModel(seed=3, number_of_households=200, engine='agents', network=network, fine=500)
+    for _ in range(6):
+        model.step()
+    household_state = HouseholdState.from_agents(model.household_agents, model.G)
+    activation_order = np.random.default_rng(0).permutation(model.number_of_households)
+
+    household_state.step(activation_order=activation_order)
+    for household in activation_order:
+        model.household_agents[household].step()
+
+    expected = HouseholdState.from_agents(model.household_agents, model.G)
+    for attribute in compared_attributes:
+        np.testing.assert_allclose(getattr(household_state, attribute), getattr(expected, attribute), rtol=1e-12,
+                                   err_msg=attribute)
+
+
+def test_synchronous_update_uses_start_of_step_values():
+    model = AdaptationModel(seed=3, number_of_households=200, engine='arrays', influence_update='synchronous')
+    state = model.household_state
+    before = state.perceived_flood_probability.copy()
+    state.construct_perceived_flood_probability()
+
+    expected = np.empty_like(before)
+    for household in range(model.number_of_households):
+        probability = state.discount_rate * before[household]
+        for neighbour in state.neighbour_indices[state.neighbour_indptr[household]:state.neighbour_indptr[household + 1]]:
+            probability = probability * (1 - state.trust_factor[neighbour]) + state.trust_factor[neighbour] * before[neighbour]
+        expected[household] = probability
+    np.testing.assert_allclose(state.perceived_flood_probability, expected, rtol=1e-12)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+The model reporters of the AdaptationModel.
+"""
+import numpy as np
+
+from model import AdaptationModel
+
+
+def test_model_reporters():
+    # the output has the columns of the original model
+    model = AdaptationModel(seed=5, number_of_households=100)
+    model.step()
+    assert list(model.datacollector.get_model_vars_dataframe().columns) == \
+        ['total_adapted_households', 'total_flood_damage', 'whatif_damage']
+
+
+def test_aggregates_equal_recomputed_sums():
+    model = AdaptationModel(seed=5, number_of_households=100, fine=500)
+    households = model.household_agents
+    for _ in range(30):
+        model.step()
+        # the agents keep the aggregates up to date during the step
+        assert model.adapted_households_count == sum(household.is_adapted for household in households)
+        np.testing.assert_allclose(model.money_saved_total, sum(household.money_saved for household in households),
+                                   rtol=1e-12)
+        np.testing.assert_allclose(model.perceived_flood_probability_total,
+                                   sum(household.perceived_flood_probability for household in households), rtol=1e-12)
+        np.testing.assert_allclose(model.flood_damage_total,
+                                   sum(household.flood_damage_final for household in households), rtol=1e-12)
+
+    # the reporters collected at the start of every step are the sums of the agents at that time
+    model.step()
+    model_vars = model.datacollector.get_model_vars_dataframe()
+    assert model_vars['total_flood_damage'].iloc[-1] == sum(household.flood_damage_final for household in households)
+    assert model_vars['whatif_damage'].iloc[-1] == sum(household.whatif_damage for household in households)
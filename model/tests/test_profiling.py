@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+The opt-in profiling of the model loop.
+"""
+import pandas as pd
+import pytest
+
+from model import AdaptationModel
+from agents import Households
+from profiling import PhaseTimer
+
+
+@pytest.fixture
+def restore_methods():
+    original_step = Households.step
+    yield
+    PhaseTimer.restore()
+    assert Households.step is original_step
+
+
+@pytest.mark.parametrize('engine', ['agents', 'arrays'])
+def test_profiling_does_not_change_the_results(engine, restore_methods, tmp_path):
+    profiled = AdaptationModel(seed=9, number_of_households=60, engine=engine, profile=True)
+    # a model without profiling is not timed, also when the methods are wrapped
+    unprofiled = AdaptationModel(seed=9, number_of_households=60, engine=engine)
+    for _ in range(6):
+        profiled.step()
+        unprofiled.step()
+    pd.testing.assert_frame_equal(profiled.datacollector.get_model_vars_dataframe(),
+                                  unprofiled.datacollector.get_model_vars_dataframe())
+    assert not unprofiled.profiler.total_time and not unprofiled.profiler.step_records
+
+    summary = profiled.profiler.summary()
+    assert {'flood_events', 'collect', 'schedule', 'Government.step'} <= set(summary.index)
+    assert summary.loc['collect', 'calls'] == 6
+    table = profiled.profiler.table()
+    assert list(table.index) == list(range(6))
+
+    path = tmp_path / 'profile.folded'
+    profiled.profiler.export_folded(path)
+    lines = path.read_text().splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert any(line.startswith('step;schedule;Government.step') for line in lines)
+
+
+def test_disabled_timer():
+    timer = PhaseTimer()
+    original_step = Households.step
+    with timer.phase('households'):
+        pass
+    timer.instrument(Households, ['step'])
+    assert Households.step is original_step
+    assert not timer.total_time and timer.table().empty
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+The map rendering and frame export.
+"""
+import os
+
+import matplotlib
+import numpy as np
+import pytest
+from matplotlib.colors import to_rgba
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+from model import AdaptationModel
+from rendering import MapRenderer, write_frames, adapted_color, not_adapted_color
+
+
+@pytest.mark.parametrize('engine', ['agents', 'arrays'])
+def test_households_coloured_by_adaptation_state(engine):
+    model = AdaptationModel(seed=13, number_of_households=60, engine=engine)
+    for _ in range(8):
+        model.step()
+    renderer = MapRenderer(model, label_threshold=100)
+    try:
+        expected = [to_rgba(adapted_color if adapted else not_adapted_color)
+                    for adapted in renderer.adaptation_states()]
+        np.testing.assert_allclose(renderer.households.get_facecolors(), expected)
+        assert renderer.adaptation_states().any()
+        # a label for every household and the government
+        assert len(renderer.ax.texts) == 60 + 1
+        assert renderer.ax.get_title() == 'Model Domain with Agents at Step 8'
+    finally:
+        plt.close(renderer.fig)
+
+
+def test_write_frames(tmp_path):
+    model = AdaptationModel(seed=13, number_of_households=150)
+    paths = write_frames(model, str(tmp_path / 'frames'), steps=2, label_threshold=100)
+    assert [os.path.basename(path) for path in paths] == [f'Model domain step {step}.png' for step in range(3)]
+    assert all(os.path.getsize(path) > 0 for path in paths)
+
+    paths = write_frames(model, str(tmp_path / 'run.gif'), steps=2)
+    assert os.path.getsize(paths[0]) > 0
+    assert model.schedule.steps == 4
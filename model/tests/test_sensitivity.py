@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+The designs and analyses of the global sensitivity analysis.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from sensitivity import (_scale, make_design, make_saltelli_design, make_morris_design, regression_coefficients,
+                         sobol_indices, run_design)
+
+
+def test_scale_integer_range():
+    # every integer of the range gets an equal share of [0, 1], including the upper bound
+    unit_points = np.linspace(0, 1, 1001)[:, None]
+    values = _scale(unit_points, {'fine': (0, 4)})['fine']
+    assert values.dtype.kind == 'i'
+    counts = values.value_counts().sort_index()
+    assert list(counts.index) == [0, 1, 2, 3, 4]
+    assert counts.max() - counts.min() <= 1
+    np.testing.assert_allclose(_scale(np.array([[0.0], [1.0]]), {'discount_rate': (0.9, 1.0)})['discount_rate'],
+                               [0.9, 1.0])
+
+
+def test_designs():
+    parameter_ranges = {'fine': (0, 5000), 'discount_rate': (0.9, 0.995)}
+    design = make_design(parameter_ranges, 20, seed=1)
+    assert len(design) == 20
+    assert design['fine'].between(0, 5000).all() and design['discount_rate'].between(0.9, 0.995).all()
+    assert len(make_saltelli_design(parameter_ranges, 8)) == 8 * (len(parameter_ranges) + 2)
+    morris = make_morris_design(parameter_ranges, 3)
+    assert len(morris) == 3 * (len(parameter_ranges) + 1)
+    with pytest.raises(ValueError):
+        make_design(parameter_ranges, 20, method='grid')
+
+
+def test_regression_coefficients():
+    rng = np.random.default_rng(0)
+    results = pd.DataFrame({'a': rng.random(200), 'b': rng.random(200), 'constant': np.full(200, 3.0)})
+    results['output'] = 2 * results['a'] - results['b'] + 0.01 * rng.random(200)
+    with pytest.warns(UserWarning, match='constant'):
+        coefficients = regression_coefficients(results, ['a', 'b', 'constant'], outputs=['output'])
+    assert coefficients.loc['a', 'output'] > 0 > coefficients.loc['b', 'output']
+    assert np.isnan(coefficients.loc['constant', 'output'])
+
+
+def test_sobol_indices_of_additive_function():
+    parameter_ranges = {'a': (0.0, 1.0), 'b': (0.0, 1.0)}
+    results = make_saltelli_design(parameter_ranges, 1024)
+    results['output'] = 4 * results['a'] + results['b']
+    indices = sobol_indices(results, list(parameter_ranges), outputs=['output'])
+    np.testing.assert_allclose(indices['output_S1'], [16 / 17, 1 / 17], atol=0.05)
+    np.testing.assert_allclose(indices['output_ST'], [16 / 17, 1 / 17], atol=0.05)
+
+
+def test_run_design():
+    design = make_design({'fine': (0, 5000)}, 2, seed=0)
+    results = run_design(design, ['fine'], fixed_parameters={'number_of_households': 50}, max_steps=6,
+                         processes=1, min_replications=2, max_replications=3)
+    assert len(results) == 2
+    assert results['replications'].between(2, 3).all()
+    assert {'total_adapted_households', 'total_flood_damage_half_width'} <= set(results.columns)
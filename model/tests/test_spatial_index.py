@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+The spatial index of the household locations against a check of every household.
+"""
+import numpy as np
+from rasterio.transform import rowcol
+from shapely import contains_xy, distance, points
+from shapely.geometry import LineString
+
+from model import AdaptationModel
+from flood_maps import get_flood_map
+from functions import geodata
+
+
+def test_queries_match_check_of_every_household():
+    model = AdaptationModel(seed=12, number_of_households=500)
+    index = model.spatial_index
+    x, y = model.household_x, model.household_y
+
+    floodplain = geodata.floodplain_multipolygon
+    in_floodplain = index.within_polygon(floodplain)
+    np.testing.assert_array_equal(in_floodplain, np.flatnonzero(contains_xy(floodplain, x, y)))
+    assert 0 < len(in_floodplain) < 500
+
+    minx, miny, maxx, maxy = geodata.map_bounds
+    levee = LineString([(minx, miny), (maxx, maxy)])
+    near_levee = index.within_distance(levee, 1000)
+    np.testing.assert_array_equal(near_levee, np.flatnonzero(distance(levee, points(x, y)) <= 1000))
+    assert 0 < len(near_levee) < 500
+
+    # the households that read their flood depth from a window of the flood map
+    transform = get_flood_map('harvey').transform
+    rows, cols = rowcol(transform, x, y)
+    rows, cols = np.asarray(rows) - 1, np.asarray(cols) - 1
+    row_off, col_off, height, width = rows.min() + 100, cols.min() + 50, 200, 300
+    expected = np.flatnonzero((rows >= row_off) & (rows < row_off + height) &
+                              (cols >= col_off) & (cols < col_off + width))
+    np.testing.assert_array_equal(index.within_raster_window(transform, row_off, col_off, height, width), expected)
+    assert len(expected) > 0
+
+    mask = index.mask(near_levee)
+    assert mask.sum() == len(near_levee) and mask[near_levee].all()